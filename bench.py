@@ -0,0 +1,673 @@
+# Benchmark of the getter -> inserter pipeline. The getters are run against
+# the fake spotify client (fakes.py) replaying synthetic or recorded
+# fixtures with the given latency, the inserters against the database of the
+# SPOTILYSE_DSN environment variable (or --dsn). Every stage is timed for its
+# throughput, peak memory (traced by tracemalloc, so the times include the
+# tracing overhead unless --no-memory is given) and number of api calls. The
+# results are written as json, so the runs of different commits can be compared
+# (--baseline adds the ratio of every stage time to the one of the old run).
+# Without a database the inserters stages time the preparation of records only.
+# With --similarity the similarity index is benchmarked instead: build and add
+# time, queries per second of the exact and approximate search and the recall
+# of the approximate one. With --ids the binary id codec is benchmarked against
+# python strings: memory, encoding, dedup and join of the given number of ids.
+# With --idlists the binary id list files are compared with the yaml configs at
+# the given sizes: write and read time, file size and union of two lists. With
+# --unique the dedup of the api items (utils.unique_items) is timed at the
+# given sizes against the list scan it replaced (up to 20000 items). With
+# --inserters the 'rows' and 'copy' inserters are compared in rows per second
+# on the given number of synthetic tracks (temporary tables of --dsn). With
+# --formats the output formats (csv, gzipped csv, parquet and feather) are
+# compared by write and read time and file size on the synthetic tracks. With
+# --frames the peak memory (tracemalloc) of the tracks dataframe construction
+# is compared with the merge of two default-typed frames it replaced.
+#
+# Usage: python bench.py --albums 500 --latency 0.05 --output bench.json
+#        python bench.py --similarity 1000000
+#        python bench.py --ids 5000000
+#        python bench.py --idlists 10000 100000 1000000
+#        python bench.py --unique 10000 100000 1000000
+#        python bench.py --inserters 50000 --dsn postgresql://localhost/spotilyse
+#        python bench.py --formats 100000
+#        python bench.py --frames 100000
+
+
+import argparse
+import json
+import random
+import numpy as np
+import pandas as pd
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import psycopg2
+from datetime import datetime
+from fakes import FakeSpotify
+from fakes import synthetic_features
+from fakes import synthetic_fixtures
+from tools.database import get_pool
+from tools.database import transaction
+from tools.getters import build_artists_df
+from tools.getters import build_tracks_df
+from tools.getters import get_albums_tracks
+from tools.getters import get_artists_info
+from tools.getters import get_releases
+from tools.getters import get_tracks_info
+from tools.ids import ID_DTYPE
+from tools.ids import IdArray
+from tools.ids import decode
+from tools.idlists import read_ids
+from tools.idlists import union
+from tools.idlists import write_ids
+from tools.inserters import ARTIST_CHECKS
+from tools.inserters import ARTIST_COLUMNS
+from tools.inserters import ARTIST_DTYPES
+from tools.inserters import ARTIST_NAMES
+from tools.inserters import TRACK_CHECKS
+from tools.inserters import TRACK_COLUMNS
+from tools.inserters import TRACK_DECIMALS
+from tools.inserters import TRACK_DTYPES
+from tools.inserters import insert_artist
+from tools.inserters import insert_track
+from tools.inserters import prepare_records
+from tools.similarity import SIMILARITY_COLUMNS
+from tools.similarity import SimilarityIndex
+from tools.utils import read_yaml
+from tools.utils import unique_items
+from tools.utils import write_yaml
+from tools.writers import TRACK_SCHEMA
+from tools.writers import read_df
+from tools.writers import write_df
+
+
+def run_stage(
+        results,
+        name,
+        spotify,
+        function,
+        memory = True
+        ):
+    """
+    A function used to run a single stage of the pipeline and record its
+    elapsed seconds, number of items per second, peak memory and api calls.
+
+    Parameters
+    ----------
+    results : dict
+        mapping from the stage name to its measurements, the stage is added
+    name : str
+        name of the stage
+    spotify : fakes.FakeSpotify() instance
+        fake client, whose calls are counted
+    function : callable
+        function without arguments which runs the stage
+    memory : bool
+        trace the peak memory of the stage (default True)
+
+    Returns
+    -------
+    output of the function
+
+    """
+
+    calls = spotify.total_calls()
+    if memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    output = function()
+    seconds = time.perf_counter() - start
+    peak = None
+    if memory:
+        peak = tracemalloc.get_traced_memory()[1] / 2 ** 20
+        tracemalloc.stop()
+
+    items = len(output)
+    results[name] = {'seconds': seconds,
+                     'items': items,
+                     'items_per_sec': items / seconds if seconds else None,
+                     'peak_mb': peak,
+                     'api_calls': spotify.total_calls() - calls}
+    return output
+
+
+def run_bench(
+        spotify,
+        pool = None,
+        method = 'copy',
+        memory = True
+        ):
+    """
+    A function used to run all the stages of the pipeline.
+
+    Parameters
+    ----------
+    spotify : fakes.FakeSpotify() instance
+        fake client replaying the fixtures
+    pool : psycopg2.pool.ThreadedConnectionPool
+        pool of the database connections (default None - only records are
+        prepared by the inserters stages)
+    method : str
+        insertion method of the inserters (default 'copy')
+    memory : bool
+        trace the peak memory of the stages (default True)
+
+    Returns
+    -------
+    dict
+        mapping from the stage name to its measurements
+
+    """
+
+    results = {}
+    path = tempfile.mkdtemp() + '/'
+
+    albums = run_stage(results, 'get_releases', spotify,
+                       lambda: get_releases(spotify, country = 'US', path = path),
+                       memory)
+    tracks = run_stage(results, 'get_albums_tracks', spotify,
+                       lambda: get_albums_tracks(spotify, country = 'US',
+                                                 albums_ids = albums, path = path),
+                       memory)
+    df = run_stage(results, 'get_tracks_info', spotify,
+                   lambda: get_tracks_info(spotify, country = 'US',
+                                           tracks_ids = tracks, path = path),
+                   memory)
+    df_a = run_stage(results, 'get_artists_info', spotify,
+                     lambda: get_artists_info(spotify, country = 'US',
+                                              artists_ids = df['artist_id'].tolist(),
+                                              path = path),
+                     memory)
+
+    if pool is None:
+        # prepare the records as the inserters do
+        run_stage(results, 'insert_artist', spotify,
+                  lambda: prepare_records(
+                      df_a.rename_axis('id').reset_index().rename(columns = ARTIST_NAMES),
+                      ARTIST_COLUMNS, ARTIST_CHECKS, dtypes = ARTIST_DTYPES)[0],
+                  memory)
+        run_stage(results, 'insert_track', spotify,
+                  lambda: prepare_records(df.reset_index(), TRACK_COLUMNS, TRACK_CHECKS,
+                                          TRACK_DECIMALS, TRACK_DTYPES)[0],
+                  memory)
+    else:
+        def insert(inserter, frame):
+            with transaction(pool) as connection:
+                inserter(frame, method = method, connection = connection)
+            return frame
+
+        run_stage(results, 'insert_artist', spotify, lambda: insert(insert_artist, df_a),
+                  memory)
+        run_stage(results, 'insert_track', spotify, lambda: insert(insert_track, df), memory)
+
+    # remove the files exported by the getters
+    shutil.rmtree(path)
+
+    return results
+
+
+def run_similarity_bench(
+        n_tracks,
+        queries = 1000,
+        k = 10,
+        added = 10000
+        ):
+    """
+    A function used to benchmark the similarity index of n_tracks synthetic
+    tracks (the last added of them are added to the built index).
+
+    Returns
+    -------
+    dict
+        mapping from the stage name to its measurements
+
+    """
+
+    df = synthetic_features(n_tracks, SIMILARITY_COLUMNS)
+    results = {}
+
+    start = time.perf_counter()
+    index = SimilarityIndex.from_df(df.iloc[:n_tracks - added])
+    results['build'] = {'seconds': time.perf_counter() - start,
+                        'lists': len(index.centroids)}
+
+    start = time.perf_counter()
+    index.add(df.iloc[n_tracks - added:])
+    results['add'] = {'seconds': time.perf_counter() - start, 'items': added}
+
+    rows = np.random.default_rng(1).choice(n_tracks, queries, replace = False)
+    neighbours = {}
+    for name, exact in [('search_exact', True), ('search_ivf', False)]:
+        start = time.perf_counter()
+        neighbours[name], _ = index.search(index.vectors[rows], k, exact, exclude = rows)
+        seconds = time.perf_counter() - start
+        results[name] = {'seconds': seconds, 'queries_per_sec': queries / seconds}
+
+    results['search_ivf']['recall'] = np.mean([len(set(a) & set(b)) / k for a, b in
+                                               zip(neighbours['search_ivf'],
+                                                   neighbours['search_exact'])])
+
+    path = tempfile.mkdtemp()
+    start = time.perf_counter()
+    index.save(path)
+    results['save'] = {'seconds': time.perf_counter() - start}
+    start = time.perf_counter()
+    SimilarityIndex.load(path).search(index.vectors[rows[:1]], k)
+    results['load'] = {'seconds': time.perf_counter() - start}
+    shutil.rmtree(path)
+
+    return results
+
+
+def run_ids_bench(n_ids):
+    """
+    A function used to compare the binary ids (tools/ids.py) with the python
+    strings on n_ids random ids: memory, dedup of the ids with a half of them
+    repeated and the join of the ids with a half of them.
+
+    Returns
+    -------
+    dict
+        mapping from the stage name to its measurements
+
+    """
+
+    halves = np.random.default_rng(0).integers(0, 2 ** 63, (n_ids, 2), dtype = np.int64)
+    ids = decode(halves.astype('>u8').view(ID_DTYPE).ravel()).tolist()
+    duplicated = ids + ids[:n_ids // 2]
+    random.Random(0).shuffle(duplicated)
+    results = {}
+
+    start = time.perf_counter()
+    array = IdArray.from_ids(ids)
+    results['encode'] = {'seconds': time.perf_counter() - start}
+    start = time.perf_counter()
+    array.to_ids()
+    results['decode'] = {'seconds': time.perf_counter() - start}
+    results['memory'] = {'str_mb': (sys.getsizeof(ids) + sum(map(sys.getsizeof, ids))) / 2 ** 20,
+                         'binary_mb': array.nbytes / 2 ** 20}
+
+    start = time.perf_counter()
+    list(dict.fromkeys(duplicated))
+    str_seconds = time.perf_counter() - start
+    duplicated = IdArray.from_ids(duplicated)
+    start = time.perf_counter()
+    duplicated.unique()
+    results['dedup'] = {'str_seconds': str_seconds, 'binary_seconds': time.perf_counter() - start}
+
+    right = ids[::2]
+    start = time.perf_counter()
+    pd.Index(right).get_indexer(ids)
+    str_seconds = time.perf_counter() - start
+    right = IdArray.from_ids(right)
+    start = time.perf_counter()
+    array.join(right)
+    results['join'] = {'str_seconds': str_seconds, 'binary_seconds': time.perf_counter() - start}
+
+    return results
+
+
+def run_idlists_bench(sizes):
+    """
+    A function used to compare the binary id list files (tools/idlists.py)
+    with the yaml configs (utils.write_yaml and read_yaml) for every number of
+    ids of the sizes.
+
+    Returns
+    -------
+    dict
+        mapping from the number of ids to its measurements
+
+    """
+
+    results = {}
+    path = tempfile.mkdtemp() + '/'
+    rnd = np.random.default_rng(0)
+
+    for size in sizes:
+        halves = rnd.integers(0, 2 ** 63, (size, 2), dtype = np.int64)
+        ids = decode(halves.astype('>u8').view(ID_DTYPE).ravel()).tolist()
+        result = results[size] = {}
+
+        start = time.perf_counter()
+        write_yaml(pd.DataFrame({'id': ids}), 'id', 'ids', path)
+        result['yaml_write_seconds'] = time.perf_counter() - start
+        start = time.perf_counter()
+        read_yaml(path + 'ids.yaml')
+        result['yaml_read_seconds'] = time.perf_counter() - start
+        result['yaml_mb'] = os.path.getsize(path + 'ids.yaml') / 2 ** 20
+
+        start = time.perf_counter()
+        write_ids(path + 'ids.bin', ids)
+        result['binary_write_seconds'] = time.perf_counter() - start
+        start = time.perf_counter()
+        read_ids(path + 'ids.bin')
+        result['binary_read_seconds'] = time.perf_counter() - start
+        result['binary_mb'] = os.path.getsize(path + 'ids.bin') / 2 ** 20
+
+        # union with a list sharing a half of the ids
+        write_ids(path + 'other.bin', ids[size // 2:] + ids[:size // 2:2])
+        start = time.perf_counter()
+        union([path + 'ids.bin', path + 'other.bin'], path + 'union.bin')
+        result['binary_union_seconds'] = time.perf_counter() - start
+
+    shutil.rmtree(path)
+
+    return results
+
+
+def run_inserters_bench(
+        dsn,
+        n_tracks
+        ):
+    """
+    A function used to compare the insertion methods of the inserters ('rows'
+    and 'copy') on n_tracks synthetic tracks and their artists: the load into
+    empty tables and the upsert of all the rows with changed popularity. The
+    tables are temporary copies of artist and track (they shadow the real
+    ones in the connection), so the database is not changed.
+
+    Returns
+    -------
+    dict
+        mapping from the stage name to its measurements
+
+    """
+
+    fixtures = synthetic_fixtures(max(1, n_tracks // 10), 10, max(1, n_tracks // 20))
+    df = build_tracks_df(list(fixtures['tracks'].values()),
+                         list(fixtures['audio_features'].values()))
+    df_a = build_artists_df(list(fixtures['artists'].values()))
+    changed = df.assign(popularity = (df['popularity'] + 1) % 100)
+    changed_a = df_a.assign(artist_popularity = (df_a['artist_popularity'] + 1) % 100)
+
+    results = {}
+    connection = psycopg2.connect(dsn)
+    try:
+        cursor = connection.cursor()
+        for table in ['artist', 'track']:
+            cursor.execute('CREATE TEMP TABLE {0} (LIKE {0} INCLUDING ALL)'.format(table))
+        for method in ['rows', 'copy']:
+            cursor.execute('TRUNCATE track, artist')
+            connection.commit()
+            for stage, frames in [('insert', (df_a, df)), ('update', (changed_a, changed))]:
+                start = time.perf_counter()
+                insert_artist(frames[0], method = method, connection = connection)
+                insert_track(frames[1], method = method, connection = connection)
+                connection.commit()
+                seconds = time.perf_counter() - start
+                rows = len(frames[0]) + len(frames[1])
+                results['{}_{}'.format(method, stage)] = {'seconds': seconds,
+                                                          'rows': rows,
+                                                          'rows_per_sec': rows / seconds}
+        cursor.close()
+    finally:
+        # the temporary tables are dropped with the session
+        connection.close()
+
+    for stage in ['insert', 'update']:
+        results['copy_' + stage]['speedup'] = results['rows_' + stage]['seconds'] / \
+                                              results['copy_' + stage]['seconds']
+
+    return results
+
+
+def run_formats_bench(n_tracks):
+    """
+    A function used to compare the output formats of tools/writers.py (csv,
+    gzipped csv, parquet and feather) on n_tracks synthetic tracks: time of
+    the write and of the read back and the size of the file.
+
+    Returns
+    -------
+    dict
+        mapping from the format to its measurements
+
+    """
+
+    fixtures = synthetic_fixtures(max(1, n_tracks // 10), 10, max(1, n_tracks // 20))
+    df = build_tracks_df(list(fixtures['tracks'].values()),
+                         list(fixtures['audio_features'].values()))
+
+    results = {}
+    path = tempfile.mkdtemp() + '/'
+    for name, fmt, compression in [('csv', 'csv', None), ('csv_gzip', 'csv', 'gzip'),
+                                   ('parquet', 'parquet', None),
+                                   ('feather', 'feather', None)]:
+        start = time.perf_counter()
+        full_name, = write_df(df, path, name, fmt, TRACK_SCHEMA, compression)
+        write_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        read_df(full_name, 'id')
+        results[name] = {'write_seconds': write_seconds,
+                         'read_seconds': time.perf_counter() - start,
+                         'mb': os.path.getsize(full_name) / 2 ** 20}
+    shutil.rmtree(path)
+
+    return results
+
+
+def run_frames_bench(n_tracks):
+    """
+    A function used to compare the memory of getters.build_tracks_df with the
+    construction it replaced (lists of strings, two dataframes of the default
+    dtypes and pd.merge) on n_tracks synthetic tracks: peak of the memory
+    traced during the construction and the size of the resulting frame.
+
+    Returns
+    -------
+    dict
+        mapping from the construction to its measurements
+
+    """
+
+    def legacy(tracks_lst, features_lst):
+        track_dict = {key : [] for key in ['id', 'name', 'artist_id', 'artist_name',
+                                           'popularity', 'release_date', 'update']}
+        df_f = pd.DataFrame(features_lst, columns = ['id', 'danceability', 'energy',
+                                                     'key', 'loudness', 'mode',
+                                                     'speechiness', 'acousticness',
+                                                     'instrumentalness', 'liveness',
+                                                     'valence', 'tempo', 'duration_ms',
+                                                     'time_signature'])
+        df_f = df_f.set_index('id')
+        for t in tracks_lst:
+            track_dict['id'].append(t['id'])
+            track_dict['name'].append(t['name'])
+            track_dict['artist_id'].append(t['artists'][0]['id'])
+            track_dict['artist_name'].append(t['artists'][0]['name'])
+            track_dict['popularity'].append(t['popularity'])
+            track_dict['release_date'].append(t['album']['release_date'])
+            track_dict['update'].append(datetime.today().strftime('%Y-%m-%d'))
+        df_t = pd.DataFrame(track_dict).set_index('id')
+        return pd.merge(df_t, df_f, left_index = True, right_index = True)
+
+    fixtures = synthetic_fixtures(max(1, n_tracks // 10), 10, max(1, n_tracks // 20))
+    tracks_lst = list(fixtures['tracks'].values())
+    features_lst = list(fixtures['audio_features'].values())
+
+    results = {}
+    for name, build in [('legacy', legacy), ('compact', build_tracks_df)]:
+        tracemalloc.start()
+        start = time.perf_counter()
+        df = build(tracks_lst, features_lst)
+        seconds = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        results[name] = {'seconds': seconds,
+                         'rows': len(df),
+                         'peak_mb': peak / 2 ** 20,
+                         'frame_mb': df.memory_usage(deep = True).sum() / 2 ** 20}
+        del df
+    results['compact']['peak_reduction'] = 1 - results['compact']['peak_mb'] / \
+                                               results['legacy']['peak_mb']
+
+    return results
+
+
+def run_unique_bench(
+        sizes,
+        scan_limit = 20000
+        ):
+    """
+    A function used to compare utils.unique_items with the list scan dedup the
+    getters used before it (if x['id'] not in track_dict['id']) on the api
+    items of every number of the sizes, a half of them repeated. The list scan
+    is quadratic, so it is timed up to scan_limit items only.
+
+    Returns
+    -------
+    dict
+        mapping from the number of items to its measurements
+
+    """
+
+    def scan(items):
+        ids, unique = [], []
+        for item in items:
+            if item is not None and item['id'] not in ids:
+                ids.append(item['id'])
+                unique.append(item)
+        return unique
+
+    results = {}
+    rnd = np.random.default_rng(0)
+    for size in sizes:
+        keys = rnd.integers(0, max(1, size // 2), size)
+        items = [{'id': '{:022d}'.format(key), 'name': 'track'} for key in keys.tolist()]
+
+        start = time.perf_counter()
+        unique = unique_items(items)
+        seconds = time.perf_counter() - start
+        results[size] = {'seconds': seconds,
+                         'items_per_sec': size / seconds if seconds else None,
+                         'unique': len(unique),
+                         'scan_seconds': None}
+        if size <= scan_limit:
+            start = time.perf_counter()
+            scanned = scan(items)
+            results[size]['scan_seconds'] = time.perf_counter() - start
+            assert scanned == unique
+
+    return results
+
+
+def git_commit():
+    # commit of the benchmarked tree (None outside of the repository)
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'],
+                                       cwd = os.path.dirname(os.path.abspath(__file__)),
+                                       stderr = subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Benchmark of the spotilyse pipeline')
+    parser.add_argument('--albums', type = int, default = 200,
+                        help = 'number of synthetic albums')
+    parser.add_argument('--tracks-per-album', type = int, default = 12,
+                        help = 'number of tracks of every synthetic album')
+    parser.add_argument('--artists', type = int, default = 500,
+                        help = 'number of synthetic artists')
+    parser.add_argument('--fixtures', help = 'json file recorded by fakes.record_fixtures '
+                                             '(replaces the synthetic fixtures)')
+    parser.add_argument('--latency', type = float, default = 0.05,
+                        help = 'seconds of every api request')
+    parser.add_argument('--dsn', default = os.environ.get('SPOTILYSE_DSN'),
+                        help = 'database connection string (default SPOTILYSE_DSN)')
+    parser.add_argument('--method', default = 'copy', help = "'rows' or 'copy'")
+    parser.add_argument('--no-memory', action = 'store_true',
+                        help = 'do not trace the peak memory')
+    parser.add_argument('--similarity', type = int,
+                        help = 'benchmark the similarity index of the number of tracks')
+    parser.add_argument('--ids', type = int,
+                        help = 'benchmark the binary codec of the number of ids')
+    parser.add_argument('--idlists', type = int, nargs = '+',
+                        help = 'benchmark the id list files against yaml at the sizes')
+    parser.add_argument('--inserters', type = int,
+                        help = "compare 'rows' and 'copy' inserters on the number of "
+                               'tracks (needs --dsn)')
+    parser.add_argument('--formats', type = int,
+                        help = 'compare the output formats on the number of tracks')
+    parser.add_argument('--frames', type = int,
+                        help = 'compare the memory of the tracks dataframe construction '
+                               'on the number of tracks')
+    parser.add_argument('--unique', type = int, nargs = '+',
+                        help = 'benchmark the dedup of the api items at the sizes')
+    parser.add_argument('--baseline', help = 'json output of the previous run')
+    parser.add_argument('--output', help = 'output json file (default stdout)')
+    args = parser.parse_args()
+
+    if args.similarity:
+        report = {'commit': git_commit(),
+                  'python': platform.python_version(),
+                  'params': vars(args),
+                  'stages': run_similarity_bench(args.similarity)}
+    elif args.ids:
+        report = {'commit': git_commit(),
+                  'python': platform.python_version(),
+                  'params': vars(args),
+                  'stages': run_ids_bench(args.ids)}
+    elif args.idlists:
+        report = {'commit': git_commit(),
+                  'python': platform.python_version(),
+                  'params': vars(args),
+                  'stages': run_idlists_bench(args.idlists)}
+    elif args.inserters:
+        if args.dsn is None:
+            parser.error('--inserters needs --dsn or SPOTILYSE_DSN')
+        report = {'commit': git_commit(),
+                  'python': platform.python_version(),
+                  'params': vars(args),
+                  'stages': run_inserters_bench(args.dsn, args.inserters)}
+    elif args.formats:
+        report = {'commit': git_commit(),
+                  'python': platform.python_version(),
+                  'params': vars(args),
+                  'stages': run_formats_bench(args.formats)}
+    elif args.frames:
+        report = {'commit': git_commit(),
+                  'python': platform.python_version(),
+                  'params': vars(args),
+                  'stages': run_frames_bench(args.frames)}
+    elif args.unique:
+        report = {'commit': git_commit(),
+                  'python': platform.python_version(),
+                  'params': vars(args),
+                  'stages': run_unique_bench(args.unique)}
+    else:
+        if args.fixtures:
+            spotify = FakeSpotify.from_file(args.fixtures, args.latency)
+        else:
+            spotify = FakeSpotify(synthetic_fixtures(args.albums, args.tracks_per_album,
+                                                     args.artists),
+                                  args.latency)
+        pool = get_pool(args.dsn) if args.dsn is not None else None
+        report = {'commit': git_commit(),
+                  'python': platform.python_version(),
+                  'params': vars(args),
+                  'database': pool is not None,
+                  'stages': run_bench(spotify, pool, args.method, not args.no_memory),
+                  'api_calls': spotify.calls}
+
+    # compare the stages with the previous run
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['stages']
+        for name, stage in report['stages'].items():
+            # json keys are str (e.g. the sizes of --idlists) and not every
+            # stage is timed
+            seconds = baseline.get(str(name), {}).get('seconds')
+            if seconds and 'seconds' in stage:
+                stage['change'] = stage['seconds'] / seconds
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent = 2)
+    else:
+        json.dump(report, sys.stdout, indent = 2)
@@ -0,0 +1,270 @@
+# Current module provides a fake spotify client for benchmarks and offline
+# runs. It replays fixtures - albums with their tracks, track objects, audio
+# features and artists - which are either generated synthetically at the given
+# size or recorded from the real api into a json file. Every request sleeps for
+# the configured latency and is counted by the endpoint (with the peak number
+# of concurrent requests), so the stages can be
+# timed and their api calls compared without credentials or network. The
+# module is a test double for bench.py and the tests, so it is kept out of the
+# tools package.
+
+
+import json
+import random
+import threading
+import time
+import numpy as np
+import pandas as pd
+from urllib.parse import urlparse, parse_qs
+from tools.fetchers import fetch_all
+from tools.fetchers import fetch_bulk
+from tools.fetchers import fetch_pages
+from tools.ids import decode_id
+from tools.utils import unique_items
+
+# prefix of the urls of the 'next' pages
+PREFIX = 'https://api.spotify.com/v1/'
+
+
+def synthetic_fixtures(
+        n_albums = 100,
+        tracks_per_album = 12,
+        n_artists = 300,
+        seed = 0
+        ):
+    """
+    A function used to generate synthetic fixtures of the given size.
+
+    Parameters
+    ----------
+    n_albums : int
+        number of new releases albums (default 100)
+    tracks_per_album : int
+        number of tracks of every album (default 12)
+    n_artists : int
+        number of artists the tracks belong to (default 300)
+    seed : int
+        seed of the random generator (default 0)
+
+    Returns
+    -------
+    dict
+        fixtures with 'releases', 'albums', 'tracks', 'audio_features' and
+        'artists' fields (see FakeSpotify)
+
+    """
+
+    rnd = random.Random(seed)
+
+    def new_id():
+        # ids are base62 of random 128-bit values as the real ones
+        return decode_id(rnd.getrandbits(128).to_bytes(16, 'big'))
+
+    artists = {}
+    for i in range(n_artists):
+        id_ = new_id()
+        artists[id_] = {'id': id_,
+                        'name': 'artist %d' % i,
+                        'popularity': rnd.randint(0, 100),
+                        'followers': {'total': rnd.randint(0, 10 ** 7)},
+                        'genres': rnd.choice([[], ['pop'], ['rock', 'indie'], ['hip hop']])}
+    artists_ids = list(artists)
+
+    fixtures = {'releases': [], 'albums': {}, 'tracks': {},
+                'audio_features': {}, 'artists': artists}
+    for i in range(n_albums):
+        album_id = new_id()
+        release_date = rnd.choice(['2021', '2021-05', '2021-05-%02d' % rnd.randint(1, 28)])
+        artist = artists[rnd.choice(artists_ids)]
+        fixtures['releases'].append({'id': album_id,
+                                     'name': 'album %d' % i,
+                                     'release_date': release_date})
+        fixtures['albums'][album_id] = []
+        for j in range(tracks_per_album):
+            id_ = new_id()
+            simple = {'id': id_,
+                      'name': 'track %d-%d' % (i, j),
+                      'artists': [{'id': artist['id'], 'name': artist['name']}]}
+            fixtures['albums'][album_id].append(simple)
+            fixtures['tracks'][id_] = dict(simple,
+                                           popularity = rnd.randint(0, 100),
+                                           album = {'id': album_id,
+                                                    'release_date': release_date})
+            fixtures['audio_features'][id_] = {
+                'id': id_,
+                'danceability': round(rnd.random(), 3),
+                'energy': round(rnd.random(), 3),
+                'key': rnd.randint(-1, 11),
+                'loudness': round(rnd.uniform(-60, 0), 3),
+                'mode': rnd.randint(0, 1),
+                'speechiness': round(rnd.random(), 3),
+                'acousticness': round(rnd.random(), 3),
+                'instrumentalness': round(rnd.random(), 7),
+                'liveness': round(rnd.random(), 3),
+                'valence': round(rnd.random(), 3),
+                'tempo': round(rnd.uniform(50, 200), 3),
+                'duration_ms': rnd.randint(30000, 600000),
+                'time_signature': rnd.randint(3, 7)}
+
+    return fixtures
+
+
+def synthetic_features(
+        n_tracks,
+        columns,
+        n_clusters = 200,
+        seed = 0
+        ):
+    """
+    A function used to generate a large tracks dataframe with the feature
+    columns only (e.g. for the similarity index benchmark). Features are drawn
+    from a mixture of gaussians, as the real tracks form genres.
+
+    Returns
+    -------
+    pandas.DataFrame
+        float32 dataframe of n_tracks rows indexed by synthetic ids
+    """
+
+    rnd = np.random.default_rng(seed)
+    centers = rnd.normal(size = (n_clusters, len(columns)))
+    labels = rnd.integers(0, n_clusters, n_tracks)
+    values = centers[labels] + rnd.normal(scale = 0.6, size = (n_tracks, len(columns)))
+    ids = pd.Index(['{:022d}'.format(i) for i in range(n_tracks)], name = 'id')
+
+    return pd.DataFrame(values.astype(np.float32), index = ids, columns = columns)
+
+
+def record_fixtures(
+        spotify,
+        file_name,
+        country = None
+        ):
+    """
+    A function used to record the fixtures of the new releases of the country
+    from the real api into the json file.
+
+    Parameters
+    ----------
+    spotify : spotify.client.Spotify() instance
+        Spotify API client with valid credentials
+    file_name : str
+        full name of the json file
+    country : str
+        ISO 3166-1 alpha-2 country code (default None)
+    """
+
+    releases = fetch_pages(spotify, spotify.new_releases(country = country, limit = 50), 'albums')
+    albums_ids = [album['id'] for album in unique_items(releases)]
+    albums = fetch_all(spotify, lambda id_: spotify.album_tracks(id_, limit = 50), albums_ids)
+    # empty items and local tracks (without id) are skipped as in the getters
+    tracks_ids = [track['id'] for track in unique_items(track for items in albums
+                                                        for track in items)
+                  if track['id'] is not None]
+    results, _ = fetch_bulk(spotify, {'tracks': tracks_ids, 'audio_features': tracks_ids})
+    artists_ids = list(dict.fromkeys(track['artists'][0]['id']
+                                     for track in unique_items(results['tracks'])
+                                     if track['artists'] and track['artists'][0]['id']))
+    artists, _ = fetch_bulk(spotify, {'artists': artists_ids})
+
+    fixtures = {'releases': releases,
+                'albums': dict(zip(albums_ids, albums)),
+                'tracks': dict(zip(tracks_ids, results['tracks'])),
+                'audio_features': dict(zip(tracks_ids, results['audio_features'])),
+                'artists': dict(zip(artists_ids, artists['artists']))}
+    with open(file_name, 'w') as f:
+        json.dump(fixtures, f)
+
+
+class FakeSpotify:
+    """
+    A fake spotify client which replays the fixtures. It implements the
+    endpoints used by the releases getters (new_releases, album_tracks, tracks,
+    audio_features, artists and next).
+
+    Parameters
+    ----------
+    fixtures : dict
+        fixtures generated by synthetic_fixtures or recorded by record_fixtures
+    latency : float
+        seconds every request sleeps for (default 0.05)
+    prefix : str
+        prefix of the urls of the 'next' pages, e.g. url of a stub server
+        serving the client (default PREFIX)
+    """
+
+    def __init__(self, fixtures, latency = 0.05, prefix = PREFIX):
+        self.fixtures = fixtures
+        self.latency = latency
+        self.prefix = prefix
+        self.calls = {} # number of requests by the endpoint
+        self.in_flight = 0 # number of requests being served
+        self.max_in_flight = 0 # peak number of concurrent requests
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_file(cls, file_name, latency = 0.05):
+        """
+        A method used to create the client replaying the recorded json file.
+        """
+        with open(file_name) as f:
+            return cls(json.load(f), latency)
+
+    def total_calls(self):
+        """
+        A method used to get the number of requests to all the endpoints.
+        """
+        return sum(self.calls.values())
+
+    def _request(self, endpoint):
+        with self._lock:
+            self.calls[endpoint] = self.calls.get(endpoint, 0) + 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            time.sleep(self.latency)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def _page(self, url, items, limit, offset):
+        # paging object as the api returns it
+        if offset + limit < len(items):
+            next_ = '{}?offset={}&limit={}'.format(url, offset + limit, limit)
+        else:
+            next_ = None
+        return {'href': url, 'items': items[offset:offset + limit], 'limit': limit,
+                'next': next_, 'offset': offset, 'total': len(items)}
+
+    def new_releases(self, country = None, limit = 20, offset = 0):
+        self._request('new_releases')
+        return {'albums': self._page(self.prefix + 'browse/new-releases',
+                                     self.fixtures['releases'], limit, offset)}
+
+    def album_tracks(self, album_id, limit = 50, offset = 0, market = None):
+        self._request('album_tracks')
+        return self._page(self.prefix + 'albums/' + album_id + '/tracks',
+                          self.fixtures['albums'][album_id], limit, offset)
+
+    def next(self, result):
+        if not result['next']:
+            return None
+        url = urlparse(result['next'])
+        query = parse_qs(url.query)
+        limit, offset = int(query['limit'][0]), int(query['offset'][0])
+        parts = url.path.split('/')
+        if parts[-1] == 'new-releases':
+            return self.new_releases(limit = limit, offset = offset)
+        return self.album_tracks(parts[-2], limit = limit, offset = offset)
+
+    def tracks(self, tracks, market = None):
+        self._request('tracks')
+        return {'tracks': [self.fixtures['tracks'].get(id_) for id_ in tracks]}
+
+    def audio_features(self, tracks = []):
+        self._request('audio_features')
+        return [self.fixtures['audio_features'].get(id_) for id_ in tracks]
+
+    def artists(self, artists):
+        self._request('artists')
+        return {'artists': [self.fixtures['artists'].get(id_) for id_ in artists]}
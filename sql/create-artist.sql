@@ -1,12 +1,33 @@
---CREATE TABLE IF NOT EXISTS artist (
---	id VARCHAR (22) PRIMARY KEY,
---	name VARCHAR (50),
---	popularity SMALLINT CHECK (popularity >= 0 AND popularity <= 100),
---	genre VARCHAR (50),
---	followers INTEGER,
---  update TIMESTAMP
---);
+-- artist tables, the same as in create_all.sql
+
+CREATE TABLE IF NOT EXISTS artist (
+	id VARCHAR (22) PRIMARY KEY,
+	name VARCHAR (50),
+	popularity SMALLINT CHECK (popularity >= 0 AND popularity <= 100),
+	genre VARCHAR (50),
+	followers INTEGER,
+  update TIMESTAMP,
+  -- time of the last load of the row, changed or not (update is the time of
+  -- the last change), the incremental getters refresh the rows by it
+  checked TIMESTAMPTZ DEFAULT now()
+);
 
 --COPY artist FROM '/var/postgres/RU.csv' WITH (FORMAT csv, HEADER True);
 
 --SELECT * FROM artist; 
+
+-- popularity time series: daily snapshots (see tools/history.py) and the
+-- changed rows appended by the inserters with history = True. Tables are
+-- partitioned by month, the partitions are created by the loaders on demand
+-- (history.ensure_partitions). Rows are appended in the date order, so a BRIN
+-- index is enough for the date ranges, while the btree index serves the
+-- lookups of the ids.
+CREATE TABLE IF NOT EXISTS artist_history (
+	artist_id VARCHAR (22) NOT NULL,
+	popularity SMALLINT,
+	followers INTEGER,
+  date DATE NOT NULL
+) PARTITION BY RANGE (date);
+
+CREATE INDEX IF NOT EXISTS artist_history_date ON artist_history USING BRIN (date);
+CREATE INDEX IF NOT EXISTS artist_history_id ON artist_history (artist_id, date);
@@ -1,4 +1,7 @@
- CREATE TABLE IF NOT EXISTS track (
+-- track tables, the same as in create_all.sql (the artist table of
+-- create-artist.sql is referenced by the tracks, so it is created first)
+
+CREATE TABLE IF NOT EXISTS track (
 	id VARCHAR (22) PRIMARY KEY,
 	name VARCHAR (50),
   artist_id VARCHAR (22),
@@ -17,5 +20,45 @@
   valence FLOAT(3) CHECK (valence >= 0.000 AND valence <= 1.000),
   tempo FLOAT(3) CHECK (tempo >= 0.000 AND tempo <= 1000.000),
   duration_ms INT CHECK (duration_ms > 0), 
-  time_signature SMALLINT CHECK (time_signature >= 3 AND time_signature <= 7)
+  time_signature SMALLINT CHECK (time_signature >= 3 AND time_signature <= 7),
+  checked TIMESTAMPTZ DEFAULT now(),
+  CONSTRAINT fk_artist
+  	FOREIGN KEY(artist_id) 
+	  	REFERENCES artist(id)
 );
+
+-- country membership of the tracks ('GLobal' for the global charts)
+CREATE TABLE IF NOT EXISTS track_country (
+	track_id VARCHAR (22),
+	country VARCHAR (6),
+  update TIMESTAMP,
+  PRIMARY KEY (track_id, country)
+);
+
+-- dated country membership: a row per track, country and day of the load
+-- (insert_track_country with history = True), the charts of the past days
+-- are built from the membership of their own day. Partitioned by month as
+-- the popularity history, the key keeps a single row per day.
+CREATE TABLE IF NOT EXISTS track_country_history (
+	track_id VARCHAR (22) NOT NULL,
+	country VARCHAR (6) NOT NULL,
+  date DATE NOT NULL,
+  PRIMARY KEY (track_id, country, date)
+) PARTITION BY RANGE (date);
+
+CREATE INDEX IF NOT EXISTS track_country_history_date ON track_country_history (country, date);
+
+-- popularity time series: daily snapshots (see tools/history.py) and the
+-- changed rows appended by the inserters with history = True. Tables are
+-- partitioned by month, the partitions are created by the loaders on demand
+-- (history.ensure_partitions). Rows are appended in the date order, so a BRIN
+-- index is enough for the date ranges, while the btree index serves the
+-- lookups of the ids.
+CREATE TABLE IF NOT EXISTS track_history (
+	track_id VARCHAR (22) NOT NULL,
+	popularity SMALLINT,
+  date DATE NOT NULL
+) PARTITION BY RANGE (date);
+
+CREATE INDEX IF NOT EXISTS track_history_date ON track_history USING BRIN (date);
+CREATE INDEX IF NOT EXISTS track_history_id ON track_history (track_id, date);
@@ -8,15 +8,36 @@ from tools.getters import get_tracks_info
 from tools.getters import get_artists_info
 from tools.utils import write_yaml
 from tools.utils import read_yaml
+from tools.database import get_pool
+from tools.database import transaction
 from tools.inserters import insert_artist
 from tools.inserters import insert_track
+from tools.cache import CachedSpotify
+from tools.throttle import ThrottledSpotify
+from tools.throttle import retry_session
+from tools.metrics import InstrumentedSpotify
+from tools.snapshot import Snapshot
+from tools.snapshot import latest_snapshot
+from tools.snapshot import write_snapshot
+from tools import metrics
 
 
 
 
 # initialize spotify client with client credentials
 # (client credentials should be set as environmental variables on your OS)
-spotify = spotipy.Spotify(client_credentials_manager=SpotifyClientCredentials())
+# (429 responses are retried by the throttler, so the session retries only
+# the connection errors and 5xx responses)
+spotify = spotipy.Spotify(client_credentials_manager=SpotifyClientCredentials(),
+                          requests_session = retry_session())
+# measure every api call (spans and counters of the stages are collected
+# once the metrics are enabled)
+spotify = InstrumentedSpotify(spotify)
+metrics.enable(log_file = expanduser('~') + '/Projects/spotilyse/data/spans.jsonl')
+# share one adaptive request rate between all the getters
+spotify = ThrottledSpotify(spotify)
+# answer repeated bulk requests (tracks, features, artists) from the local cache
+spotify = CachedSpotify(spotify)
 
 # df_rel = get_releases(spotify, 
 #                       country = 'RU', 
@@ -34,6 +55,10 @@ albums = read_yaml(
     expanduser('~') + '/Projects/spotilyse/config/releases_id_RU.yaml',
     key = 'id')
 
+# albums of the latest run can be taken from its snapshot instead of the config
+# albums = Snapshot(latest_snapshot(expanduser('~') + '/Projects/spotilyse/data/snapshots/',
+#                                   country = 'RU')).id_list('albums')
+
 #print(albums_ids)
 
 # #print(df_rel)
@@ -64,8 +89,22 @@ df_a = get_artists_info(spotify,
                         artists_ids = df['artist_id'].tolist(),
                         path = expanduser('~') + '/Projects/spotilyse/data/artists/')
 
-insert_artist(df_a)
-
-insert_track(df)
+# load artists and tracks in a single transaction, the database is given by
+# the SPOTILYSE_DSN environment variable (e.g. 'host=localhost dbname=spotilyse',
+# the password is taken from PGPASSWORD or ~/.pgpass)
+pool = get_pool()
+with transaction(pool) as connection:
+    insert_artist(df_a, connection = connection)
+    insert_track(df, connection = connection)
+pool.closeall()
+
+# keep the data of the run for the warm start of the next runs and analysis
+write_snapshot(expanduser('~') + '/Projects/spotilyse/data/snapshots/',
+               {'tracks': df, 'artists': df_a},
+               {'albums': albums},
+               meta = {'country': 'RU'})
+
+# write the metrics of the run for the Prometheus textfile collector
+metrics.write_prometheus(expanduser('~') + '/Projects/spotilyse/data/spotilyse.prom')
 
 
@@ -0,0 +1,110 @@
+# Current module provides a local http server answering with the scripted
+# responses or with the fixtures of a fake client, so the clients are tested
+# against real http (status codes, headers, retries of the sessions, paging
+# by urls) without the spotify api.
+
+
+import json
+import threading
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+from urllib.parse import parse_qs
+from urllib.parse import urlparse
+
+
+class Server(ThreadingHTTPServer):
+    # the async clients open many connections at once, the default backlog
+    # of 5 would drop them to the retransmission timeout
+    request_queue_size = 128
+
+
+class FakeServer:
+    """
+    A local http server, every request is answered with the next scripted
+    response (the last one is repeated) or by the router, e.g.
+    with FakeServer([(429, {'Retry-After': '1'}, {}), (200, {}, body)]) as server: ...
+
+    Parameters
+    ----------
+    responses : list of tuple or callable
+        (status, headers, json body) of the responses in order, or a function
+        which takes the path of the request and returns such a tuple
+        (e.g. api_router)
+    """
+
+    def __init__(self, responses):
+        self.router = responses if callable(responses) else None
+        self.responses = [] if callable(responses) else list(responses)
+        self.requests = [] # paths of the received requests
+        self._lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                status, headers, body = server._next(self.path)
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = Server(('127.0.0.1', 0), Handler)
+        self.url = 'http://127.0.0.1:{}/v1/'.format(self._server.server_address[1])
+
+    def _next(self, path):
+        with self._lock:
+            self.requests.append(path)
+            if self.router is not None:
+                return self.router(path)
+            if len(self.responses) > 1:
+                return self.responses.pop(0)
+            return self.responses[0]
+
+    def __enter__(self):
+        threading.Thread(target = self._server.serve_forever, daemon = True).start()
+        return self
+
+    def __exit__(self, *args):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def api_router(spotify):
+    """
+    A function used to get the router answering the api requests of the
+    releases getters (new releases, album tracks, tracks, audio features and
+    artists) with the responses of the fake client (fakes.FakeSpotify). Its
+    prefix should be the url of the server, so the 'next' pages are requested
+    from the server as well.
+    """
+
+    def route(path):
+        url = urlparse(path)
+        query = {key : values[0] for key, values in parse_qs(url.query).items()}
+        parts = url.path.split('/')[2:] # without the empty part and v1
+        limit, offset = int(query.get('limit', 20)), int(query.get('offset', 0))
+        ids = query['ids'].split(',') if 'ids' in query else []
+
+        if parts == ['browse', 'new-releases']:
+            body = spotify.new_releases(query.get('country'), limit, offset)
+        elif len(parts) == 3 and parts[0] == 'albums' and parts[2] == 'tracks':
+            body = spotify.album_tracks(parts[1], limit, offset)
+        elif parts == ['tracks']:
+            body = spotify.tracks(ids)
+        elif parts == ['audio-features']:
+            # the api wraps the features, spotipy unwraps them
+            body = {'audio_features': spotify.audio_features(ids)}
+        elif parts == ['artists']:
+            body = spotify.artists(ids)
+        else:
+            return 404, {}, {'error': {'status': 404, 'message': 'Not found.'}}
+        return 200, {}, body
+
+    return route
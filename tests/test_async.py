@@ -0,0 +1,59 @@
+import asyncio
+import pytest
+from fakes import FakeSpotify
+from fakes import synthetic_fixtures
+from tests.server import FakeServer
+from tests.server import api_router
+from tools import async_getters
+from tools import getters
+from tools.async_client import AsyncSpotify
+
+# the async client requires the optional aiohttp package
+pytest.importorskip('aiohttp')
+
+
+async def run_async(spotify, path):
+    albums = await async_getters.get_releases(spotify, country = 'US', path = path)
+    tracks = await async_getters.get_albums_tracks(spotify, albums_ids = albums)
+    df = await async_getters.get_tracks_info(spotify, tracks_ids = tracks, path = path)
+    df_a = await async_getters.get_artists_info(spotify, artists_ids = df['artist_id'].tolist(),
+                                                path = path)
+    return albums, tracks, df, df_a
+
+
+def run_sync(spotify, path):
+    albums = getters.get_releases(spotify, country = 'US', path = path)
+    tracks = getters.get_albums_tracks(spotify, albums_ids = albums)
+    df = getters.get_tracks_info(spotify, tracks_ids = tracks, path = path)
+    df_a = getters.get_artists_info(spotify, artists_ids = df['artist_id'].tolist(),
+                                    path = path)
+    return albums, tracks, df, df_a
+
+
+def test_async_getters_match_sync(tmp_path):
+    # 2 pages of releases, albums of 2 pages, 3 chunks of artists
+    fixtures = synthetic_fixtures(n_albums = 60, tracks_per_album = 60, n_artists = 120)
+    path = str(tmp_path) + '/'
+
+    spotify = FakeSpotify(fixtures, latency = 0)
+    expected = run_sync(spotify, path)
+
+    served = FakeSpotify(fixtures, latency = 0)
+    with FakeServer(api_router(served)) as server:
+        served.prefix = server.url
+
+        async def run():
+            async with AsyncSpotify(token = 'token', prefix = server.url) as client:
+                return await run_async(client, path), client.requests
+
+        result, requests = asyncio.run(run())
+
+    albums, tracks, df, df_a = result
+    assert albums == expected[0]
+    assert tracks == expected[1]
+    assert len(tracks) == 60 * 60
+    assert df.equals(expected[2])
+    assert df_a.equals(expected[3])
+    # the same requests without the retries
+    assert served.calls == spotify.calls
+    assert requests == len(server.requests) == spotify.total_calls()
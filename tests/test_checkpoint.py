@@ -0,0 +1,53 @@
+import pytest
+from fakes import FakeSpotify
+from fakes import synthetic_fixtures
+from tools.checkpoint import Journal
+from tools.getters import get_albums_tracks
+from tools.getters import get_tracks_info
+
+
+class CrashingSpotify(FakeSpotify):
+    # fake client whose requests fail after the given number of calls
+    def __init__(self, fixtures, fail_after):
+        super().__init__(fixtures, latency = 0)
+        self.fail_after = fail_after
+
+    def _request(self, endpoint):
+        # the calls are counted and compared at once, so concurrent requests
+        # fail exactly after fail_after of them
+        with self._lock:
+            if sum(self.calls.values()) >= self.fail_after:
+                raise ConnectionError('injected failure')
+            self.calls[endpoint] = self.calls.get(endpoint, 0) + 1
+
+
+def run(spotify, fixtures, path, journal = None):
+    # albums of 2 pages, then tracks and their features
+    tracks = get_albums_tracks(spotify, albums_ids = list(fixtures['albums']),
+                               journal = journal)
+    return get_tracks_info(spotify, tracks_ids = tracks, path = path, journal = journal)
+
+
+# failures at the first pages, the next pages, the tracks and the features
+@pytest.mark.parametrize('fail_after', [5, 30, 50, 70])
+def test_resume_makes_no_extra_calls(tmp_path, fail_after):
+    fixtures = synthetic_fixtures(n_albums = 20, tracks_per_album = 60, n_artists = 30)
+    path = str(tmp_path) + '/'
+
+    clean = FakeSpotify(fixtures, latency = 0)
+    expected = run(clean, fixtures, path)
+
+    crashing = CrashingSpotify(fixtures, fail_after)
+    journal = Journal('job', path)
+    with pytest.raises(ConnectionError):
+        run(crashing, fixtures, path, journal)
+    journal.close()
+
+    resumed = FakeSpotify(fixtures, latency = 0)
+    journal = Journal('job', path)
+    df = run(resumed, fixtures, path, journal)
+    journal.remove()
+
+    assert crashing.total_calls() == fail_after
+    assert crashing.total_calls() + resumed.total_calls() == clean.total_calls()
+    assert df.drop(columns = 'update').equals(expected.drop(columns = 'update'))
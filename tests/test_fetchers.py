@@ -0,0 +1,62 @@
+from fakes import FakeSpotify
+from fakes import synthetic_fixtures
+from tools.fetchers import fetch_bulk
+from tools.getters import get_albums_tracks
+from tools.getters import get_artists_info
+from tools.getters import get_releases
+from tools.getters import get_tracks_info
+
+
+def test_concurrent_pagination(tmp_path):
+    # 2 pages of releases, 100 albums of 2 pages each
+    fixtures = synthetic_fixtures(n_albums = 100, tracks_per_album = 60, n_artists = 50)
+
+    def run(max_workers):
+        spotify = FakeSpotify(fixtures, latency = 0.01)
+        albums = get_releases(spotify, country = 'US', path = str(tmp_path) + '/',
+                              max_workers = max_workers)
+        tracks = get_albums_tracks(spotify, albums_ids = albums, max_workers = max_workers)
+        return albums, tracks, spotify.max_in_flight
+
+    sequential = run(1)
+    concurrent = run(8)
+
+    # the same items in the same order, the requests overlap up to the limit
+    assert concurrent[:2] == sequential[:2]
+    assert len(concurrent[1]) == 100 * 60
+    assert sequential[2] == 1
+    assert 1 < concurrent[2] <= 8
+
+
+def test_bulk_requests_are_packed():
+    # 250 tracks and 120 artists
+    fixtures = synthetic_fixtures(n_albums = 25, tracks_per_album = 10, n_artists = 120)
+    spotify = FakeSpotify(fixtures, latency = 0)
+    tracks_ids = list(fixtures['tracks'])
+    artists_ids = list(fixtures['artists'])
+
+    results, counts = fetch_bulk(spotify, {'tracks': tracks_ids,
+                                           'audio_features': tracks_ids,
+                                           'artists': artists_ids})
+
+    # 50 tracks, 100 features and 50 artists per request (the 50-id chunks of
+    # every endpoint took 5 + 5 + 3 requests)
+    assert counts == {'tracks': 5, 'audio_features': 3, 'artists': 3}
+    assert spotify.calls == counts
+    assert [t['id'] for t in results['tracks']] == tracks_ids
+    assert [f['id'] for f in results['audio_features']] == tracks_ids
+    assert [a['id'] for a in results['artists']] == artists_ids
+
+
+def test_getters_request_count(tmp_path):
+    fixtures = synthetic_fixtures(n_albums = 25, tracks_per_album = 10, n_artists = 120)
+    spotify = FakeSpotify(fixtures, latency = 0)
+    path = str(tmp_path) + '/'
+
+    df = get_tracks_info(spotify, tracks_ids = list(fixtures['tracks']), path = path)
+    get_artists_info(spotify, artists_ids = df['artist_id'].tolist(), path = path)
+
+    artists = df['artist_id'].nunique()
+    assert len(df) == 250
+    assert spotify.calls == {'tracks': 5, 'audio_features': 3,
+                             'artists': -(-artists // 50)}
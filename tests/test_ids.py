@@ -0,0 +1,22 @@
+import numpy as np
+import pytest
+from tools.ids import decode
+from tools.ids import decode_id
+from tools.ids import encode
+from tools.ids import unique_ids
+
+
+IDS = [decode_id(bytes(range(i, i + 16))) for i in range(5)]
+
+
+@pytest.mark.parametrize('ids', [IDS, np.array(IDS), np.array(IDS, dtype = object)])
+def test_round_trip(ids):
+    assert decode(encode(ids)).tolist() == IDS
+
+
+# the fixed-width cast must not truncate the longer ids into valid ones
+@pytest.mark.parametrize('invalid', [IDS[0] + 'x', IDS[0][:-1], IDS[0][:-1] + '-'])
+def test_invalid_ids_are_rejected(invalid):
+    with pytest.raises(ValueError, match = 'invalid spotify id'):
+        encode(IDS + [invalid])
+    assert unique_ids(IDS + [invalid, IDS[1]]) == IDS
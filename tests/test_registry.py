@@ -0,0 +1,29 @@
+import pytest
+from tools.registry import IdRegistry
+
+TRACK_ID = '4iV5W9uYEdYUVa79Axb7Rh'
+ARTIST_ID = '0OdUWJ0sBjDrqHygGUXeCF'
+
+
+def test_save_and_load(tmp_path):
+    registry = IdRegistry('2026-10-17')
+    registry.add('US', [TRACK_ID, None])
+    registry.add('RU', [TRACK_ID])
+    registry.mark_fetched([TRACK_ID])
+    registry.mark_fetched([ARTIST_ID], 'artist')
+    registry.save(str(tmp_path / 'registry.bin'))
+
+    loaded = IdRegistry.load(str(tmp_path / 'registry.bin'))
+    assert loaded.cycle == '2026-10-17'
+    assert loaded.members == registry.members
+    assert loaded.fetched == registry.fetched
+    assert loaded.countries_of(TRACK_ID) == ['US', 'RU']
+
+
+@pytest.mark.parametrize('id_', [TRACK_ID + 'xyz', TRACK_ID[:-1], 'é' * 21])
+def test_save_rejects_invalid_ids(tmp_path, id_):
+    registry = IdRegistry()
+    registry.add('US', [TRACK_ID, id_])
+    with pytest.raises(ValueError):
+        registry.save(str(tmp_path / 'registry.bin'))
+    assert not (tmp_path / 'registry.bin').exists()
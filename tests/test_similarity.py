@@ -0,0 +1,40 @@
+import numpy as np
+import pandas as pd
+from tools.similarity import SIMILARITY_COLUMNS
+from tools.similarity import SimilarityIndex
+
+
+def synthetic_df(n, seed = 0):
+    rnd = np.random.default_rng(seed)
+    index = pd.Index(['{:022d}'.format(i) for i in range(n)], name = 'id')
+    return pd.DataFrame(rnd.normal(size = (n, len(SIMILARITY_COLUMNS))).astype(np.float32),
+                        index = index, columns = SIMILARITY_COLUMNS)
+
+
+def test_add_by_batches(tmp_path):
+    df = synthetic_df(2000)
+    whole = SimilarityIndex.from_df(df, n_lists = 16)
+
+    # the same standardization and clusters, the tracks are added by 10
+    index = SimilarityIndex(whole.mean, whole.std)
+    index.centroids = whole.centroids
+    for start in range(0, len(df), 10):
+        assert index.add(df.iloc[start:start + 10]) == 10
+    # already added tracks are skipped
+    assert index.add(df.iloc[:50]) == 0
+
+    # the buffers grew by doubling, not by every batch
+    assert len(index) == 2000
+    assert len(index._buffers['vectors']) < 2 * 2000
+    np.testing.assert_array_equal(index.ids, whole.ids)
+    np.testing.assert_array_equal(index.assign, whole.assign)
+    np.testing.assert_array_equal(index.vectors, whole.vectors)
+    np.testing.assert_array_equal(index.norms, whole.norms)
+
+    # a loaded (memory-mapped) index is copied to the memory by the first add
+    index.save(str(tmp_path))
+    loaded = SimilarityIndex.load(str(tmp_path))
+    assert loaded.add(synthetic_df(2010).iloc[2000:]) == 10
+    assert len(loaded) == 2010
+    ids, _ = loaded.search(loaded.vectors[-1], k = 1, exact = True)
+    assert ids[0, 0] == b'0000000000000000002009'
@@ -0,0 +1,63 @@
+import time
+import pytest
+import spotipy
+from spotipy.exceptions import SpotifyException
+from tests.server import FakeServer
+from tools.throttle import ThrottledSpotify
+from tools.throttle import TokenBucket
+from tools.throttle import retry_session
+
+TRACK_ID = '4iV5W9uYEdYUVa79Axb7Rh'
+
+
+def make_client(server, **kwargs):
+    spotify = spotipy.Spotify(auth = 'token',
+                              requests_session = retry_session(retries = 2,
+                                                               backoff_factor = 0))
+    spotify.prefix = server.url
+    return ThrottledSpotify(spotify, **kwargs)
+
+
+def test_retry_after_is_honoured():
+    responses = [(429, {'Retry-After': '1'}, {'error': {'status': 429}}),
+                 (200, {}, {'id': TRACK_ID})]
+    with FakeServer(responses) as server:
+        spotify = make_client(server, rate = 10.0)
+        start = time.monotonic()
+        assert spotify.track(TRACK_ID) == {'id': TRACK_ID}
+        elapsed = time.monotonic() - start
+
+    # the session does not retry 429, the throttler waits Retry-After plus
+    # at most a second of jitter
+    assert len(server.requests) == 2
+    assert 1.0 <= elapsed < 2.5
+    assert spotify.metrics()['retries'] == {'track': 1}
+    assert spotify.bucket.rate == pytest.approx(5.1)
+
+
+def test_exhausted_5xx_keeps_status():
+    with FakeServer([(503, {}, {'error': {'status': 503}})]) as server:
+        spotify = make_client(server, rate = 10.0)
+        with pytest.raises(SpotifyException) as err:
+            spotify.track(TRACK_ID)
+
+    # the session retried the request, the throttler did not slow down
+    assert err.value.http_status == 503
+    assert len(server.requests) == 3
+    assert spotify.bucket.rate == 10.0
+
+
+def test_pause_does_not_refill():
+    bucket = TokenBucket(rate = 10.0, capacity = 10)
+    bucket.pause(0.5)
+    start = time.monotonic()
+    bucket.acquire()
+    resumed = time.monotonic()
+    for _ in range(9):
+        bucket.acquire()
+    end = time.monotonic()
+
+    # the first call waits for the pause, the rest go at the rate (9 tokens
+    # at 10 per second) instead of a burst of the tokens of the pause
+    assert 0.5 <= resumed - start < 0.7
+    assert end - resumed >= 0.85
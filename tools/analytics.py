@@ -0,0 +1,590 @@
+# Current module provides the aggregates of the charts: popularity rank of the
+# tracks, genre share and audio features averages of every (country, date)
+# chart. They are computed either from the dataframes of the getters or from the
+# database. Over dataframes the aggregates are whole-column groupby reductions of
+# all the charts at once, over the database they are pushed down to SQL, so only
+# the aggregated rows are transferred. Charts of the past days are taken from the
+# popularity history (see tools/history.py) and the dated country membership
+# of the same day (track_country_history), whose rows never change, so their
+# results can be cached by (country, date). Multi-year history
+# of all the markets is processed a month (a partition of the history table) or
+# a partition file of the exported dataframes at a time, so the memory does not
+# grow with the range.
+
+
+import glob
+import io
+import os
+import pickle
+import shutil
+from collections import OrderedDict
+from datetime import date, timedelta
+import pandas as pd
+from tools.getters import FEATURES_COLUMNS
+from tools.metrics import span
+from tools.writers import read_df
+
+# supported aggregates
+AGGREGATES = ('rank', 'genres', 'features')
+
+# types of the aggregates columns
+DTYPES = {'country': 'category',
+          'id': 'string',
+          'popularity': 'Int8',
+          'rank': 'Int32',
+          'genre': 'string',
+          'tracks': 'Int32',
+          'share': 'float32'}
+
+# SQL of the aggregates over the chart rows (country, date, id, popularity)
+QUERIES = {'rank': """
+    SELECT country, date, id, popularity, rank
+    FROM (SELECT c.*, RANK() OVER (PARTITION BY country, date
+                                   ORDER BY popularity DESC NULLS LAST) AS rank
+          FROM ({chart}) c) r
+    {top}
+    ORDER BY country, date, rank, id
+                      """,
+           'genres': """
+    SELECT c.country, c.date, a.genre, COUNT(*) AS tracks,
+           COUNT(*)::float / SUM(COUNT(*)) OVER (PARTITION BY c.country, c.date) AS share
+    FROM ({chart}) c
+    JOIN track t ON t.id = c.id
+    LEFT JOIN artist a ON a.id = t.artist_id
+    GROUP BY c.country, c.date, a.genre
+    ORDER BY c.country, c.date, tracks DESC, a.genre
+                        """,
+           'features': """
+    SELECT c.country, c.date, COUNT(*) AS tracks, AVG(c.popularity) AS popularity,
+           {features}
+    FROM ({chart}) c
+    JOIN track t ON t.id = c.id
+    GROUP BY c.country, c.date
+    ORDER BY c.country, c.date
+                          """}
+
+# chart rows of the history days (with the membership of the same day) and of
+# the current state of the track table (with the current membership)
+HISTORY_CHART = """
+    SELECT tc.country, h.date, h.track_id AS id, h.popularity
+    FROM track_history h
+    JOIN track_country_history tc ON tc.track_id = h.track_id AND tc.date = h.date
+    WHERE h.date >= %(start)s AND h.date < %(end)s
+      AND tc.date >= %(start)s AND tc.date < %(end)s {countries}
+                """
+CURRENT_CHART = """
+    SELECT tc.country, CURRENT_DATE AS date, t.id, t.popularity
+    FROM track t
+    JOIN track_country tc ON tc.track_id = t.id
+    WHERE TRUE {countries}
+                """
+
+
+def chart_frame(frames):
+    """
+    A function used to combine the tracks dataframes of several charts into
+    a single one.
+
+    Parameters
+    ----------
+    frames : dict
+        mapping from the country to its tracks dataframe (see
+        getters.get_tracks_info)
+
+    Returns
+    -------
+    pandas.DataFrame
+        tracks dataframe indexed by id with country (category) and date (the
+        day of the update) columns in front
+
+    """
+
+    df = pd.concat(frames, names = ['country', 'id']).reset_index(level = 'country')
+    df['country'] = df['country'].astype('category')
+    df.insert(1, 'date', pd.to_datetime(df['update']).dt.normalize())
+    return df
+
+
+def popularity_rank(
+        df,
+        top = None
+        ):
+    """
+    A function used to rank the tracks of every chart by popularity.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        tracks dataframe with country and date columns (see chart_frame)
+    top : int
+        keep the tracks ranked up to top only (default None - all the tracks)
+
+    Returns
+    -------
+    pandas.DataFrame
+        a dataframe with country, date, id, popularity and rank columns, equal
+        popularity shares the rank
+
+    """
+
+    rank = df.groupby(['country', 'date'], observed = True, sort = False)['popularity'] \
+             .rank(method = 'min', ascending = False, na_option = 'bottom')
+    result = pd.DataFrame({'country': df['country'].to_numpy(),
+                           'date': df['date'].to_numpy(),
+                           'id': df.index.to_numpy(),
+                           'popularity': df['popularity'].to_numpy(),
+                           'rank': rank.to_numpy()})
+    if top is not None:
+        result = result[result['rank'] <= top]
+
+    result = result.sort_values(['country', 'date', 'rank', 'id'], ignore_index = True)
+    return result.astype({column : DTYPES[column] for column in ['country', 'id',
+                                                                 'popularity', 'rank']})
+
+
+def genre_share(
+        df,
+        df_a
+        ):
+    """
+    A function used to get the share of the tracks of every genre (the genre
+    of the track artist) in every chart.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        tracks dataframe with country and date columns (see chart_frame)
+    df_a : pandas.DataFrame
+        artists dataframe (see getters.get_artists_info), artists of several
+        charts may be concatenated
+
+    Returns
+    -------
+    pandas.DataFrame
+        a dataframe with country, date, genre, tracks and share columns, the
+        genres of every chart are ordered by the number of tracks
+
+    """
+
+    genres = df_a.loc[~df_a.index.duplicated(keep = 'last'), 'artist_genre']
+    genre = df['artist_id'].astype(str).map(genres)
+
+    tracks = df[['country', 'date']].assign(genre = genre.to_numpy()) \
+               .groupby(['country', 'date', 'genre'], observed = True, dropna = False,
+                        sort = False).size()
+    share = tracks / tracks.groupby(level = ['country', 'date'], observed = True) \
+                           .transform('sum')
+
+    result = pd.DataFrame({'tracks': tracks, 'share': share}).reset_index()
+    result = result.sort_values(['country', 'date', 'tracks', 'genre'],
+                                ascending = [True, True, False, True], ignore_index = True)
+    return result.astype({column : DTYPES[column] for column in ['country', 'genre',
+                                                                 'tracks', 'share']})
+
+
+def feature_means(df):
+    """
+    A function used to get the averages of the popularity and audio features
+    of the tracks of every chart.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        tracks dataframe with country and date columns (see chart_frame)
+
+    Returns
+    -------
+    pandas.DataFrame
+        a dataframe with country, date, tracks, popularity and a column for
+        every audio feature
+
+    """
+
+    grouped = df.groupby(['country', 'date'], observed = True)
+    result = grouped[['popularity'] + FEATURES_COLUMNS].mean().astype('float32')
+    result.insert(0, 'tracks', grouped.size().astype(DTYPES['tracks']))
+    result = result.reset_index()
+    result['country'] = result['country'].astype('category')
+    return result
+
+
+def aggregate_frames(
+        df,
+        aggregate,
+        df_a = None,
+        top = None
+        ):
+    """
+    A function used to compute the aggregate of the tracks dataframe.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        tracks dataframe with country and date columns (see chart_frame)
+    aggregate : str
+        'rank', 'genres' or 'features'
+    df_a : pandas.DataFrame
+        artists dataframe, required by 'genres' (default None)
+    top : int
+        number of the top tracks of 'rank' (default None - all the tracks)
+
+    Returns
+    -------
+    pandas.DataFrame
+        the aggregate (see popularity_rank, genre_share and feature_means)
+
+    """
+
+    if aggregate == 'rank':
+        return popularity_rank(df, top)
+    if aggregate == 'genres':
+        if df_a is None:
+            raise ValueError("artists dataframe is required by the 'genres' aggregate")
+        return genre_share(df, df_a)
+    if aggregate == 'features':
+        return feature_means(df)
+    raise ValueError('unknown aggregate: ' + aggregate)
+
+
+def query_aggregate(
+        connection,
+        aggregate,
+        start = None,
+        end = None,
+        countries = None,
+        top = None
+        ):
+    """
+    A function used to compute the aggregate of the charts in the database.
+    Charts of the days from start to end are built from the rows of the
+    track history of these days (see history.append_history) and the country
+    membership of the tracks on the same days (see
+    inserters.insert_track_country with history = True).
+
+    Parameters
+    ----------
+    connection : psycopg2 connection
+        database connection
+    aggregate : str
+        'rank', 'genres' or 'features'
+    start : datetime.date
+        first day of the charts (default None - the current state of the
+        track table as the chart of today)
+    end : datetime.date
+        day after the last day of the charts (default None - the day after
+        start)
+    countries : list of str
+        countries of the charts (default None - all the countries)
+    top : int
+        number of the top tracks of 'rank' (default None - all the tracks)
+
+    Returns
+    -------
+    pandas.DataFrame
+        the aggregate with the same columns as over the dataframes (see
+        aggregate_frames)
+
+    """
+
+    if aggregate not in AGGREGATES:
+        raise ValueError('unknown aggregate: ' + aggregate)
+
+    params = {'countries': list(countries or []), 'top': top}
+    filter_ = 'AND tc.country = ANY(%(countries)s)' if countries is not None else ''
+    if start is None:
+        chart = CURRENT_CHART.format(countries = filter_)
+    else:
+        # date bounds are literals, so the planner reads the partitions of
+        # the range only (of both history tables)
+        chart = HISTORY_CHART.format(countries = filter_)
+        params['start'] = start
+        params['end'] = end or start + timedelta(days = 1)
+
+    # boolean mode is averaged as 0/1
+    features = ',\n'.join('AVG(t.{0}{1}) AS {0}'.format(column,
+                                                        '::int' if column == 'mode' else '')
+                          for column in FEATURES_COLUMNS)
+    query = QUERIES[aggregate].format(chart = chart, features = features,
+                                      top = 'WHERE rank <= %(top)s' if top else '')
+
+    cursor = connection.cursor()
+    query = cursor.mogrify('COPY ({}) TO STDOUT WITH (FORMAT csv, HEADER true)'.format(query),
+                           params).decode()
+    buffer = io.StringIO()
+    with span('query_aggregate', aggregate = aggregate):
+        cursor.copy_expert(query, buffer)
+    cursor.close()
+    buffer.seek(0)
+
+    df = pd.read_csv(buffer, parse_dates = ['date'], keep_default_na = False,
+                     na_values = [''])
+    dtypes = {column : DTYPES.get(column, 'float32') for column in df
+              if column != 'date'}
+    if aggregate == 'features':
+        # averages of the integer columns are fractional
+        dtypes['popularity'] = 'float32'
+    return df.astype(dtypes)
+
+
+class ChartCache:
+    """
+    A cache of the aggregates of the charts by (country, date). Results of the
+    days which are not over yet are never cached, as their charts still change,
+    while the charts of the past days are built from the dated history only, so
+    they are final (see clear to drop them anyway, e.g. after a backfill).
+
+    Parameters
+    ----------
+    path : str
+        path to the directory in which the results are kept as pickle files
+        (default None - in memory only)
+    max_size : int
+        maximum number of the results kept in memory, least recently used
+        results are evicted above it (default 1000)
+    """
+
+    def __init__(self, path = None, max_size = 1000):
+        self.path = path
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._results = OrderedDict()
+
+    def _file_name(self, key):
+        aggregate, top, country, day = key
+        name = aggregate if top is None else '{}_top{}'.format(aggregate, top)
+        return os.path.join(self.path, name, country, '{:%Y-%m-%d}.pkl'.format(day))
+
+    def get(self, aggregate, country, day, top = None):
+        """
+        A method used to get the cached result (None if it is missing).
+        """
+        key = (aggregate, top, country, pd.Timestamp(day).date())
+        result = self._results.get(key)
+        if result is None and self.path is not None and os.path.exists(self._file_name(key)):
+            with open(self._file_name(key), 'rb') as f:
+                result = pickle.load(f)
+            self._remember(key, result)
+        if result is None:
+            self.misses += 1
+            return None
+        self._results.move_to_end(key)
+        self.hits += 1
+        return result
+
+    def put(self, aggregate, country, day, result, top = None):
+        """
+        A method used to cache the result of the chart.
+        """
+        day = pd.Timestamp(day).date()
+        if day >= date.today():
+            return
+        key = (aggregate, top, country, day)
+        self._remember(key, result)
+        if self.path is not None:
+            os.makedirs(os.path.dirname(self._file_name(key)), exist_ok = True)
+            with open(self._file_name(key), 'wb') as f:
+                pickle.dump(result, f)
+
+    def clear(self):
+        """
+        A method used to drop all the cached results, in memory and on disk.
+        """
+        self._results.clear()
+        if self.path is not None:
+            for aggregate in AGGREGATES:
+                for name in glob.glob(os.path.join(self.path, aggregate + '*')):
+                    shutil.rmtree(name, ignore_errors = True)
+
+    def _remember(self, key, result):
+        self._results[key] = result
+        self._results.move_to_end(key)
+        while len(self._results) > self.max_size:
+            self._results.popitem(last = False)
+
+
+def _months(start, end):
+    # [first, last) day ranges of the calendar months covering the range
+    month = start.replace(day = 1)
+    while month < end:
+        following = (month + timedelta(days = 32)).replace(day = 1)
+        yield max(month, start), min(following, end)
+        month = following
+
+
+def _split(result, aggregate, countries, days, cache, top):
+    # cache the result of every chart of the grid, empty charts included
+    parts = {key : part for key, part in result.groupby(['country', 'date'], observed = True)}
+    for country in countries:
+        for day in days:
+            part = parts.get((country, pd.Timestamp(day)), result.iloc[:0])
+            cache.put(aggregate, country, day, part.reset_index(drop = True), top)
+
+
+def iter_history(
+        connection,
+        aggregate,
+        start,
+        end,
+        countries = None,
+        top = None,
+        cache = None
+        ):
+    """
+    A generator used to compute the aggregate of the charts of a long date
+    range a month at a time, so every query reads a single partition of the
+    history and only a month of results is held in memory.
+
+    Parameters
+    ----------
+    connection : psycopg2 connection
+        database connection
+    aggregate : str
+        'rank', 'genres' or 'features'
+    start : datetime.date
+        first day of the charts
+    end : datetime.date
+        day after the last day of the charts
+    countries : list of str
+        countries of the charts (default None - all the countries of the
+        membership of the range)
+    top : int
+        number of the top tracks of 'rank' (default None - all the tracks)
+    cache : ChartCache
+        cache of the results, months whose charts are all cached are not
+        queried (default None)
+
+    Yields
+    -------
+    pandas.DataFrame
+        the aggregate of the charts of the month
+
+    """
+
+    if cache is not None and countries is None:
+        cursor = connection.cursor()
+        cursor.execute("""SELECT DISTINCT country FROM track_country_history
+                          WHERE date >= %s AND date < %s ORDER BY country""",
+                       (start, end))
+        countries = [row[0] for row in cursor.fetchall()]
+        cursor.close()
+
+    for first, last in _months(start, end):
+        if cache is not None:
+            days = pd.date_range(first, last - timedelta(days = 1)).date
+            cached = [cache.get(aggregate, country, day, top)
+                      for country in countries for day in days]
+            # there is nothing cached to combine without countries
+            if cached and all(part is not None for part in cached):
+                # empty charts are kept for the columns of an empty month only
+                parts = [part for part in cached if len(part)] or cached[:1]
+                result = pd.concat(parts, ignore_index = True)
+                result['country'] = result['country'].astype('category')
+                yield result
+                continue
+
+        result = query_aggregate(connection, aggregate, first, last, countries, top)
+        if cache is not None:
+            _split(result, aggregate, countries, days, cache, top)
+        yield result
+
+
+def iter_partitions(
+        path,
+        countries = None,
+        start = None,
+        end = None
+        ):
+    """
+    A generator used to list the files of the dataframes exported by the
+    getters with partition = True (<path>/country=<country>/update=<date>/).
+
+    Parameters
+    ----------
+    path : str
+        path to the directory of the partitions
+    countries : list of str
+        countries of the partitions (default None - all the countries)
+    start : datetime.date
+        first day of the partitions (default None - from the first one)
+    end : datetime.date
+        day after the last day of the partitions (default None - up to the
+        last one)
+
+    Yields
+    -------
+    country : str
+        country of the partition
+    day : datetime.date
+        update date of the partition
+    full_name : str
+        full name of the file of the partition
+
+    """
+
+    partitions = []
+    for full_name in glob.glob(os.path.join(path, 'country=*', 'update=*', '*')):
+        country_dir, update_dir = full_name.split(os.sep)[-3:-1]
+        country = country_dir.split('=', 1)[1]
+        day = date.fromisoformat(update_dir.split('=', 1)[1])
+        if countries is not None and country not in countries:
+            continue
+        if (start is not None and day < start) or (end is not None and day >= end):
+            continue
+        partitions.append((day, country, full_name))
+
+    for day, country, full_name in sorted(partitions):
+        yield country, day, full_name
+
+
+def iter_partitions_aggregate(
+        path,
+        aggregate,
+        artists_path = None,
+        countries = None,
+        start = None,
+        end = None,
+        top = None,
+        cache = None
+        ):
+    """
+    A generator used to compute the aggregate of every chart exported by the
+    getters with partition = True. Partitions are read one at a time, so the
+    memory is bounded by the largest chart rather than by the history.
+
+    Parameters
+    ----------
+    path : str
+        path to the directory of the tracks partitions
+    aggregate : str
+        'rank', 'genres' or 'features'
+    artists_path : str
+        path to the directory of the artists partitions of the same charts,
+        required by 'genres' (default None)
+    countries, start, end
+        filters of the partitions (see iter_partitions)
+    top : int
+        number of the top tracks of 'rank' (default None - all the tracks)
+    cache : ChartCache
+        cache of the results, cached charts are not read (default None)
+
+    Yields
+    -------
+    pandas.DataFrame
+        the aggregate of the chart (see aggregate_frames)
+
+    """
+
+    for country, day, full_name in iter_partitions(path, countries, start, end):
+        result = cache.get(aggregate, country, day, top) if cache is not None else None
+        if result is None:
+            # partition values are kept in the directory names only
+            df = read_df(full_name, index = 'id').assign(update = day)
+            df_a = None
+            if aggregate == 'genres':
+                df_a = read_df(os.path.join(artists_path, os.path.relpath(full_name, path)),
+                               index = 'artist_id')
+            result = aggregate_frames(chart_frame({country: df}), aggregate, df_a, top)
+            if cache is not None:
+                cache.put(aggregate, country, day, result, top)
+        yield result
@@ -0,0 +1,188 @@
+# Current module provides an asyncio-native spotify client. spotipy is
+# synchronous, so the getters can reach concurrency only through threads, while
+# this client keeps thousands of requests in flight in a single thread. It
+# implements the subset of the spotipy endpoints used by the getters with the
+# same names, arguments and responses, so the async getters (async_getters
+# module) mirror the ordinary ones. Connections are pooled and kept alive by
+# the aiohttp session. The access token is taken from the (blocking) auth
+# manager in a thread, once for all the concurrent requests. The client
+# requires the optional aiohttp package.
+
+
+import asyncio
+import functools
+import random
+import time
+from spotipy.exceptions import SpotifyException
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+# prefix of the spotify web api urls
+PREFIX = 'https://api.spotify.com/v1/'
+
+# the manager returns the token valid for at least 60 more seconds, so it is
+# reused for a shorter time without asking the manager
+TOKEN_TTL = 30
+
+
+class AsyncSpotify:
+    """
+    An asyncio spotify client. It should be closed after use (or used as
+    async context manager).
+
+    Parameters
+    ----------
+    auth_manager : spotipy.oauth2.SpotifyClientCredentials() instance
+        manager of the access token (default None - token has to be given)
+    token : str
+        access token (default None - it is taken from the auth_manager)
+    prefix : str
+        prefix of the api urls, e.g. url of a stub server (default PREFIX)
+    max_connections : int
+        maximum number of connections in the pool, i.e. number of requests
+        in flight (default 100)
+    max_retries : int
+        maximum number of retries of the throttled (429) or failed (5xx,
+        connection error or timeout) request (default 5)
+    timeout : float
+        total timeout of a request in seconds (default 30)
+    """
+
+    def __init__(
+            self,
+            auth_manager = None,
+            token = None,
+            prefix = PREFIX,
+            max_connections = 100,
+            max_retries = 5,
+            timeout = 30
+            ):
+        if aiohttp is None:
+            raise ImportError('aiohttp is required for the async client')
+        if auth_manager is None and token is None:
+            raise ValueError('either auth_manager or token has to be given')
+
+        self.auth_manager = auth_manager
+        self.token = token
+        self.prefix = prefix
+        self.max_connections = max_connections
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.requests = 0 # number of requests sent, including the retries
+        self._session = None
+        self._token = None # token of the manager and its expiration time
+        self._token_expires = 0
+        self._token_lock = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def close(self):
+        """
+        A method used to close the session with all its connections.
+        """
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def _headers(self):
+        token = self.token
+        if self.auth_manager is not None:
+            # the manager blocks on the cache and the token request, so it is
+            # called in a thread and the other requests wait for its token
+            async with self._token_lock:
+                if time.monotonic() >= self._token_expires:
+                    loop = asyncio.get_running_loop()
+                    self._token = await loop.run_in_executor(
+                        None, functools.partial(self.auth_manager.get_access_token,
+                                                as_dict = False))
+                    self._token_expires = time.monotonic() + TOKEN_TTL
+            token = self._token
+        return {'Authorization': 'Bearer ' + token}
+
+    async def _get(self, url, **params):
+        # the session and the lock are created inside the running event loop
+        if self._session is None:
+            connector = aiohttp.TCPConnector(limit = self.max_connections)
+            self._session = aiohttp.ClientSession(
+                connector = connector,
+                timeout = aiohttp.ClientTimeout(total = self.timeout))
+            self._token_lock = asyncio.Lock()
+
+        if not url.startswith('http'):
+            url = self.prefix + url
+        params = {key : value for key, value in params.items() if value is not None}
+
+        for attempt in range(self.max_retries + 1):
+            self.requests += 1
+            headers = await self._headers()
+            try:
+                async with self._session.get(url, params = params,
+                                             headers = headers) as response:
+                    if response.status < 400:
+                        return await response.json()
+
+                    retry = response.status == 429 or response.status >= 500
+                    if not retry or attempt == self.max_retries:
+                        raise SpotifyException(response.status, -1,
+                                               url + ':\n ' + await response.text(),
+                                               headers = dict(response.headers))
+
+                    # wait as long as the api asks, otherwise back off exponentially
+                    delay = response.headers.get('Retry-After')
+                    if delay is not None:
+                        delay = float(delay)
+                    else:
+                        delay = random.uniform(0, 2 ** attempt)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as err:
+                # connection errors and timeouts are retried like 5xx, there is
+                # no http status to report after the last one
+                if attempt == self.max_retries:
+                    raise SpotifyException(-1, -1, '{}:\n {!r}'.format(url, err),
+                                           reason = type(err).__name__) from err
+                delay = random.uniform(0, 2 ** attempt)
+            await asyncio.sleep(delay)
+
+    async def categories(self, country = None, locale = None, limit = 20, offset = 0):
+        return await self._get('browse/categories', country = country, locale = locale,
+                               limit = limit, offset = offset)
+
+    async def category_playlists(self, category_id = None, country = None, limit = 20, offset = 0):
+        return await self._get('browse/categories/' + category_id + '/playlists',
+                               country = country, limit = limit, offset = offset)
+
+    async def playlist_items(self, playlist_id, fields = None, limit = 100, offset = 0,
+                             market = None, additional_types = ('track', 'episode')):
+        return await self._get('playlists/' + playlist_id + '/tracks', fields = fields,
+                               limit = limit, offset = offset, market = market,
+                               additional_types = ','.join(additional_types))
+
+    async def new_releases(self, country = None, limit = 20, offset = 0):
+        return await self._get('browse/new-releases', country = country,
+                               limit = limit, offset = offset)
+
+    async def album_tracks(self, album_id, limit = 50, offset = 0, market = None):
+        return await self._get('albums/' + album_id + '/tracks', limit = limit,
+                               offset = offset, market = market)
+
+    async def tracks(self, tracks, market = None):
+        return await self._get('tracks', ids = ','.join(tracks), market = market)
+
+    async def audio_features(self, tracks = []):
+        results = await self._get('audio-features', ids = ','.join(tracks))
+        # spotipy returns the features as a plain list
+        return results['audio_features']
+
+    async def artists(self, artists):
+        return await self._get('artists', ids = ','.join(artists))
+
+    async def next(self, result):
+        if result['next']:
+            return await self._get(result['next'])
+        return None
@@ -0,0 +1,330 @@
+# Current module provides async versions of the getters for the asyncio client
+# (async_client module). Functions have the same names, arguments and results
+# as the ones of the getters module, but they are coroutines, and instead of
+# a thread pool all the requests of a stage are sent at once - the number of
+# requests in flight is bounded by the connection pool of the client.
+#
+# Usage: asyncio.run(get_releases(AsyncSpotify(auth_manager), country = 'RU'))
+
+
+import asyncio
+from os.path import expanduser
+from tools.fetchers import BATCH_SIZES
+from tools.fetchers import chunkize
+from tools.fetchers import page_urls
+from tools.getters import build_artists_df
+from tools.getters import build_tracks_df
+from tools.utils import unique_items
+from tools.writers import ARTIST_SCHEMA
+from tools.writers import TRACK_SCHEMA
+from tools.writers import export_df
+
+
+async def fetch_all_async(
+        spotify,
+        request,
+        args,
+        key = None
+        ):
+    """
+    A function used to get all the items of several paginated responses
+    (like fetchers.fetch_all). The first pages are requested at once, then all
+    the remaining pages of all the responses.
+
+    Parameters
+    ----------
+    spotify : async_client.AsyncSpotify() instance
+        async Spotify API client with valid credentials
+    request : coroutine function
+        function which takes a single argument (e.g. playlist or album ID) and
+        returns the first page of the response
+    args : list
+        arguments for the request calls
+    key : str
+        name of the field in which the response wraps the paging object
+        (default None - response is the paging object itself)
+
+    Returns
+    -------
+    items : list of lists
+        items of every response in the order of args
+
+    """
+
+    def unwrap(results):
+        return results[key] if key else results
+
+    # get first pages and compute urls of the rest ones
+    pages = [unwrap(results) for results in await asyncio.gather(*map(request, args))]
+    urls = [page_urls(page) for page in pages]
+
+    # get all the remaining pages at once
+    rest = iter(await asyncio.gather(*[spotify.next({'next': url})
+                                       for lst in urls for url in lst]))
+
+    items = []
+    for page, lst in zip(pages, urls):
+        page_items = list(page['items'])
+        for _ in lst:
+            page_items.extend(unwrap(next(rest))['items'])
+        items.append(page_items)
+
+    return items
+
+
+async def fetch_pages_async(
+        spotify,
+        results,
+        key = None
+        ):
+    """
+    A function used to get all the items of a paginated response whose first
+    page is already known (like fetchers.fetch_pages).
+    """
+
+    async def first(results):
+        return results
+
+    return (await fetch_all_async(spotify, first, [results], key))[0]
+
+
+async def fetch_bulk_async(
+        spotify,
+        requests
+        ):
+    """
+    A function used to get objects from several bulk endpoints at once (like
+    fetchers.fetch_bulk).
+
+    Parameters
+    ----------
+    spotify : async_client.AsyncSpotify() instance
+        async Spotify API client with valid credentials
+    requests : dict
+        mapping from the endpoint name to the list of ids
+
+    Returns
+    -------
+    results : dict
+        mapping from the endpoint name to the list of objects in the order
+        of the requested ids (missing objects are None)
+    counts : dict
+        mapping from the endpoint name to the number of requests made
+
+    """
+
+    # every task is a single request to the endpoint
+    tasks = [(endpoint, chunk) for endpoint, ids in requests.items()
+             for chunk in chunkize(ids, BATCH_SIZES[endpoint])]
+
+    async def request(task):
+        endpoint, chunk = task
+        response = await getattr(spotify, endpoint)(chunk)
+        return response if isinstance(response, list) else response[endpoint]
+
+    results = {endpoint : [] for endpoint in requests}
+    counts = {endpoint : 0 for endpoint in requests}
+    for (endpoint, _), objects in zip(tasks, await asyncio.gather(*map(request, tasks))):
+        results[endpoint].extend(objects)
+        counts[endpoint] += 1
+
+    return results, counts
+
+
+async def get_categories(
+        spotify,
+        country = 'US',
+        path = expanduser('~')
+        ):
+    """
+    An async version of getters.get_categories.
+    """
+
+    results = await spotify.categories(country, limit = 50)
+    categories = await fetch_pages_async(spotify, results, 'categories')
+
+    return [cat['id'] for cat in categories]
+
+
+async def get_global_top(
+        spotify,
+        path = expanduser('~'),
+        registry = None
+        ):
+    """
+    An async version of getters.get_global_top.
+    """
+
+    # list with the ID's of top playlists
+    results = await spotify.category_playlists('toplists', country = None)
+    top_playlists_ids = [plst['id'] for plst in results['playlists']['items']]
+
+    tracks_ids = await get_country_top(spotify, top_playlists_ids)
+
+    # Record that the tracks are in the global charts
+    if registry is not None:
+        registry.add('GLobal', tracks_ids)
+
+    return tracks_ids
+
+
+async def get_country_top(
+        spotify,
+        plsts = [],
+        country = None,
+        path = expanduser('~'),
+        registry = None
+        ):
+    """
+    An async version of getters.get_country_top.
+    """
+
+    # Filter array for unique values only (keeping the order of playlists)
+    plsts = list(dict.fromkeys(plsts))
+
+    async def request(id_):
+        return await spotify.playlist_items(id_, additional_types = ['track'])
+
+    itms_list = [] # list for all items from all top playlists
+    for items in await fetch_all_async(spotify, request, plsts):
+        itms_list.extend(items)
+
+    tracks_ids = [track['id'] for track in unique_items([res['track'] for res in itms_list])]
+
+    # Record that the tracks are in the country charts
+    if registry is not None:
+        registry.add(country if country is not None else 'GLobal', tracks_ids)
+
+    return tracks_ids
+
+
+async def get_playlists(
+        spotify,
+        category_ids = ['toplists'],
+        country = None,
+        path = expanduser('~')
+        ):
+    """
+    An async version of getters.get_playlists.
+    """
+
+    # Filter array for unique values only (keeping the order of categories)
+    category_ids = list(dict.fromkeys(category_ids))
+
+    # Collect playlists of all categories at once
+    toplists = []
+    for results in await asyncio.gather(*[spotify.category_playlists(id_, country = country)
+                                          for id_ in category_ids]):
+        toplists.extend(results['playlists']['items'])
+
+    return [top['id'] for top in unique_items(toplists)]
+
+
+async def get_releases(
+        spotify,
+        country = None,
+        path = expanduser('~')
+        ):
+    """
+    An async version of getters.get_releases.
+    """
+
+    results = await spotify.new_releases(country = country, limit = 50)
+    itms_list = await fetch_pages_async(spotify, results, 'albums')
+
+    return [res['id'] for res in unique_items(itms_list)]
+
+
+async def get_albums_tracks(
+        spotify,
+        country = None,
+        albums_ids = [],
+        path = expanduser('~')
+        ):
+    """
+    An async version of getters.get_albums_tracks.
+    """
+
+    # Filter array for unique values only (keeping the order of albums)
+    albums_ids = list(dict.fromkeys(albums_ids))
+
+    async def request(id_):
+        return await spotify.album_tracks(id_, limit = 50)
+
+    itms_list = [] # list for all items from all albums
+    for items in await fetch_all_async(spotify, request, albums_ids):
+        itms_list.extend(items)
+
+    return [res['id'] for res in unique_items(itms_list)]
+
+
+async def get_tracks_info(
+        spotify,
+        country = None,
+        tracks_ids = [],
+        path = expanduser('~'),
+        fmt = 'csv',
+        compression = None,
+        partition = False,
+        registry = None
+        ):
+    """
+    An async version of getters.get_tracks_info.
+    """
+
+    # Filter array for unique values only (the order is kept)
+    tracks_ids = list(dict.fromkeys(tracks_ids))
+
+    # Record the country membership and skip the tracks fetched in the cycle
+    if registry is not None:
+        registry.add(country if country is not None else 'GLobal', tracks_ids)
+        tracks_ids = registry.unfetched(tracks_ids)
+
+    results, _ = await fetch_bulk_async(spotify, {'tracks': tracks_ids,
+                                                  'audio_features': tracks_ids})
+    df = build_tracks_df(results['tracks'], results['audio_features'])
+
+    # only the tracks which came back are fetched
+    if registry is not None:
+        registry.mark_fetched(df.index)
+
+    # Export dataframe to a file
+    name = country if country is not None else 'GLobal'
+    export_df(df, path, name, TRACK_SCHEMA, fmt, compression, partition)
+
+    return df
+
+
+async def get_artists_info(
+        spotify,
+        country = None,
+        artists_ids = [],
+        path = expanduser('~'),
+        fmt = 'csv',
+        compression = None,
+        partition = False,
+        registry = None
+        ):
+    """
+    An async version of getters.get_artists_info.
+    """
+
+    # Filter array for unique values only (the order is kept)
+    artists_ids = list(dict.fromkeys(artists_ids))
+
+    # Skip the artists fetched in the cycle
+    if registry is not None:
+        artists_ids = registry.unfetched(artists_ids, 'artist')
+
+    results, _ = await fetch_bulk_async(spotify, {'artists': artists_ids})
+    df_a = build_artists_df(results['artists'])
+
+    # only the artists which came back are fetched
+    if registry is not None:
+        registry.mark_fetched(df_a.index, 'artist')
+
+    # Export dataframe to a file
+    name = country if country is not None else 'GLobal'
+    export_df(df_a, path, name, ARTIST_SCHEMA, fmt, compression, partition)
+
+    return df_a
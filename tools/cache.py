@@ -0,0 +1,174 @@
+# Current module provides a persistent cache for the responses of the bulk
+# endpoints of the spotify api (tracks, audio features, artists and albums).
+# Objects are stored in a local SQLite file keyed by endpoint and id, so the
+# repeated runs request only the objects which are missing or out of date.
+# Audio features never change, so they are kept forever, while popularity of
+# tracks and artists is refreshed after several hours.
+
+
+import json
+import sqlite3
+import threading
+import time
+from os.path import expanduser
+
+# time to live of the cached objects in seconds for every endpoint (None - forever)
+TTL = {'tracks': 6 * 3600,
+       'audio_features': None,
+       'artists': 6 * 3600,
+       'albums': 7 * 24 * 3600}
+
+
+class CachedSpotify:
+    """
+    A wrapper around the spotify client which answers the bulk requests
+    (tracks, audio_features, artists, albums) from the local cache and
+    requests only the cache misses. All the other methods are passed to the
+    wrapped client as they are.
+
+    Parameters
+    ----------
+    spotify : spotify.client.Spotify() instance
+        Spotify API client with valid credentials
+    file_name : str
+        full name of the cache file (default ~/.spotilyse_cache.sqlite)
+    ttl : dict
+        mapping from the endpoint name to the time to live of its objects
+        in seconds, None means forever (default TTL)
+    max_size : int
+        maximum number of cached objects, least recently used objects are
+        evicted above it (default 1000000)
+    """
+
+    def __init__(
+            self,
+            spotify,
+            file_name = expanduser('~') + '/.spotilyse_cache.sqlite',
+            ttl = TTL,
+            max_size = 1000000
+            ):
+        self.spotify = spotify
+        self.ttl = dict(ttl)
+        self.max_size = max_size
+        # counters of cache hits and misses for every endpoint
+        self.hits = {endpoint : 0 for endpoint in self.ttl}
+        self.misses = {endpoint : 0 for endpoint in self.ttl}
+
+        # connection is shared by the threads of fetchers, so it is guarded by the lock
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(file_name, check_same_thread = False)
+        self._connection.execute("""
+            CREATE TABLE IF NOT EXISTS cache (
+                endpoint TEXT,
+                id TEXT,
+                data TEXT,
+                created REAL,
+                accessed REAL,
+                PRIMARY KEY (endpoint, id)
+            )""")
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)")
+        self._connection.commit()
+
+    def __getattr__(self, name):
+        # all the other methods are served by the wrapped client
+        return getattr(self.spotify, name)
+
+    def tracks(self, tracks, market = None):
+        # objects depend on the market, so such requests are not cached
+        if market is not None:
+            return self.spotify.tracks(tracks, market = market)
+        return {'tracks': self._get('tracks', tracks,
+                                    lambda ids: self.spotify.tracks(ids)['tracks'])}
+
+    def audio_features(self, tracks = []):
+        return self._get('audio_features', tracks, self.spotify.audio_features)
+
+    def artists(self, artists):
+        return {'artists': self._get('artists', artists,
+                                     lambda ids: self.spotify.artists(ids)['artists'])}
+
+    def albums(self, albums, market = None):
+        if market is not None:
+            return self.spotify.albums(albums, market = market)
+        return {'albums': self._get('albums', albums,
+                                    lambda ids: self.spotify.albums(ids)['albums'])}
+
+    def stats(self):
+        """
+        A method used to get the hit and miss counters of the cache.
+
+        Returns
+        -------
+        dict
+            mapping from the endpoint name to the dict with 'hits' and 'misses'
+
+        """
+        return {endpoint : {'hits': self.hits[endpoint], 'misses': self.misses[endpoint]}
+                for endpoint in self.ttl}
+
+    def clear(self, endpoint = None):
+        """
+        A method used to drop cached objects of the endpoint (default None -
+        objects of all endpoints).
+        """
+        with self._lock:
+            if endpoint is None:
+                self._connection.execute("DELETE FROM cache")
+            else:
+                self._connection.execute("DELETE FROM cache WHERE endpoint = ?", (endpoint,))
+            self._connection.commit()
+
+    def close(self):
+        """
+        A method used to close the cache file.
+        """
+        with self._lock:
+            self._connection.close()
+
+    def _get(self, endpoint, ids, request):
+        # get the objects from the cache and request only the missing ones
+        ids = list(ids)
+        now = time.time()
+        ttl = self.ttl.get(endpoint)
+
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT id, data, created FROM cache WHERE endpoint = ? AND id IN (%s)"
+                % ','.join('?' * len(ids)), [endpoint] + ids).fetchall()
+            cached = {id_ : json.loads(data) for id_, data, created in rows
+                      if ttl is None or now - created < ttl}
+            # mark the hits as recently used
+            self._connection.executemany(
+                "UPDATE cache SET accessed = ? WHERE endpoint = ? AND id = ?",
+                [(now, endpoint, id_) for id_ in cached])
+            self.hits[endpoint] = self.hits.get(endpoint, 0) + len(cached)
+
+        # request the misses (keeping the order, duplicates are requested once)
+        missing = list(dict.fromkeys(id_ for id_ in ids if id_ not in cached))
+        if missing:
+            fetched = dict(zip(missing, request(missing)))
+            with self._lock:
+                self.misses[endpoint] = self.misses.get(endpoint, 0) + len(missing)
+                # objects which api did not find are not cached
+                self._connection.executemany(
+                    "INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?, ?)",
+                    [(endpoint, id_, json.dumps(obj), now, now)
+                     for id_, obj in fetched.items() if obj is not None])
+                self._evict()
+            cached.update(fetched)
+        else:
+            with self._lock:
+                self._connection.commit()
+
+        return [cached.get(id_) for id_ in ids]
+
+    def _evict(self):
+        # drop the least recently used objects above the size limit and commit
+        size = self._connection.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+        if size > self.max_size:
+            self._connection.execute(
+                "DELETE FROM cache WHERE rowid IN "
+                "(SELECT rowid FROM cache ORDER BY accessed LIMIT ?)",
+                (size - self.max_size,))
+        self._connection.commit()
@@ -0,0 +1,231 @@
+# Current module provides checkpoints for the long multi-stage fetches. Every
+# completed unit of work (an album with its tracks, a chunk of tracks or audio
+# features) is appended to a local journal file of the job. When the job is run
+# again with the same id, the getters take the completed work from the journal
+# and request only the rest, so a failure near the end of a long run does not
+# lose the work which has already been done.
+
+
+import json
+import os
+import threading
+from os.path import expanduser
+from tools.fetchers import MAX_WORKERS
+from tools.fetchers import fetch_bulk
+from tools.fetchers import fetch_many
+from tools.fetchers import page_urls
+
+
+class Journal:
+    """
+    An append-only journal of the completed work of a job. It is stored as
+    <path><job_id>.journal file with a json record per line.
+
+    Parameters
+    ----------
+    job_id : str
+        id of the job, a rerun with the same id resumes the job
+    path : str
+        path to the directory of the journal file (default
+        os.path.expanduser('~') - user HOME dir)
+    sync_every : int
+        number of records after which the file is synced to the disk
+        (default 100)
+    """
+
+    def __init__(
+            self,
+            job_id,
+            path = expanduser('~'),
+            sync_every = 100
+            ):
+        self.job_id = job_id
+        self.file_name = os.path.join(path, job_id + '.journal')
+        self.sync_every = sync_every
+        self.stages = {} # mapping from the stage to the completed work
+        self._unsynced = 0
+        self._lock = threading.Lock()
+
+        # read the work completed by the previous runs
+        if os.path.exists(self.file_name):
+            with open(self.file_name) as f:
+                for line in f:
+                    try:
+                        stage, key, value = json.loads(line)
+                    except ValueError:
+                        # the last line may be cut by a crash
+                        continue
+                    self.stages.setdefault(stage, {})[key] = value
+
+        self._file = open(self.file_name, 'a')
+
+    def done(self, stage):
+        """
+        A method used to get the completed work of the stage.
+
+        Returns
+        -------
+        dict
+            mapping from the key of the unit of work to its result
+        """
+        return self.stages.setdefault(stage, {})
+
+    def record(self, stage, items):
+        """
+        A method used to append the completed units of work of the stage.
+
+        Parameters
+        ----------
+        stage : str
+            name of the stage, e.g. 'albums'
+        items : dict
+            mapping from the key of the unit of work (e.g. album id) to its
+            json serializable result
+        """
+        with self._lock:
+            for key, value in items.items():
+                self._file.write(json.dumps([stage, key, value]) + '\n')
+                self.stages.setdefault(stage, {})[key] = value
+            self._file.flush()
+            self._unsynced += len(items)
+            if self._unsynced >= self.sync_every:
+                os.fsync(self._file.fileno())
+                self._unsynced = 0
+
+    def close(self):
+        """
+        A method used to sync and close the journal file.
+        """
+        with self._lock:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+
+    def remove(self):
+        """
+        A method used to close and delete the journal of the finished job.
+        """
+        self.close()
+        os.remove(self.file_name)
+
+
+def fetch_all_journaled(
+        spotify,
+        journal,
+        stage,
+        request,
+        args,
+        key = None,
+        max_workers = MAX_WORKERS
+        ):
+    """
+    A function used to get all the items of several paginated responses
+    (like fetchers.fetch_all) skipping the pages recorded in the journal. The
+    first pages are requested concurrently, then all the remaining pages of
+    all the responses are requested concurrently as well, and every page is
+    recorded by its worker as soon as it is received, so a failed run loses
+    only the requests in flight.
+
+    Parameters
+    ----------
+    spotify : spotify.client.Spotify() instance
+        Spotify API client with valid credentials
+    journal : Journal
+        journal of the job
+    stage : str
+        name of the stage in the journal, e.g. 'albums' (first pages are
+        recorded by the id, the rest ones by the url)
+    request : callable
+        function which takes a single argument (e.g. playlist or album ID) and
+        returns the first page of the response
+    args : list of str
+        ids for the request calls
+    key : str
+        name of the field in which the response wraps the paging object
+        (default None - response is the paging object itself)
+    max_workers : int
+        maximum number of concurrent requests (default MAX_WORKERS)
+
+    Returns
+    -------
+    items : list of lists
+        items of every response in the order of args
+
+    """
+
+    done = journal.done(stage)
+
+    def get_page(page_key, request_page):
+        # take the page from the journal or request and record it
+        if page_key not in done:
+            results = request_page()
+            journal.record(stage, {page_key : results[key] if key else results})
+        return done[page_key]
+
+    def get_first(arg):
+        return get_page(arg, lambda: request(arg))
+
+    def get_next(url):
+        return get_page(url, lambda: spotify.next({'next': url}))
+
+    # get first pages and compute urls of the rest ones
+    unique = list(dict.fromkeys(args))
+    pages = fetch_many(get_first, unique, max_workers)
+    urls = [page_urls(page) for page in pages]
+
+    # get all the remaining pages at once
+    rest = iter(fetch_many(get_next, [url for lst in urls for url in lst], max_workers))
+
+    items = {}
+    for arg, page, lst in zip(unique, pages, urls):
+        items[arg] = list(page['items'])
+        for _ in lst:
+            items[arg].extend(next(rest)['items'])
+
+    return [items[arg] for arg in args]
+
+
+def fetch_bulk_journaled(
+        spotify,
+        journal,
+        requests,
+        max_workers = MAX_WORKERS
+        ):
+    """
+    A function used to get objects from several bulk endpoints at once (like
+    fetchers.fetch_bulk) skipping the ids fetched in the journal. Objects are
+    recorded by the stage named after the endpoint as soon as every request
+    completes.
+
+    Parameters
+    ----------
+    spotify : spotify.client.Spotify() instance
+        Spotify API client with valid credentials
+    journal : Journal
+        journal of the job
+    requests : dict
+        mapping from the endpoint name to the list of ids
+    max_workers : int
+        maximum number of concurrent requests (default MAX_WORKERS)
+
+    Returns
+    -------
+    results : dict
+        mapping from the endpoint name to the list of objects in the order
+        of the requested ids (missing objects are None)
+    counts : dict
+        mapping from the endpoint name to the number of requests made
+
+    """
+
+    def record(endpoint, chunk, objects):
+        journal.record(endpoint, dict(zip(chunk, objects)))
+
+    missing = {endpoint : [id_ for id_ in dict.fromkeys(ids) if id_ not in journal.done(endpoint)]
+               for endpoint, ids in requests.items()}
+    _, counts = fetch_bulk(spotify, missing, max_workers, callback = record)
+
+    results = {endpoint : [journal.done(endpoint)[id_] for id_ in ids]
+               for endpoint, ids in requests.items()}
+
+    return results, counts
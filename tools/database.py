@@ -0,0 +1,98 @@
+# Current module provides pooled connections to the Postgres database for the
+# inserters. The pool is configured by a DSN string or, when it is not given,
+# by the SPOTILYSE_DSN environment variable. An empty DSN makes libpq take the
+# connection parameters from the standard PGHOST, PGPORT, PGUSER, PGPASSWORD
+# and PGDATABASE environment variables, so no credentials are kept in the code.
+# Several inserters can share a single transaction scope, so a whole artist +
+# track load is committed at once.
+
+
+import os
+import psycopg2
+from contextlib import contextmanager
+from psycopg2.pool import ThreadedConnectionPool
+
+
+def _dsn(dsn):
+    # the DSN given or the one of the environment
+    if dsn is None:
+        dsn = os.environ.get('SPOTILYSE_DSN', '')
+    return dsn
+
+
+def connect(dsn = None):
+    """
+    A function used to open a single database connection, e.g. for an
+    inserter called without a pool.
+
+    Parameters
+    ----------
+    dsn : str
+        libpq connection string (default None - value of the SPOTILYSE_DSN
+        environment variable)
+
+    Returns
+    -------
+    connection : psycopg2 connection
+        new connection, the caller commits and closes it
+
+    """
+    return psycopg2.connect(_dsn(dsn))
+
+
+def get_pool(
+        dsn = None,
+        minconn = 1,
+        maxconn = 8
+        ):
+    """
+    A function used to create a thread safe pool of database connections.
+
+    Parameters
+    ----------
+    dsn : str
+        libpq connection string, e.g. 'host=localhost dbname=spotilyse'
+        (default None - value of the SPOTILYSE_DSN environment variable)
+    minconn : int
+        number of connections opened at once (default 1)
+    maxconn : int
+        maximum number of connections (default 8)
+
+    Returns
+    -------
+    psycopg2.pool.ThreadedConnectionPool
+        pool of the database connections
+
+    """
+
+    return ThreadedConnectionPool(minconn, maxconn, _dsn(dsn))
+
+
+@contextmanager
+def transaction(pool):
+    """
+    A context manager used to run several inserters in a single transaction.
+    It takes a connection from the pool, commits on exit (or rolls back if
+    an exception is raised) and returns the connection to the pool.
+
+    Parameters
+    ----------
+    pool : psycopg2.pool.ThreadedConnectionPool
+        pool of the database connections
+
+    Yields
+    -------
+    connection : psycopg2 connection
+        connection to pass to the inserters
+
+    """
+
+    connection = pool.getconn()
+    try:
+        yield connection
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        pool.putconn(connection)
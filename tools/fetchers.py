@@ -0,0 +1,263 @@
+# Current module provides a shared layer for fetching paginated responses from
+# the spotify api. Instead of walking the 'next' links one page at a time, the
+# offsets of all remaining pages are computed from the 'total' field of the first
+# response and the pages are requested concurrently through a bounded thread pool.
+# Items are always returned in the same order as the sequential walk would give.
+
+
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse, parse_qs, urlencode
+from tools.metrics import traced
+
+# default number of requests which are allowed to be in flight at the same time
+MAX_WORKERS = 8
+
+
+def page_urls(page):
+    """
+    A function used to compute the urls of all pages which follow the given one.
+
+    Parameters
+    ----------
+    page : dict
+        paging object from the spotify api response (it has to contain 'next',
+        'offset', 'limit' and 'total' fields)
+
+    Returns
+    -------
+    urls : list of str
+        urls of the remaining pages in the order of their offsets
+
+    """
+
+    # the page is the last one
+    if not page['next']:
+        return []
+
+    # take the 'next' url as a template and substitute offsets into it
+    url = urlparse(page['next'])
+    query = parse_qs(url.query)
+
+    urls = []
+    for offset in range(page['offset'] + page['limit'], page['total'], page['limit']):
+        query['offset'] = [str(offset)]
+        urls.append(url._replace(query = urlencode(query, doseq = True)).geturl())
+
+    return urls
+
+
+def fetch_many(
+        request,
+        args,
+        max_workers = MAX_WORKERS
+        ):
+    """
+    A function used to call request for every element of args concurrently.
+
+    Parameters
+    ----------
+    request : callable
+        function which takes a single argument and makes an api request
+    args : list
+        arguments for the request calls
+    max_workers : int
+        maximum number of concurrent requests (default MAX_WORKERS)
+
+    Returns
+    -------
+    list
+        results of the request calls in the order of args
+
+    """
+
+    args = list(args)
+    # there is no sense to start a pool for a single request
+    if len(args) <= 1 or max_workers <= 1:
+        return [request(arg) for arg in args]
+
+    with ThreadPoolExecutor(max_workers = min(max_workers, len(args))) as executor:
+        return list(executor.map(request, args))
+
+
+@traced
+def fetch_all(
+        spotify,
+        request,
+        args,
+        key = None,
+        max_workers = MAX_WORKERS
+        ):
+    """
+    A function used to get all the items of several paginated responses. The first
+    pages are requested concurrently, then all the remaining pages of all the
+    responses are requested concurrently as well.
+
+    Parameters
+    ----------
+    spotify : spotify.client.Spotify() instance
+        Spotify API client with valid credentials
+    request : callable
+        function which takes a single argument (e.g. playlist or album ID) and
+        returns the first page of the response
+    args : list
+        arguments for the request calls
+    key : str
+        name of the field in which the response wraps the paging object,
+        e.g. 'albums' for new releases (default None - response is the paging
+        object itself)
+    max_workers : int
+        maximum number of concurrent requests (default MAX_WORKERS)
+
+    Returns
+    -------
+    items : list of lists
+        items of every response in the order of args; items of a single
+        response are ordered by their offsets
+
+    """
+
+    def unwrap(results):
+        return results[key] if key else results
+
+    def get_page(url):
+        return unwrap(spotify.next({'next': url}))
+
+    # get first pages and compute urls of the rest ones
+    pages = [unwrap(results) for results in fetch_many(request, args, max_workers)]
+    urls = [page_urls(page) for page in pages]
+
+    # get all the remaining pages at once
+    rest = iter(fetch_many(get_page, [url for lst in urls for url in lst], max_workers))
+
+    items = []
+    for page, lst in zip(pages, urls):
+        page_items = list(page['items'])
+        for _ in lst:
+            page_items.extend(next(rest)['items'])
+        items.append(page_items)
+
+    return items
+
+
+def fetch_pages(
+        spotify,
+        results,
+        key = None,
+        max_workers = MAX_WORKERS
+        ):
+    """
+    A function used to get all the items of a paginated response whose first
+    page is already known.
+
+    Parameters
+    ----------
+    spotify : spotify.client.Spotify() instance
+        Spotify API client with valid credentials
+    results : dict
+        first page of the response
+    key : str
+        name of the field in which the response wraps the paging object
+        (default None - response is the paging object itself)
+    max_workers : int
+        maximum number of concurrent requests (default MAX_WORKERS)
+
+    Returns
+    -------
+    list
+        items of all pages ordered by their offsets
+
+    """
+
+    return fetch_all(spotify, lambda r: r, [results], key, max_workers)[0]
+
+
+# maximum number of ids accepted by a single request to the bulk endpoints
+BATCH_SIZES = {'tracks': 50,
+               'audio_features': 100,
+               'artists': 50,
+               'albums': 20}
+
+
+def chunkize(
+        ids,
+        size
+        ):
+    """
+    A function used to split the list of ids into the fewest chunks of
+    length <= size.
+
+    Parameters
+    ----------
+    ids : list of str
+        list of ids
+    size : int
+        maximum length of a chunk
+
+    Returns
+    -------
+    list of lists
+        chunks in the order of ids
+
+    """
+
+    ids = list(ids)
+    return [ids[i:i + size] for i in range(0, len(ids), size)]
+
+
+@traced
+def fetch_bulk(
+        spotify,
+        requests,
+        max_workers = MAX_WORKERS,
+        callback = None
+        ):
+    """
+    A function used to get objects from several bulk endpoints at once. Ids of
+    every endpoint are packed into the fewest requests with respect to the
+    BATCH_SIZES limits and requests of all the endpoints are sent concurrently.
+
+    Parameters
+    ----------
+    spotify : spotify.client.Spotify() instance
+        Spotify API client with valid credentials
+    requests : dict
+        mapping from the endpoint name (a key of BATCH_SIZES, which is also
+        the name of the client method) to the list of ids
+    max_workers : int
+        maximum number of concurrent requests (default MAX_WORKERS)
+    callback : callable
+        function called with the endpoint name, the chunk of ids and the list
+        of objects as soon as every request completes, e.g. to record them in
+        a journal (default None)
+
+    Returns
+    -------
+    results : dict
+        mapping from the endpoint name to the list of objects in the order
+        of the requested ids (missing objects are None)
+    counts : dict
+        mapping from the endpoint name to the number of requests made
+
+    """
+
+    # every task is a single request to the endpoint
+    tasks = [(endpoint, chunk) for endpoint, ids in requests.items()
+             for chunk in chunkize(ids, BATCH_SIZES[endpoint])]
+
+    def request(task):
+        endpoint, chunk = task
+        response = getattr(spotify, endpoint)(chunk)
+        # audio features are returned as a plain list, other objects are
+        # wrapped by the name of the endpoint
+        objects = response if isinstance(response, list) else response[endpoint]
+        if callback is not None:
+            callback(endpoint, chunk, objects)
+        return objects
+
+    results = {endpoint : [] for endpoint in requests}
+    counts = {endpoint : 0 for endpoint in requests}
+    for (endpoint, _), objects in zip(tasks, fetch_many(request, tasks, max_workers)):
+        results[endpoint].extend(objects)
+        counts[endpoint] += 1
+
+    return results, counts
@@ -7,14 +7,81 @@
 
 
 import pandas as pd
-import numpy as np
 from datetime import datetime
 from os.path import expanduser
-
+from tools.checkpoint import fetch_all_journaled
+from tools.checkpoint import fetch_bulk_journaled
+from tools.fetchers import MAX_WORKERS
+from tools.fetchers import fetch_all
+from tools.fetchers import fetch_bulk
+from tools.fetchers import fetch_pages
+from tools.metrics import traced
+from tools.utils import unique_items
+from tools.writers import ARTIST_SCHEMA
+from tools.writers import TRACK_SCHEMA
+from tools.writers import export_df
+
+# audio features columns of the tracks dataframe
+FEATURES_COLUMNS = ['danceability', 'energy', 'key', 'loudness', 'mode',
+                    'speechiness', 'acousticness', 'instrumentalness',
+                    'liveness', 'valence', 'tempo', 'duration_ms',
+                    'time_signature']
+
+# compact types of the tracks dataframe columns (integer types are nullable,
+# as features merged from the database may contain NULL)
+TRACK_DTYPES = {'name': 'string',
+                'artist_id': 'category',
+                'artist_name': 'category',
+                'popularity': 'Int8',
+                'release_date': 'datetime64',
+                'update': 'datetime64',
+                'danceability': 'float32',
+                'energy': 'float32',
+                'key': 'Int8',
+                'loudness': 'float32',
+                'mode': 'Int8',
+                'speechiness': 'float32',
+                'acousticness': 'float32',
+                'instrumentalness': 'float32',
+                'liveness': 'float32',
+                'valence': 'float32',
+                'tempo': 'float32',
+                'duration_ms': 'Int32',
+                'time_signature': 'Int8'}
+
+# compact types of the artists dataframe columns
+ARTIST_DTYPES = {'artist_name': 'string',
+                 'artist_popularity': 'Int8',
+                 'artist_genre': 'category',
+                 'artist_followers': 'Int32',
+                 'update': 'datetime64'}
+
+
+def cast_columns(
+        columns,
+        dtypes
+        ):
+    """
+    A function used to cast the lists of the dataframe columns straight to
+    the compact types (see TRACK_DTYPES), the mapping is changed in place.
+    """
+    
+    for column, dtype in dtypes.items():
+        if dtype == 'datetime64':
+            # release date may have year or month precision only
+            columns[column] = pd.to_datetime(columns[column], format = 'mixed',
+                                             errors = 'coerce')
+        elif dtype == 'category':
+            columns[column] = pd.Categorical(columns[column])
+        else:
+            columns[column] = pd.array(columns[column], dtype = dtype)
+
+@traced
 def get_categories(
         spotify, 
         country = 'US', 
-        path = expanduser('~')
+        path = expanduser('~'),
+        max_workers = MAX_WORKERS
         ):
     """
     A function used to get the .csv file containing stopify categories info
@@ -29,6 +96,8 @@ def get_categories(
     path : str
         path to the directory in which will be saved 
         <country>.csv file (default os.path.expanduser('~') - user HOME dir)
+    max_workers : int
+        maximum number of concurrent requests (default MAX_WORKERS)
         
     Returns
     ----------
@@ -36,13 +105,10 @@ def get_categories(
         a dataframe with country categories information
     """
     # get the results by request
-    results = spotify.categories(country, limit = 50)['categories']
-    categories = results['items'] # list for creating pandas df
+    results = spotify.categories(country, limit = 50)
     
-    # iterate through all possible categories and extend the list
-    while results['next']:
-         results = spotify.next(results)['categories']
-         categories.extend(results['items'])
+    # get all possible categories (list for creating pandas df)
+    categories = fetch_pages(spotify, results, 'categories', max_workers)
          
     # Create a dict for df construction
     cat_dict = {key : [] for key in ['category_name', 'category_id']}
@@ -52,12 +118,16 @@ def get_categories(
          cat_dict['category_name'].append(cat['name'])
          cat_dict['category_id'].append(cat['id'])
     
-    return list(cat_dict['id'])
+    return list(cat_dict['category_id'])
 
 
+@traced
 def get_global_top(
         spotify, 
-        path = expanduser('~')
+        path = expanduser('~'),
+        max_workers = MAX_WORKERS,
+        registry = None,
+        journal = None
         ):
     """
     A function used to get the .csv file containing stopify top tracks from 
@@ -70,6 +140,14 @@ def get_global_top(
     path : str
         path to the directory in which will be saved 
         Global.csv file (default os.path.expanduser('~') - user HOME dir)
+    max_workers : int
+        maximum number of concurrent requests (default MAX_WORKERS)
+    registry : registry.IdRegistry
+        registry in which the country membership of the tracks is recorded
+        (default None)
+    journal : checkpoint.Journal
+        journal of the job, playlists completed by the previous runs of the job
+        are taken from it instead of the api (default None)
         
     Returns
     ----------
@@ -80,32 +158,42 @@ def get_global_top(
     top_playlists_ids = [plst['id'] for plst in spotify.category_playlists('toplists', country = None)['playlists']['items']]
     # list for all items from all top playlists
     itms_list = []
-    # fill items list
-    for id_ in top_playlists_ids:
-        results = spotify.playlist_items(id_, additional_types = ['track'])
-        itms_list.extend(results['items'])
-        while results['next']:
-            results = spotify.next(results)
-            itms_list.extend(results['items'])
+    # request of the first page of a playlist
+    def request(id_):
+        return spotify.playlist_items(id_, additional_types = ['track'])
+    # fill items list (playlists completed by the previous runs are skipped)
+    if journal is not None:
+        responses = fetch_all_journaled(spotify, journal, 'playlists', request,
+                                        top_playlists_ids, max_workers = max_workers)
+    else:
+        responses = fetch_all(spotify, request, top_playlists_ids, max_workers = max_workers)
+    for items in responses:
+        itms_list.extend(items)
     
     # Create a dict for df construction
     track_dict = {key : [] for key in ['id', 'name']} 
     
     # Fill the tracks list with top songs
-    for res in itms_list:
-        if res['track'] is not None:
-            if res['track']['id'] not in track_dict['id']:
-                track_dict['id'].append(res['track']['id'])
-                track_dict['name'].append(res['track']['name'])
+    for track in unique_items([res['track'] for res in itms_list]):
+        track_dict['id'].append(track['id'])
+        track_dict['name'].append(track['name'])
+    
+    # Record that the tracks are in the global charts
+    if registry is not None:
+        registry.add('GLobal', track_dict['id'])
     
     return list(track_dict['id'])
 
 
+@traced
 def get_country_top(
         spotify, 
         plsts = [], 
         country = None, 
-        path = expanduser('~')
+        path = expanduser('~'),
+        max_workers = MAX_WORKERS,
+        registry = None,
+        journal = None
         ):
     """
     A function used to get the top chart for a certain country. Chart is based
@@ -124,6 +212,14 @@ def get_country_top(
     path : str
         path to the directory in which will be saved 
         <country>.csv file (default os.path.expanduser('~') - user HOME dir)
+    max_workers : int
+        maximum number of concurrent requests (default MAX_WORKERS)
+    registry : registry.IdRegistry
+        registry in which the country membership of the tracks is recorded
+        (default None)
+    journal : checkpoint.Journal
+        journal of the job, playlists completed by the previous runs of the job
+        are taken from it instead of the api (default None)
 
     Returns
     -------
@@ -132,32 +228,39 @@ def get_country_top(
 
     """
     
-    # Filter array for unique values only
-    plsts = list(set(plsts))
+    # Filter array for unique values only (keeping the order of playlists)
+    plsts = list(dict.fromkeys(plsts))
     
     # list for all items from all top playlists
     itms_list = []
-    # fill items list
-    for id_ in plsts:
-        results = spotify.playlist_items(id_, additional_types = ['track'])
-        itms_list.extend(results['items'])
-        while results['next']:
-            results = spotify.next(results)
-            itms_list.extend(results['items'])
+    # request of the first page of a playlist
+    def request(id_):
+        return spotify.playlist_items(id_, additional_types = ['track'])
+    # fill items list (playlists completed by the previous runs are skipped)
+    if journal is not None:
+        responses = fetch_all_journaled(spotify, journal, 'playlists', request,
+                                        plsts, max_workers = max_workers)
+    else:
+        responses = fetch_all(spotify, request, plsts, max_workers = max_workers)
+    for items in responses:
+        itms_list.extend(items)
     
     # Create a dict for df construction
     track_dict = {key : [] for key in ['id', 'name']} 
     
     # Fill the tracks list with top songs
-    for res in itms_list:
-        if res['track'] is not None:
-            if res['track']['id'] not in track_dict['id']:
-                track_dict['id'].append(res['track']['id'])
-                track_dict['name'].append(res['track']['name'])
+    for track in unique_items([res['track'] for res in itms_list]):
+        track_dict['id'].append(track['id'])
+        track_dict['name'].append(track['name'])
+
+    # Record that the tracks are in the country charts
+    if registry is not None:
+        registry.add(country if country is not None else 'GLobal', track_dict['id'])
 
     return list(track_dict['id'])
 
 
+@traced
 def get_playlists(
         spotify, 
         category_ids = ['toplists'],
@@ -186,27 +289,32 @@ def get_playlists(
         a dataframe with global playlists compilation
     """
     
-    # Filter array for unique values only
-    category_ids = list(set(category_ids))
+    # Filter array for unique values only (keeping the order of categories)
+    category_ids = list(dict.fromkeys(category_ids))
     
      # Create a playlists dict for df construction
     plst_dict = {key : [] for key in [ 'name', 'id']}
     
-    # Fill the plst dict
+    toplists = [] # list for playlists from all categories
+    
+    # Collect playlists of all categories
     for id_ in category_ids:
-        toplists = spotify.category_playlists(id_, country = country)['playlists']['items']
-        for top in toplists:
-            if top['id'] not in plst_dict['id']:
-                plst_dict['id'].append(top['id'])
-                plst_dict['name'].append(top['name'])
+        toplists.extend(spotify.category_playlists(id_, country = country)['playlists']['items'])
+    
+    # Fill the plst dict
+    for top in unique_items(toplists):
+        plst_dict['id'].append(top['id'])
+        plst_dict['name'].append(top['name'])
      
     return list(plst_dict['id'])
 
 
+@traced
 def get_releases(
         spotify, 
         country = None, 
-        path = expanduser('~')
+        path = expanduser('~'),
+        max_workers = MAX_WORKERS
         ):
     """
     A function used to get the .csv file containing stopify new releases albums
@@ -221,6 +329,8 @@ def get_releases(
     path : str
         path to the directory in which will be saved 
         <country>.csv file (default os.path.expanduser('~') - user HOME dir)
+    max_workers : int
+        maximum number of concurrent requests (default MAX_WORKERS)
         
     Returns
     ----------
@@ -231,30 +341,27 @@ def get_releases(
     # Create a playlists dict for df construction
     albums_dict = {key : [] for key in [ 'name', 'id', 'release_date']}
    
-    itms_list = [] # list for all albums from new releases
-    
-    # get all new releases from api
-    results = spotify.new_releases(country = country, limit = 50)['albums']
-    itms_list.extend(results['items'])
-    while results['next']:
-        results = spotify.next(results)['albums']
-        itms_list.extend(results['items'])
+    # get all new releases from api (list for all albums from new releases)
+    results = spotify.new_releases(country = country, limit = 50)
+    itms_list = fetch_pages(spotify, results, 'albums', max_workers)
             
     # fill albums_dict with new releases
-    for res in itms_list:
-        if res['id'] not in albums_dict['id']:
-            albums_dict['id'].append(res['id'])
-            albums_dict['name'].append(res['name'])
-            albums_dict['release_date'].append(res['release_date'])  
+    for res in unique_items(itms_list):
+        albums_dict['id'].append(res['id'])
+        albums_dict['name'].append(res['name'])
+        albums_dict['release_date'].append(res['release_date'])  
     
     return list(albums_dict['id'])
 
 
+@traced
 def get_albums_tracks(
         spotify, 
         country = None,
         albums_ids = [],
-        path = expanduser('~')
+        path = expanduser('~'),
+        max_workers = MAX_WORKERS,
+        journal = None
         ): 
     """
     A function used to get the .csv file containing stopify new releases albums
@@ -271,6 +378,11 @@ def get_albums_tracks(
     path : str
         path to the directory in which will be saved 
         <country>.csv file (default os.path.expanduser('~') - user HOME dir)
+    max_workers : int
+        maximum number of concurrent requests (default MAX_WORKERS)
+    journal : checkpoint.Journal
+        journal of the job, albums completed by the previous runs of the job
+        are taken from it instead of the api (default None)
         
     Returns
     ----------
@@ -278,36 +390,45 @@ def get_albums_tracks(
         a dataframe with new track info for all albums from albums_ids
     """
     
-    # Filter array for unique values only
-    albums_ids = list(set(albums_ids))
+    # Filter array for unique values only (keeping the order of albums)
+    albums_ids = list(dict.fromkeys(albums_ids))
     
     itms_list = [] # list for all items from all top playlists
-    # fill items list
-    for id_ in albums_ids:
-        results = spotify.album_tracks(id_, limit = 50)
-        itms_list.extend(results['items'])
-        while results['next']:
-            results = spotify.next(results)
-            itms_list.extend(results['items'])
+    # request of the first page of an album
+    def request(id_):
+        return spotify.album_tracks(id_, limit = 50)
+    # fill items list (albums completed by the previous runs are skipped)
+    if journal is not None:
+        responses = fetch_all_journaled(spotify, journal, 'albums', request,
+                                        albums_ids, max_workers = max_workers)
+    else:
+        responses = fetch_all(spotify, request, albums_ids, max_workers = max_workers)
+    for items in responses:
+        itms_list.extend(items)
             
     # Create a dict for df construction
     track_dict = {key : [] for key in ['id', 'name']} 
     
     # Fill the tracks list with top songs
-    for res in itms_list:
-        if res is not None:
-            if res['id'] not in track_dict['id']:
-                track_dict['id'].append(res['id'])
-                track_dict['name'].append(res['name'])  
+    for res in unique_items(itms_list):
+        track_dict['id'].append(res['id'])
+        track_dict['name'].append(res['name'])  
     
     return list(track_dict['id'])
 
 
+@traced
 def get_tracks_info(
         spotify, 
         country = None,
         tracks_ids = [],
-        path = expanduser('~')
+        path = expanduser('~'),
+        max_workers = MAX_WORKERS,
+        fmt = 'csv',
+        compression = None,
+        partition = False,
+        registry = None,
+        journal = None
         ): 
     """
     A function used to get the .csv file containing various track information
@@ -324,6 +445,22 @@ def get_tracks_info(
     path : str
         path to the directory in which will be saved 
         <country>.csv file (default os.path.expanduser('~') - user HOME dir)
+    max_workers : int
+        maximum number of concurrent requests (default MAX_WORKERS)
+    fmt : str
+        output format - 'csv', 'parquet' or 'feather' (default 'csv')
+    compression : str
+        compression codec of the output file (default None - default of
+        the format)
+    partition : bool
+        write the file into country=<country>/update=<date>/ subdirectory
+        of path (default False)
+    registry : registry.IdRegistry
+        registry of the current cycle, ids already fetched in it are skipped,
+        so the dataframe contains only the new ones (default None)
+    journal : checkpoint.Journal
+        journal of the job, objects completed by the previous runs of the job
+        are taken from it instead of the api (default None)
         
     Returns
     ----------
@@ -331,52 +468,30 @@ def get_tracks_info(
         a dataframe with new track info for all albums from albums_ids
     """
     
-    # Filter array for unique values only
-    tracks_ids = list(set(tracks_ids))
+    # Filter array for unique values only (the order is kept)
+    tracks_ids = list(dict.fromkeys(tracks_ids))
     
-    # Chunkize list with ids because spotify.tracks() gen take just <= 50 elems
-    ids_chnkd_np = np.array_split(np.array(tracks_ids), len(tracks_ids) // 50 + 1) 
-    ids_chnkd = [list(array) for array in ids_chnkd_np]
+    # Record the country membership and skip the tracks fetched in the cycle
+    if registry is not None:
+        registry.add(country if country is not None else 'GLobal', tracks_ids)
+        tracks_ids = registry.unfetched(tracks_ids)
     
-    tracks_lst = [] # list of tracks general info
-    features_lst = [] # list of the tracks features
-    # fill the lists 
-    for chunk in ids_chnkd:
-        tracks_lst.extend(spotify.tracks(chunk)['tracks'])
-        features_lst.extend(spotify.audio_features(chunk))
-                
-    # Create a dict for tracks general info df construction
-    track_dict = {key : [] for key in ['id', 'name',
-                                       'artist_id', 'artist_name',
-                                       'popularity', 'release_date', 
-                                       'update']}
-    
-    # Create dataframe with track features
-    df_f = pd.DataFrame(features_lst, columns = ['id', 'danceability', 'energy',
-                                       'key', 'loudness',
-                                       'mode', 'speechiness',
-                                       'acousticness', 'instrumentalness',
-                                       'liveness', 'valence', 
-                                       'tempo', 'duration_ms',
-                                       'time_signature'])
-    df_f = df_f.set_index('id')
-    
-    # Fill the tracks dict
-    for t in tracks_lst:
-        track_dict['id'].append(t['id'])
-        track_dict['name'].append(t['name'])
-        track_dict['artist_id'].append(t['artists'][0]['id'])
-        track_dict['artist_name'].append(t['artists'][0]['name'])
-        track_dict['popularity'].append(t['popularity'])
-        track_dict['release_date'].append(t['album']['release_date'])
-        track_dict['update'].append(datetime.today().strftime('%Y-%m-%d'))
-
-    # Create a dataframe with tracks general info
-    df_t = pd.DataFrame(track_dict)
-    df_t = df_t.set_index('id')
-    
-    # Merge two datasets by indexes
-    df = pd.merge(df_t, df_f, left_index=True, right_index=True)
+    # get tracks general info and features at once (ids are chunkized
+    # with respect to the batch limit of every endpoint)
+    requests = {'tracks': tracks_ids, 'audio_features': tracks_ids}
+    if journal is not None:
+        results, _ = fetch_bulk_journaled(spotify, journal, requests, max_workers)
+    else:
+        results, _ = fetch_bulk(spotify, requests, max_workers)
+    tracks_lst = results['tracks'] # list of tracks general info
+    features_lst = results['audio_features'] # list of the tracks features
+    
+    # Create a dataframe with track info and features
+    df = build_tracks_df(tracks_lst, features_lst)
+    
+    # Only the tracks which came back are fetched
+    if registry is not None:
+        registry.mark_fetched(df.index)
     
     # Construct the name of a file
     if country is None:
@@ -384,17 +499,71 @@ def get_tracks_info(
     else:
         name = country
     
-    # Export dataframe to a csv file
-    df.to_csv(path + name + '.csv', index = False)   
+    # Export dataframe to a file
+    export_df(df, path, name, TRACK_SCHEMA, fmt, compression, partition)   
                   
     return df
 
 
+@traced
+def build_tracks_df(
+        tracks_lst,
+        features_lst
+        ):
+    """
+    A function used to construct the tracks dataframe from the api responses.
+    
+    Parameters
+    ----------
+    tracks_lst : list of dict
+        track objects from spotify.tracks() responses
+    features_lst : list of dict
+        audio features objects from spotify.audio_features() responses
+        
+    Returns
+    ----------
+    pandas.DataFrame
+        a dataframe with track info and features indexed by track id, 
+        tracks without features are dropped
+    """
+    
+    # features of the tracks by id (features of some tracks can be missing)
+    features = {f['id'] : f for f in features_lst if f is not None}
+    # tracks with features only
+    tracks = [t for t in unique_items(tracks_lst) if t['id'] in features]
+    
+    # Create a dict for df construction, all the columns follow the order of
+    # tracks, so they are aligned by construction and no merge is needed
+    track_dict = {'name': [t['name'] for t in tracks],
+                  'artist_id': [t['artists'][0]['id'] for t in tracks],
+                  'artist_name': [t['artists'][0]['name'] for t in tracks],
+                  'popularity': [t['popularity'] for t in tracks],
+                  'release_date': [t['album']['release_date'] for t in tracks],
+                  'update': [datetime.today().strftime('%Y-%m-%d')] * len(tracks)}
+    for column in FEATURES_COLUMNS:
+        track_dict[column] = [features[t['id']][column] for t in tracks]
+    
+    # Cast the lists straight to the compact column types
+    cast_columns(track_dict, TRACK_DTYPES)
+    
+    # Create a dataframe with track info and features
+    return pd.DataFrame(track_dict,
+                        index = pd.Index([t['id'] for t in tracks], name = 'id'),
+                        copy = False)
+
+
+@traced
 def get_artists_info(
         spotify, 
         country = None,
         artists_ids = [],
-        path = expanduser('~')
+        path = expanduser('~'),
+        max_workers = MAX_WORKERS,
+        fmt = 'csv',
+        compression = None,
+        partition = False,
+        registry = None,
+        journal = None
         ): 
     """
     A function used to get the .csv file containing various artists information
@@ -411,6 +580,22 @@ def get_artists_info(
     path : str
         path to the directory in which will be saved 
         <country>.csv file (default os.path.expanduser('~') - user HOME dir)
+    max_workers : int
+        maximum number of concurrent requests (default MAX_WORKERS)
+    fmt : str
+        output format - 'csv', 'parquet' or 'feather' (default 'csv')
+    compression : str
+        compression codec of the output file (default None - default of
+        the format)
+    partition : bool
+        write the file into country=<country>/update=<date>/ subdirectory
+        of path (default False)
+    registry : registry.IdRegistry
+        registry of the current cycle, ids already fetched in it are skipped,
+        so the dataframe contains only the new ones (default None)
+    journal : checkpoint.Journal
+        journal of the job, objects completed by the previous runs of the job
+        are taken from it instead of the api (default None)
         
     Returns
     ----------
@@ -418,40 +603,27 @@ def get_artists_info(
         a dataframe with new track info for all albums from albums_ids
     """
     
-    # Filter array for unique values only
-    artists_ids = list(set(artists_ids))
+    # Filter array for unique values only (the order is kept)
+    artists_ids = list(dict.fromkeys(artists_ids))
     
-    # Chunkize list with ids because spotify.tracks() gen take just <= 50 elems
-    ids_chnkd_np = np.array_split(np.array(artists_ids), len(artists_ids) // 50 + 1) 
-    ids_chnkd = [list(array) for array in ids_chnkd_np]
+    # Skip the artists fetched in the cycle
+    if registry is not None:
+        artists_ids = registry.unfetched(artists_ids, 'artist')
     
-    artists_lst = [] # list of tracks general info
-    # fill the lists 
-    for chunk in ids_chnkd:
-        artists_lst.extend(spotify.artists(chunk)['artists'])
-                        
-    # Create a dict for tracks general info df construction
-    artists_dict = {key : [] for key in ['artist_id', 'artist_name',
-                                       'artist_popularity', 'artist_genre',
-                                       'artist_followers', 'update']}
+    # get artists info (ids are chunkized with respect to the batch limit)
+    requests = {'artists': artists_ids}
+    if journal is not None:
+        results, _ = fetch_bulk_journaled(spotify, journal, requests, max_workers)
+    else:
+        results, _ = fetch_bulk(spotify, requests, max_workers)
+    artists_lst = results['artists'] # list of artists info
     
-    # Fill the artists dict
-    for a in artists_lst:
-        if a['id'] not in artists_dict['artist_id']:
-            artists_dict['artist_id'].append(a['id'])
-            artists_dict['artist_name'].append(a['name'])
-            artists_dict['artist_popularity'].append(a['popularity'])
-            artists_dict['artist_followers'].append(a['followers']['total'])
-            artists_dict['update'].append(datetime.today().strftime('%Y-%m-%d'))
-            # genres can be empty
-            if a['genres']:
-                artists_dict['artist_genre'].append(a['genres'][0])
-            else:
-                artists_dict['artist_genre'].append(None)
-            
-    # Create a dataframe with tracks general info
-    df_a = pd.DataFrame(artists_dict)
-    df_a = df_a.set_index('artist_id')
+    # Create a dataframe with artists info
+    df_a = build_artists_df(artists_lst)
+    
+    # Only the artists which came back are fetched
+    if registry is not None:
+        registry.mark_fetched(df_a.index, 'artist')
     
     # Construct the name of a file
     if country is None:
@@ -459,12 +631,54 @@ def get_artists_info(
     else:
         name = country
     
-    # Export dataframe to a csv file
-    df_a.to_csv(path + name + '.csv', index = False)
+    # Export dataframe to a file
+    export_df(df_a, path, name, ARTIST_SCHEMA, fmt, compression, partition)
                   
     return df_a
 
 
+@traced
+def build_artists_df(artists_lst):
+    """
+    A function used to construct the artists dataframe from the api responses.
+    
+    Parameters
+    ----------
+    artists_lst : list of dict
+        artist objects from spotify.artists() responses
+        
+    Returns
+    ----------
+    pandas.DataFrame
+        a dataframe with artists info indexed by artist id
+    """
+                        
+    # Create a dict for tracks general info df construction
+    artists_dict = {key : [] for key in ['artist_id', 'artist_name',
+                                       'artist_popularity', 'artist_genre',
+                                       'artist_followers', 'update']}
+    
+    # Fill the artists dict
+    for a in unique_items(artists_lst):
+        artists_dict['artist_id'].append(a['id'])
+        artists_dict['artist_name'].append(a['name'])
+        artists_dict['artist_popularity'].append(a['popularity'])
+        artists_dict['artist_followers'].append(a['followers']['total'])
+        artists_dict['update'].append(datetime.today().strftime('%Y-%m-%d'))
+        # genres can be empty
+        if a['genres']:
+            artists_dict['artist_genre'].append(a['genres'][0])
+        else:
+            artists_dict['artist_genre'].append(None)
+            
+    # Cast the lists straight to the compact column types
+    cast_columns(artists_dict, ARTIST_DTYPES)
+    index = pd.Index(artists_dict.pop('artist_id'), name = 'artist_id')
+    
+    # Create a dataframe with artists info
+    return pd.DataFrame(artists_dict, index = index, copy = False)
+
+
 
 
 
@@ -0,0 +1,224 @@
+# Current module provides the popularity history of tracks and artists. The
+# track and artist tables keep the last values only, while the history tables
+# (see sql/create_all.sql) keep a row per id and date: daily snapshots appended
+# by the loader of this module and the changed rows appended by the inserters
+# with history = True. History tables are partitioned by month, so the queries
+# of a date range read only its partitions and old months can be detached or
+# dropped at once. Snapshots are streamed with COPY and never touch the track
+# and artist tables, so the main upsert path is not slowed down.
+
+
+import io
+from datetime import date, timedelta
+import pandas as pd
+from tools.metrics import count
+from tools.metrics import span
+
+# history tables of the dataframes: the name of the table, its id column and
+# the mapping from the dataframe columns to the table columns with their types
+HISTORY = {'track': {'table': 'track_history',
+                     'key': 'track_id',
+                     'columns': {'popularity': 'popularity'},
+                     'dtypes': {'popularity': 'Int8'}},
+           'artist': {'table': 'artist_history',
+                      'key': 'artist_id',
+                      'columns': {'artist_popularity': 'popularity',
+                                  'artist_followers': 'followers'},
+                      'dtypes': {'popularity': 'Int8',
+                                 'followers': 'Int32'}}}
+
+
+def ensure_partitions(
+        cursor,
+        table,
+        dates
+        ):
+    """
+    A function used to create the monthly partitions of the history table
+    which are missing for the given dates.
+
+    Parameters
+    ----------
+    cursor : psycopg2 cursor
+        database cursor
+    table : str
+        name of the partitioned table
+    dates : iterable of datetime.date or datetime.datetime
+        dates of the rows to insert
+    """
+
+    months = {pd.Timestamp(day).date().replace(day = 1) for day in dates}
+    for month in sorted(months):
+        partition = '{}_{:%Y_%m}'.format(table, month)
+        # the check does not lock the parent table, so an existing
+        # partition costs a single lookup
+        cursor.execute('SELECT to_regclass(%s)', (partition,))
+        if cursor.fetchone()[0] is not None:
+            continue
+        end = (month + timedelta(days = 32)).replace(day = 1)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS {partition} PARTITION OF {table}
+            FOR VALUES FROM (%s) TO (%s)
+                       """.format(partition = partition, table = table),
+                       (month, end))
+
+
+def append_history(
+        connection,
+        df,
+        kind = 'track',
+        day = None,
+        dedupe = True
+        ):
+    """
+    A function used to append the snapshot of the popularity (and followers)
+    of the dataframe to the history table. Nothing is commited here.
+
+    Parameters
+    ----------
+    connection : psycopg2 connection
+        database connection
+    df : pandas.DataFrame
+        tracks dataframe (see getters.get_tracks_info) or artists dataframe
+        (see getters.get_artists_info) indexed by id
+    kind : str
+        'track' or 'artist' (default 'track')
+    day : datetime.date
+        date of the snapshot (default None - today)
+    dedupe : bool
+        skip the ids which already have a row for the day, so a repeated load
+        of the same day does not duplicate rows (default True - otherwise the
+        rows are copied straight into the table)
+
+    Returns
+    -------
+    int
+        number of appended rows
+
+    """
+
+    spec = HISTORY[kind]
+    table = spec['table']
+    day = day or date.today()
+
+    # csv of the snapshot in the order of the table columns
+    snapshot = df[list(spec['columns'])].rename(columns = spec['columns'])
+    snapshot.insert(0, spec['key'], df.index.astype(str))
+    snapshot['date'] = day
+    buffer = io.StringIO()
+    snapshot.to_csv(buffer, index = False, header = False)
+    buffer.seek(0)
+
+    cols = ', '.join(snapshot.columns)
+    cursor = connection.cursor()
+    with span('append_history', table = table):
+        ensure_partitions(cursor, table, [day])
+        if not dedupe:
+            cursor.copy_expert('COPY {} ({}) FROM STDIN WITH (FORMAT csv)'.format(table, cols),
+                               buffer)
+            appended = len(snapshot)
+        else:
+            staging = table + '_staging'
+            cursor.execute("""CREATE TEMP TABLE {staging}
+                              (LIKE {table}) ON COMMIT DROP
+                           """.format(staging = staging, table = table))
+            cursor.copy_expert('COPY {} ({}) FROM STDIN WITH (FORMAT csv)'.format(staging, cols),
+                               buffer)
+            cursor.execute("""
+                INSERT INTO {table} ({cols})
+                SELECT DISTINCT ON ({key}) {cols} FROM {staging} s
+                WHERE NOT EXISTS (SELECT 1 FROM {table} h
+                                  WHERE h.{key} = s.{key} AND h.date = s.date)
+                           """.format(table = table, cols = cols, key = spec['key'],
+                                      staging = staging))
+            appended = cursor.rowcount
+            cursor.execute('DROP TABLE {}'.format(staging))
+    cursor.close()
+
+    count('history_rows', appended, table = table)
+    return appended
+
+
+def popularity_series(
+        connection,
+        ids,
+        kind = 'track',
+        start = None,
+        end = None,
+        fill = False
+        ):
+    """
+    A function used to get the popularity time series of the ids.
+
+    Parameters
+    ----------
+    connection : psycopg2 connection
+        database connection
+    ids : list of str
+        track or artist ids
+    kind : str
+        'track' or 'artist' (default 'track')
+    start : datetime.date
+        first date of the series (default None - from the first row)
+    end : datetime.date
+        date after the last date of the series (default None - up to the
+        last row)
+    fill : bool
+        return a row for every day from the first date of every id to the
+        last date of the series, the missing days take the last known values
+        (history of the changed rows has gaps by design) (default False)
+
+    Returns
+    -------
+    pandas.DataFrame
+        a dataframe with id (category), date, popularity (and followers for
+        artists) columns ordered by id and date
+
+    """
+
+    spec = HISTORY[kind]
+    values = list(spec['dtypes'])
+
+    # the series are streamed from the database as csv, date bounds are
+    # literals, so the partitions out of the range are pruned by the planner
+    cursor = connection.cursor()
+    conditions = ['{} = ANY(%s)'.format(spec['key'])]
+    params = [list(ids)]
+    if start is not None:
+        conditions.append('date >= %s')
+        params.append(start)
+    if end is not None:
+        conditions.append('date < %s')
+        params.append(end)
+    query = cursor.mogrify("""
+        COPY (SELECT {key} AS id, date, {values} FROM {table}
+              WHERE {conditions}
+              ORDER BY {key}, date)
+        TO STDOUT WITH (FORMAT csv, HEADER true)
+                           """.format(key = spec['key'], values = ', '.join(values),
+                                      table = spec['table'],
+                                      conditions = ' AND '.join(conditions)),
+                           params).decode()
+    buffer = io.StringIO()
+    with span('popularity_series', table = spec['table']):
+        cursor.copy_expert(query, buffer)
+    cursor.close()
+    buffer.seek(0)
+
+    df = pd.read_csv(buffer, dtype = dict(spec['dtypes'], id = 'category'),
+                     parse_dates = ['date'])
+    # a snapshot and a changed row may share the same day
+    df = df.drop_duplicates(['id', 'date'], keep = 'last')
+
+    if fill and len(df):
+        days = pd.date_range(df['date'].min(), df['date'].max(), name = 'date')
+        filled = []
+        for column in values:
+            # a column per id, the days before the first row of an id stay empty
+            wide = df.pivot(index = 'date', columns = 'id', values = column).reindex(days)
+            filled.append(wide.ffill().stack().rename(column))
+        df = pd.concat(filled, axis = 1).dropna(how = 'all').reset_index()
+        df = df[['id', 'date'] + values].astype(spec['dtypes'])
+        df['id'] = df['id'].astype('category')
+
+    return df.sort_values(['id', 'date'], ignore_index = True)
@@ -0,0 +1,443 @@
+# Current module provides a binary file format for the id lists handed off
+# between the stages (e.g. ids of the released albums), which replaces the yaml
+# configs for large lists. A file is a 16-byte header followed by the ids as
+# fixed-width 16-byte records (see tools/ids.py), so it is written and read in
+# chunks, appended to without rewriting and counted by its size. A sorted file
+# (the header flag) is its own index: membership is a binary search over the
+# memory-mapped records. Set operations across lists (e.g. union of the
+# countries) sort the inputs externally in chunks and merge them chunk by
+# chunk, so no list is loaded as a whole. Small human-edited configs stay in
+# yaml (see utils.write_yaml and read_yaml).
+
+
+import os
+import shutil
+import tempfile
+import numpy as np
+from tools.ids import ID_DTYPE
+from tools.ids import IdArray
+from tools.ids import decode
+from tools.ids import encode
+
+# magic bytes and version of the format
+MAGIC = b'SPTIDS'
+VERSION = 1
+
+# size of the header and of a record in bytes
+HEADER_SIZE = 16
+RECORD_SIZE = ID_DTYPE.itemsize
+
+# header flag of the sorted files without duplicates
+SORTED = 1
+
+# number of ids read or merged at once
+CHUNK_SIZE = 1 << 16
+
+# records compared as byte strings (the big-endian bytes order is the
+# numeric order of the ids)
+_KEY = np.dtype('S%d' % RECORD_SIZE)
+
+
+def _header(flags = 0):
+    return MAGIC + bytes([VERSION, flags]) + bytes(HEADER_SIZE - len(MAGIC) - 2)
+
+
+def _read_flags(f):
+    header = f.read(HEADER_SIZE)
+    if len(header) < HEADER_SIZE or not header.startswith(MAGIC):
+        raise ValueError('not an id list file: ' + f.name)
+    if header[len(MAGIC)] != VERSION:
+        raise ValueError('unsupported id list version: {}'.format(header[len(MAGIC)]))
+    return header[len(MAGIC) + 1]
+
+
+def _values(ids):
+    # binary values of the ids given as str or as IdArray
+    if isinstance(ids, IdArray):
+        return ids.values
+    return encode(ids)
+
+
+class IdListWriter:
+    """
+    A writer of the id list file, ids are written as they come, e.g.
+    with IdListWriter(file_name) as writer: writer.write(ids).
+
+    Parameters
+    ----------
+    file_name : str
+        full name of the file
+    append : bool
+        append to the existing file instead of replacing it (default False)
+    ordered : bool
+        the ids are written in the ascending order without duplicates, so the
+        file is marked as sorted (default False)
+    """
+
+    def __init__(self, file_name, append = False, ordered = False):
+        self.file_name = file_name
+        self.count = 0 # number of the written ids
+        if append and os.path.exists(file_name):
+            self._file = open(file_name, 'r+b')
+            flags = _read_flags(self._file)
+            # a partial record of the interrupted write is dropped
+            size = os.path.getsize(file_name) - HEADER_SIZE
+            self._file.truncate(HEADER_SIZE + size - size % RECORD_SIZE)
+            if flags & SORTED:
+                # appended ids may break the order
+                self._file.seek(0)
+                self._file.write(_header(flags & ~SORTED))
+            self._file.seek(0, os.SEEK_END)
+        else:
+            self._file = open(file_name, 'wb')
+            self._file.write(_header(SORTED if ordered else 0))
+
+    def write(self, ids):
+        """
+        A method used to write the ids (list of str or IdArray).
+        """
+        values = _values(ids)
+        self._file.write(np.ascontiguousarray(values).tobytes())
+        self.count += len(values)
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def write_ids(
+        file_name,
+        ids,
+        append = False
+        ):
+    """
+    A function used to write the list of ids to the file.
+
+    Parameters
+    ----------
+    file_name : str
+        full name of the file
+    ids : iterable of str or IdArray
+        ids to write
+    append : bool
+        append to the existing file (default False)
+    """
+    with IdListWriter(file_name, append) as writer:
+        writer.write(ids)
+
+
+def count_ids(file_name):
+    """
+    A function used to get the number of ids in the file without reading them.
+    """
+    return (os.path.getsize(file_name) - HEADER_SIZE) // RECORD_SIZE
+
+
+def is_sorted(file_name):
+    """
+    A function used to check whether the file is sorted (see sort_ids).
+    """
+    with open(file_name, 'rb') as f:
+        return bool(_read_flags(f) & SORTED)
+
+
+def iter_chunks(
+        file_name,
+        chunk_size = CHUNK_SIZE
+        ):
+    """
+    A generator used to read the binary values of the ids by chunks.
+
+    Yields
+    -------
+    numpy.ndarray
+        array of at most chunk_size ID_DTYPE values
+
+    """
+    with open(file_name, 'rb') as f:
+        _read_flags(f)
+        while True:
+            data = f.read(chunk_size * RECORD_SIZE)
+            # a partial record of the interrupted write is dropped
+            data = data[:len(data) - len(data) % RECORD_SIZE]
+            if not data:
+                break
+            yield np.frombuffer(data, dtype = ID_DTYPE)
+
+
+def iter_ids(
+        file_name,
+        chunk_size = CHUNK_SIZE
+        ):
+    """
+    A generator used to read the ids from the file by chunks.
+
+    Parameters
+    ----------
+    file_name : str
+        full name of the file
+    chunk_size : int
+        number of ids of every chunk (default CHUNK_SIZE)
+
+    Yields
+    -------
+    list of str
+        ids of the chunk
+
+    """
+    for values in iter_chunks(file_name, chunk_size):
+        yield decode(values).tolist()
+
+
+def read_ids(file_name):
+    """
+    A function used to read all the ids from the file (the replacement of
+    utils.read_yaml for the id lists).
+
+    Returns
+    -------
+    list of str
+        ids in the order of writing
+
+    """
+    return [id_ for ids in iter_ids(file_name) for id_ in ids]
+
+
+def contains(
+        file_name,
+        ids
+        ):
+    """
+    A function used to check which ids are present in the file. A sorted file
+    is searched by the binary search over its memory-mapped records, an
+    unsorted one is scanned by chunks.
+
+    Parameters
+    ----------
+    file_name : str
+        full name of the file
+    ids : list of str or IdArray
+        ids to look up
+
+    Returns
+    -------
+    numpy.ndarray
+        boolean mask of the ids present in the file
+
+    """
+
+    values = _values(ids)
+    keys = values.view(_KEY)
+    if is_sorted(file_name):
+        if not count_ids(file_name):
+            return np.zeros(len(keys), dtype = bool)
+        records = np.memmap(file_name, dtype = _KEY, mode = 'r', offset = HEADER_SIZE,
+                            shape = (count_ids(file_name),))
+        positions = np.minimum(np.searchsorted(records, keys), len(records) - 1)
+        return records[positions] == keys
+
+    found = np.zeros(len(keys), dtype = bool)
+    ids = IdArray(values)
+    for chunk in iter_chunks(file_name):
+        found |= ids.isin(IdArray(chunk))
+    return found
+
+
+def _sorted_chunks(values_iter):
+    # sorted chunks of the stream of the sorted arrays without the duplicates
+    # across the chunk boundaries
+    last = None
+    for values in values_iter:
+        if last is not None and len(values) and values[0] == last:
+            values = values[1:]
+        if len(values):
+            last = values[-1]
+            yield values
+
+
+def _merge(left, right, operation):
+    # merge of two streams of sorted unique key chunks, the chunks of the
+    # result are computed up to the smaller of the last keys of both buffers
+    left, right = iter(left), iter(right)
+    a = next(left, None)
+    b = next(right, None)
+    while a is not None and b is not None:
+        bound = min(a[-1], b[-1])
+        i = np.searchsorted(a, bound, side = 'right')
+        j = np.searchsorted(b, bound, side = 'right')
+        if operation == 'union':
+            part = np.union1d(a[:i], b[:j])
+        elif operation == 'intersection':
+            part = np.intersect1d(a[:i], b[:j], assume_unique = True)
+        else:
+            part = np.setdiff1d(a[:i], b[:j], assume_unique = True)
+        if len(part):
+            yield part
+        a, b = a[i:], b[j:]
+        if not len(a):
+            a = next(left, None)
+        if not len(b):
+            b = next(right, None)
+
+    # the rest of one of the streams
+    if operation == 'union' or (operation == 'difference' and a is not None):
+        rest, stream = (a, left) if a is not None else (b, right)
+        while rest is not None:
+            if len(rest):
+                yield rest
+            rest = next(stream, None)
+
+
+def _write_keys(file_name, chunks):
+    with IdListWriter(file_name, ordered = True) as writer:
+        for keys in chunks:
+            writer.write(IdArray(keys.view(ID_DTYPE)))
+
+
+def _sorted_keys(file_name, chunk_size):
+    return _sorted_chunks(values.view(_KEY) for values in iter_chunks(file_name, chunk_size))
+
+
+def sort_ids(
+        file_name,
+        out_name = None,
+        chunk_size = 1 << 20
+        ):
+    """
+    A function used to sort the ids of the file and drop the duplicates by the
+    external sort: sorted runs of chunk_size ids are written to temporary
+    files and merged pairwise, so at most a few chunks are in memory.
+
+    Parameters
+    ----------
+    file_name : str
+        full name of the file
+    out_name : str
+        full name of the sorted file (default None - the file is replaced)
+    chunk_size : int
+        number of ids sorted in memory at once (default 2 ** 20)
+
+    Returns
+    -------
+    str
+        full name of the sorted file
+
+    """
+
+    out_name = out_name or file_name
+    if is_sorted(file_name):
+        if out_name != file_name:
+            shutil.copyfile(file_name, out_name)
+        return out_name
+
+    directory = tempfile.mkdtemp(dir = os.path.dirname(os.path.abspath(out_name)))
+    try:
+        runs = []
+        for values in iter_chunks(file_name, chunk_size):
+            runs.append(os.path.join(directory, 'run{}'.format(len(runs))))
+            _write_keys(runs[-1], [np.unique(values.view(_KEY))])
+
+        # pairwise merges of the runs
+        while len(runs) > 1:
+            merged = []
+            for left, right in zip(runs[::2], runs[1::2]):
+                merged.append(left + 'm')
+                _write_keys(merged[-1], _merge(_sorted_keys(left, CHUNK_SIZE),
+                                               _sorted_keys(right, CHUNK_SIZE), 'union'))
+                os.remove(left)
+                os.remove(right)
+            runs = merged + runs[len(merged) * 2:]
+
+        if runs:
+            os.replace(runs[0], out_name)
+        else:
+            _write_keys(out_name, [])
+    finally:
+        shutil.rmtree(directory, ignore_errors = True)
+
+    return out_name
+
+
+def _combine(
+        operation,
+        file_names,
+        out_name,
+        chunk_size
+        ):
+    # sort the inputs (sorted files are used as they are) and merge them
+    directory = tempfile.mkdtemp(dir = os.path.dirname(os.path.abspath(out_name)))
+    try:
+        inputs = []
+        for i, file_name in enumerate(file_names):
+            if not is_sorted(file_name):
+                file_name = sort_ids(file_name, os.path.join(directory, str(i)), chunk_size)
+            inputs.append(file_name)
+
+        stream = _sorted_keys(inputs[0], CHUNK_SIZE)
+        for file_name in inputs[1:]:
+            stream = _merge(stream, _sorted_keys(file_name, CHUNK_SIZE), operation)
+        temp = os.path.join(directory, 'out')
+        _write_keys(temp, stream)
+        os.replace(temp, out_name)
+    finally:
+        shutil.rmtree(directory, ignore_errors = True)
+
+    return out_name
+
+
+def union(
+        file_names,
+        out_name,
+        chunk_size = 1 << 20
+        ):
+    """
+    A function used to write the sorted distinct ids of all the files, e.g.
+    the tracks of all the countries.
+
+    Parameters
+    ----------
+    file_names : list of str
+        full names of the input files
+    out_name : str
+        full name of the output file
+    chunk_size : int
+        number of ids sorted in memory at once (default 2 ** 20)
+
+    Returns
+    -------
+    str
+        full name of the output file
+
+    """
+    return _combine('union', file_names, out_name, chunk_size)
+
+
+def intersection(
+        file_names,
+        out_name,
+        chunk_size = 1 << 20
+        ):
+    """
+    A function used to write the sorted ids present in all the files.
+    Parameters are the same as in union.
+    """
+    return _combine('intersection', file_names, out_name, chunk_size)
+
+
+def difference(
+        file_name,
+        other_names,
+        out_name,
+        chunk_size = 1 << 20
+        ):
+    """
+    A function used to write the sorted ids of the file absent in all the
+    other files, e.g. the tracks which are new since the previous run.
+    Parameters are the same as in union.
+    """
+    return _combine('difference', [file_name] + list(other_names), out_name, chunk_size)
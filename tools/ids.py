@@ -0,0 +1,385 @@
+# Current module provides a compact binary codec of the spotify ids. An id is
+# a base62 string of 22 characters encoding a 128-bit number, so it fits into
+# 16 bytes (big-endian, so the bytes order is the numeric order and the bytes
+# are a valid UUID) instead of 70+ bytes of a python str. IdArray keeps ids as
+# a NumPy array of such values and implements the dedup, set operations and
+# joins by hashing a single uint64 key of every id (pandas hash tables), the
+# rare key collisions are detected and resolved by an exact sort. Encoding and
+# decoding are vectorized: digits are combined into groups of five, so the
+# 128-bit arithmetic takes a few whole-array operations per group. The codec
+# pays off on millions of ids (see bench.py --ids), so it serves the id list
+# files (see tools/idlists.py) and the benchmark, while the pipeline keeps the
+# str ids, its lists are deduplicated faster by dict.fromkeys.
+
+
+import uuid
+import numpy as np
+import pandas as pd
+
+# digits of the spotify base62 ids in the order of their values
+ALPHABET = '0123456789abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ'
+
+# length of the spotify ids
+ID_LENGTH = 22
+
+# binary ids are 16 bytes
+ID_DTYPE = np.dtype('V16')
+
+# values of the characters (-1 for the characters out of the alphabet)
+_VALUES = np.full(256, -1, dtype = np.int8)
+_VALUES[np.frombuffer(ALPHABET.encode(), dtype = np.uint8)] = np.arange(62)
+_CHARS = np.frombuffer(ALPHABET.encode(), dtype = np.uint8)
+
+# the digits are processed by groups of five (62 ** 5 < 2 ** 30, so a group
+# times a 32-bit limb fits into uint64), the first group has two digits
+_GROUPS = [slice(0, 2)] + [slice(i, i + 5) for i in range(2, ID_LENGTH, 5)]
+
+# number of ids converted at once, so the intermediate arrays stay in the cache
+CHUNK_SIZE = 1 << 15
+
+# multiplier mixing both halves of an id into the hash key
+_MIX = np.uint64(0x9E3779B97F4A7C15)
+
+
+def encode_id(id_):
+    """
+    A function used to encode a single id into 16 bytes.
+    """
+    if len(id_) != ID_LENGTH:
+        raise ValueError('invalid spotify id: {!r}'.format(id_))
+    value = 0
+    for char in id_:
+        digit = ALPHABET.find(char)
+        if digit < 0:
+            raise ValueError('invalid spotify id: {!r}'.format(id_))
+        value = value * 62 + digit
+    if value >> 128:
+        raise ValueError('invalid spotify id: {!r}'.format(id_))
+    return value.to_bytes(16, 'big')
+
+
+def decode_id(value):
+    """
+    A function used to decode 16 bytes into the id.
+    """
+    value = int.from_bytes(bytes(value), 'big')
+    chars = []
+    for _ in range(ID_LENGTH):
+        value, digit = divmod(value, 62)
+        chars.append(ALPHABET[digit])
+    return ''.join(reversed(chars))
+
+
+def encode(ids):
+    """
+    A function used to encode the ids into the array of 16-byte values.
+
+    Parameters
+    ----------
+    ids : iterable of str
+        spotify ids
+
+    Returns
+    -------
+    numpy.ndarray
+        array of the ID_DTYPE values
+
+    """
+
+    strings = np.asarray(ids if isinstance(ids, np.ndarray) else list(ids))
+    if strings.dtype.kind == 'O':
+        strings = strings.astype(str)
+    # the fixed-width cast truncates the longer ids, so they are looked for
+    # before it (shorter ones are padded and rejected by _encode_chunk)
+    width = strings.dtype.itemsize // (4 if strings.dtype.kind == 'U' else 1)
+    if strings.dtype.kind in 'US' and width > ID_LENGTH:
+        longer = np.flatnonzero(np.char.str_len(strings) > ID_LENGTH)
+        if len(longer):
+            id_ = strings[longer[0]]
+            raise ValueError('invalid spotify id: {!r}'.format(
+                id_.decode(errors = 'replace') if isinstance(id_, bytes) else str(id_)))
+    strings = strings.astype('S%d' % ID_LENGTH)
+    halves = np.empty((len(strings), 2), dtype = '>u8')
+    for start in range(0, len(strings), CHUNK_SIZE):
+        _encode_chunk(strings[start:start + CHUNK_SIZE], halves[start:start + CHUNK_SIZE])
+    return halves.view(ID_DTYPE).ravel()
+
+
+def _encode_chunk(strings, halves):
+    n = len(strings)
+    # shorter ids are padded by zero bytes, which are out of the alphabet
+    digits = _VALUES[strings.view(np.uint8).reshape(n, ID_LENGTH)]
+    invalid = (digits < 0).any(axis = 1)
+    digits = digits.astype(np.uint64)
+
+    # 128-bit values as four 32-bit limbs (the lowest first) in uint64
+    limbs = np.zeros((4, n), dtype = np.uint64)
+    overflow = np.zeros(n, dtype = bool)
+    for group in _GROUPS:
+        carry = digits[:, group.start]
+        for i in range(group.start + 1, group.stop):
+            carry = carry * np.uint64(62) + digits[:, i]
+        multiplier = np.uint64(62 ** (group.stop - group.start))
+        for k in range(4):
+            value = limbs[k] * multiplier + carry
+            limbs[k] = value & np.uint64(0xFFFFFFFF)
+            carry = value >> np.uint64(32)
+        overflow |= carry != 0
+
+    invalid |= overflow
+    if invalid.any():
+        raise ValueError('invalid spotify id: {!r}'.format(
+            strings[np.flatnonzero(invalid)[0]].decode(errors = 'replace')))
+
+    # big-endian 16 bytes
+    halves[:, 0] = limbs[3] << np.uint64(32) | limbs[2]
+    halves[:, 1] = limbs[1] << np.uint64(32) | limbs[0]
+
+
+def decode(values):
+    """
+    A function used to decode the array of 16-byte values into the ids.
+
+    Parameters
+    ----------
+    values : numpy.ndarray
+        array of the ID_DTYPE values
+
+    Returns
+    -------
+    numpy.ndarray
+        array of the ids (str)
+
+    """
+
+    halves = np.ascontiguousarray(values).view('>u8').reshape(-1, 2)
+    chars = np.empty((len(halves), ID_LENGTH), dtype = np.uint8)
+    for start in range(0, len(halves), CHUNK_SIZE):
+        _decode_chunk(halves[start:start + CHUNK_SIZE], chars[start:start + CHUNK_SIZE])
+    return chars.view('S%d' % ID_LENGTH).ravel().astype(str)
+
+
+def _decode_chunk(halves, chars):
+    halves = halves.astype(np.uint64)
+    n = len(halves)
+    limbs = [halves[:, 1] & np.uint64(0xFFFFFFFF), halves[:, 1] >> np.uint64(32),
+             halves[:, 0] & np.uint64(0xFFFFFFFF), halves[:, 0] >> np.uint64(32)]
+
+    for group in reversed(_GROUPS):
+        width = group.stop - group.start
+        divisor = np.uint64(62 ** width)
+        # long division of the 128-bit values by the group base
+        remainder = np.zeros(n, dtype = np.uint64)
+        for k in range(3, -1, -1):
+            limbs[k], remainder = np.divmod(remainder << np.uint64(32) | limbs[k], divisor)
+        # digits of the group fit into int64
+        remainder = remainder.astype(np.int64)
+        for i in range(group.stop - 1, group.start - 1, -1):
+            remainder, digit = np.divmod(remainder, 62)
+            chars[:, i] = _CHARS[digit]
+
+
+def to_uuid(id_):
+    """
+    A function used to convert the id to the UUID, e.g. for a UUID key column
+    (psycopg2.extras.register_uuid() makes psycopg2 pass UUID parameters).
+    """
+    return uuid.UUID(bytes = encode_id(id_))
+
+
+def from_uuid(value):
+    """
+    A function used to convert the UUID back to the id.
+    """
+    return decode_id(value.bytes)
+
+
+class IdArray:
+    """
+    An array of the binary ids with the dedup, set operations and joins.
+
+    Parameters
+    ----------
+    values : numpy.ndarray
+        array of the ID_DTYPE values (see encode)
+    """
+
+    def __init__(self, values):
+        self.values = np.asarray(values, dtype = ID_DTYPE)
+
+    @classmethod
+    def from_ids(cls, ids):
+        """
+        A method used to create the array from the ids (str).
+        """
+        return cls(encode(ids))
+
+    def to_ids(self):
+        """
+        A method used to get the list of the ids (str).
+        """
+        return decode(self.values).tolist()
+
+    def to_uuids(self):
+        """
+        A method used to get the list of the UUIDs of the ids.
+        """
+        return [uuid.UUID(bytes = value.tobytes()) for value in self.values]
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, item):
+        if isinstance(item, (int, np.integer)):
+            return decode_id(self.values[item].tobytes())
+        return IdArray(self.values[item])
+
+    def __contains__(self, id_):
+        return bool((self.values == np.frombuffer(encode_id(id_), dtype = ID_DTYPE)[0]).any())
+
+    @property
+    def nbytes(self):
+        return self.values.nbytes
+
+    def _halves(self):
+        return np.ascontiguousarray(self.values).view('>u8').reshape(-1, 2).astype(np.uint64)
+
+    def factorize(self):
+        """
+        A method used to number the distinct ids in the order of their first
+        occurrence.
+
+        Returns
+        -------
+        codes : numpy.ndarray
+            number of the distinct id of every element
+        first : numpy.ndarray
+            index of the first occurrence of every distinct id
+
+        """
+
+        halves = self._halves()
+        with np.errstate(over = 'ignore'):
+            key = halves[:, 0] * _MIX ^ halves[:, 1]
+        codes, _ = pd.factorize(key)
+        # codes are numbered in the order of the first occurrence, so a new
+        # code is greater than all the previous ones
+        seen = np.maximum.accumulate(codes)
+        new = np.ones(len(codes), dtype = bool)
+        new[1:] = codes[1:] > seen[:-1]
+        first = np.flatnonzero(new)
+
+        # different ids with the same key are resolved exactly
+        if (halves != halves[first[codes]]).any():
+            _, first, codes = np.unique(self.values, return_index = True,
+                                        return_inverse = True)
+            order = np.argsort(first, kind = 'stable')
+            rank = np.empty_like(order)
+            rank[order] = np.arange(len(order))
+            codes, first = rank[codes.ravel()], first[order]
+
+        return codes, first
+
+    def unique(self):
+        """
+        A method used to drop the duplicates, the first occurrences are kept
+        in their order.
+        """
+        _, first = self.factorize()
+        return IdArray(self.values[first])
+
+    def _factorize_with(self, other):
+        # common numbering of the ids of both arrays
+        codes, first = IdArray(np.concatenate([self.values, other.values])).factorize()
+        return codes[:len(self)], codes[len(self):], len(first)
+
+    def isin(self, other):
+        """
+        A method used to get the mask of the ids present in the other array.
+        """
+        codes, other_codes, size = self._factorize_with(other)
+        present = np.zeros(size, dtype = bool)
+        present[other_codes] = True
+        return present[codes]
+
+    def union(self, other):
+        """
+        A method used to get the distinct ids of both arrays (the order of the
+        first occurrence).
+        """
+        return IdArray(np.concatenate([self.values, other.values])).unique()
+
+    def intersection(self, other):
+        """
+        A method used to get the distinct ids present in both arrays.
+        """
+        return IdArray(self.values[self.isin(other)]).unique()
+
+    def difference(self, other):
+        """
+        A method used to get the distinct ids absent in the other array.
+        """
+        return IdArray(self.values[~self.isin(other)]).unique()
+
+    def join(self, other):
+        """
+        A method used to find the position of every id in the other array
+        (the hash join of the ids, e.g. to align the rows of two dataframes).
+
+        Parameters
+        ----------
+        other : IdArray
+            ids of the other side, if an id occurs several times the last
+            occurrence is taken
+
+        Returns
+        -------
+        numpy.ndarray
+            position of every id in the other array, -1 if it is absent
+
+        """
+
+        codes, other_codes, size = self._factorize_with(other)
+        positions = np.full(size, -1, dtype = np.int64)
+        positions[other_codes] = np.arange(len(other))
+        return positions[codes]
+
+
+def _is_valid(id_):
+    try:
+        encode_id(id_)
+    except (ValueError, UnicodeEncodeError):
+        return False
+    return True
+
+
+def unique_ids(ids):
+    """
+    A function used to drop the duplicated, empty (None, NaN) and invalid ids,
+    the first occurrences are kept in their order. It is meant for the large
+    lists of ids, small ones are deduplicated faster by dict.fromkeys.
+
+    Parameters
+    ----------
+    ids : iterable of str
+        spotify ids
+
+    Returns
+    -------
+    list of str
+        the distinct valid ids
+
+    """
+
+    ids = [id_ for id_ in ids if isinstance(id_, str) and len(id_) == ID_LENGTH]
+    if not ids:
+        return []
+    try:
+        values = encode(ids)
+    except (ValueError, UnicodeEncodeError):
+        # characters out of the alphabet are rare, so they are looked for
+        # only when the encoding fails
+        ids = [id_ for id_ in ids if _is_valid(id_)]
+        values = encode(ids)
+    _, first = IdArray(values).factorize()
+    return [ids[i] for i in first.tolist()]
@@ -0,0 +1,218 @@
+# Current module provides an incremental mode of the tracks and artists getters.
+# Ids already stored in the database are looked up before fetching: audio features
+# never change, so they are requested only for the unseen tracks, while popularity
+# and followers are refreshed only for the rows checked earlier than the given
+# age (the checked column is set by every load, while update moves only when
+# the values change). Rows which are fresh enough are not fetched and not
+# returned at all.
+
+
+from datetime import timedelta
+from os.path import expanduser
+from tools.fetchers import MAX_WORKERS
+from tools.fetchers import fetch_bulk
+from tools.getters import FEATURES_COLUMNS
+from tools.getters import build_artists_df
+from tools.getters import build_tracks_df
+from tools.writers import ARTIST_SCHEMA
+from tools.writers import TRACK_SCHEMA
+from tools.writers import export_df
+
+
+def select_known(
+        connection,
+        table,
+        ids,
+        max_age,
+        columns = []
+        ):
+    """
+    A function used to get the rows of the table which already contain given ids.
+
+    Parameters
+    ----------
+    connection : psycopg2 connection
+        database connection
+    table : str
+        name of the table ('track' or 'artist')
+    ids : list of str
+        ids to look up
+    max_age : datetime.timedelta
+        rows checked (loaded) earlier than max_age ago are stale, the age is
+        computed by the database clock, which set the checked column
+    columns : list of str
+        additional columns to select
+
+    Returns
+    -------
+    known : dict
+        mapping from the id to the dict with 'fresh' flag and selected columns
+
+    """
+
+    cursor = connection.cursor()
+    cursor.execute("""
+        SELECT id, checked >= now() - %s::interval AS fresh{columns}
+        FROM {table}
+        WHERE id = ANY(%s)
+                   """.format(columns = ''.join(', ' + col for col in columns),
+                              table = table),
+                   (max_age, list(ids)))
+    names = [desc[0] for desc in cursor.description]
+    known = {row[0] : dict(zip(names[1:], row[1:])) for row in cursor.fetchall()}
+    cursor.close()
+
+    return known
+
+
+def refresh_tracks_info(
+        spotify,
+        connection,
+        country = None,
+        tracks_ids = [],
+        path = expanduser('~'),
+        max_age = timedelta(days = 1),
+        max_workers = MAX_WORKERS,
+        fmt = 'csv',
+        compression = None,
+        partition = False
+        ):
+    """
+    A function used to get the .csv file containing track information only for
+    the tracks which are new or stale in the track table.
+
+    Parameters
+    ----------
+    spotify : spotify.client.Spotify() instance
+        Spotify API client with valid credentials
+    connection : psycopg2 connection
+        database connection
+    country : str
+        ISO 3166-1 alpha-2 country code (default 'US')
+    tracks_ids : list of str
+        array with track ID's
+    path : str
+        path to the directory in which will be saved
+        <country>.csv file (default os.path.expanduser('~') - user HOME dir)
+    max_age : datetime.timedelta
+        tracks checked earlier than max_age ago are refreshed (default 1 day)
+    max_workers : int
+        maximum number of concurrent requests (default MAX_WORKERS)
+    fmt : str
+        output format - 'csv', 'parquet' or 'feather' (default 'csv')
+    compression : str
+        compression codec of the output file (default None - default of
+        the format)
+    partition : bool
+        write the file into country=<country>/update=<date>/ subdirectory
+        of path (default False)
+
+    Returns
+    ----------
+    pandas.DataFrame
+        a dataframe with info of new and stale tracks, features of the stale
+        ones are taken from the database
+
+    """
+
+    # Filter array for unique values only (the order is kept)
+    tracks_ids = list(dict.fromkeys(tracks_ids))
+
+    known = select_known(connection, 'track', tracks_ids, max_age, FEATURES_COLUMNS)
+    new = [id_ for id_ in tracks_ids if id_ not in known]
+    stale = [id_ for id_ in tracks_ids if id_ in known and not known[id_]['fresh']]
+
+    # popularity is refreshed for all of them, features are requested for new only
+    results, _ = fetch_bulk(spotify,
+                            {'tracks': new + stale, 'audio_features': new},
+                            max_workers)
+
+    # features of the stale tracks are stored in the database
+    features_lst = results['audio_features']
+    for id_ in stale:
+        features = {col : known[id_][col] for col in FEATURES_COLUMNS}
+        features['id'] = id_
+        features_lst.append(features)
+
+    df = build_tracks_df(results['tracks'], features_lst)
+
+    # Construct the name of a file
+    if country is None:
+        name = 'GLobal'
+    else:
+        name = country
+
+    # Export dataframe to a file
+    export_df(df, path, name, TRACK_SCHEMA, fmt, compression, partition)
+
+    return df
+
+
+def refresh_artists_info(
+        spotify,
+        connection,
+        country = None,
+        artists_ids = [],
+        path = expanduser('~'),
+        max_age = timedelta(days = 1),
+        max_workers = MAX_WORKERS,
+        fmt = 'csv',
+        compression = None,
+        partition = False
+        ):
+    """
+    A function used to get the .csv file containing artists information only for
+    the artists which are new or stale in the artist table.
+
+    Parameters
+    ----------
+    spotify : spotify.client.Spotify() instance
+        Spotify API client with valid credentials
+    connection : psycopg2 connection
+        database connection
+    country : str
+        ISO 3166-1 alpha-2 country code (default 'US')
+    artists_ids : list of str
+        array with artist ID's
+    path : str
+        path to the directory in which will be saved
+        <country>.csv file (default os.path.expanduser('~') - user HOME dir)
+    max_age : datetime.timedelta
+        artists checked earlier than max_age ago are refreshed (default 1 day)
+    max_workers : int
+        maximum number of concurrent requests (default MAX_WORKERS)
+    fmt : str
+        output format - 'csv', 'parquet' or 'feather' (default 'csv')
+    compression : str
+        compression codec of the output file (default None - default of
+        the format)
+    partition : bool
+        write the file into country=<country>/update=<date>/ subdirectory
+        of path (default False)
+
+    Returns
+    ----------
+    pandas.DataFrame
+        a dataframe with info of new and stale artists
+
+    """
+
+    # Filter array for unique values only (the order is kept)
+    artists_ids = list(dict.fromkeys(artists_ids))
+
+    known = select_known(connection, 'artist', artists_ids, max_age)
+    ids = [id_ for id_ in artists_ids if id_ not in known or not known[id_]['fresh']]
+
+    results, _ = fetch_bulk(spotify, {'artists': ids}, max_workers)
+    df_a = build_artists_df(results['artists'])
+
+    # Construct the name of a file
+    if country is None:
+        name = 'GLobal'
+    else:
+        name = country
+
+    # Export dataframe to a file
+    export_df(df_a, path, name, ARTIST_SCHEMA, fmt, compression, partition)
+
+    return df_a
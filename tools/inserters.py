@@ -1,37 +1,564 @@
 # Current module provides an ability to insert the data coolected from the spotify api
 # to the Postgres database. For each table (artist and track) exists its own inserter 
-# function. 
+# function. Inserters can either send rows in batches or stream the whole dataframe
+# into a temporary staging table with COPY and upsert it by a single query.
+# Inserters may get a connection from the pool (see database module), in that
+# case the caller owns the transaction, so several inserters are committed at once,
+# otherwise they open their own connection by the DSN (no credentials are kept in
+# the code). Large loads may be committed in batches of records.
+# Records are prepared from the whole dataframe columns at once: values are rounded
+# and casted to the column types and rows violating the CHECK constraints of the
+# tables (see sql/create_all.sql) are rejected before sending. The values of
+# existing rows are rewritten only if their popularity (or followers) is
+# changed, so update is the time of the last change and the changed rows may
+# be appended to the history tables as well. The checked column of all the
+# loaded rows is set to the time of the load, so the incremental getters (see
+# incremental module) know when a row was fetched last, changed or not.
 
+import csv
+import io
 import psycopg2
 import pandas
+from psycopg2.extras import execute_values
+from tools.database import connect
+from tools.history import ensure_partitions
+from tools.metrics import count
+from tools.metrics import span
+from tools.metrics import traced
 
+# columns of the tables in the order of inserted records
+ARTIST_COLUMNS = ['id', 'name', 'popularity', 'genre', 'followers', 'update']
+TRACK_COUNTRY_COLUMNS = ['track_id', 'country', 'update']
+TRACK_COLUMNS = ['id', 'name', 'artist_id', 'popularity', 'release_date', 'update',
+                 'danceability', 'energy', 'key', 'loudness', 'mode', 
+                 'speechiness', 'acousticness', 'instrumentalness', 'liveness',
+                 'valence', 'tempo', 'duration_ms', 'time_signature']
+
+# unquoted csv value read by COPY as NULL (a quoted one is a string)
+COPY_NULL = r'\N'
+
+# error of the rows rejected before sending (see prepare_records)
+BOUNDS_ERROR = 'value out of the CHECK constraint bounds'
+
+# names of the artist dataframe columns in the artist table
+ARTIST_NAMES = {'artist_name': 'name',
+                'artist_popularity': 'popularity',
+                'artist_genre': 'genre',
+                'artist_followers': 'followers'}
+
+# bounds of the values allowed by the CHECK constraints (None - no bound)
+ARTIST_CHECKS = {'popularity': (0, 100)}
+TRACK_CHECKS = {'popularity': (0, 100),
+                'danceability': (0, 1),
+                'energy': (0, 1),
+                'key': (-1, 11),
+                'loudness': (-60, 0),
+                'speechiness': (0, 1),
+                'acousticness': (0, 1),
+                'instrumentalness': (0, 1),
+                'liveness': (0, 1),
+                'valence': (0, 1),
+                'tempo': (0, 1000),
+                'duration_ms': (1, None),
+                'time_signature': (3, 7)}
+
+# number of decimals kept for the float columns
+TRACK_DECIMALS = {'danceability': 3,
+                  'energy': 3,
+                  'loudness': 3,
+                  'speechiness': 3,
+                  'acousticness': 3,
+                  'instrumentalness': 7,
+                  'liveness': 3,
+                  'valence': 3,
+                  'tempo': 3}
+
+# types of the integer and boolean columns (nullable pandas types)
+ARTIST_DTYPES = {'popularity': 'Int16',
+                 'followers': 'Int32'}
+TRACK_DTYPES = {'popularity': 'Int16',
+                'key': 'Int16',
+                'mode': 'boolean',
+                'duration_ms': 'Int32',
+                'time_signature': 'Int16'}
+
+
+@traced
+def prepare_records(
+        df,
+        columns,
+        checks = {},
+        decimals = {},
+        dtypes = {}
+        ):
+    """
+    A function used to prepare records for insertion by whole column operations.
+    Rows with values out of the checks bounds are rejected (missing values pass,
+    as NULL passes a CHECK constraint), float columns are rounded, other columns
+    are casted to dtypes and missing values are replaced by None.
+    
+    Parameters
+    ----------
+    df : pandas.DataFrame()
+        dataframe with a column for each of columns
+    columns : list of str
+        names of the table columns in the order of record values
+    checks : dict
+        mapping from the column name to its (lower, upper) bounds
+    decimals : dict
+        mapping from the column name to the number of decimals
+    dtypes : dict
+        mapping from the column name to its pandas type
+        
+    Returns
+    -------
+    records : list of tuples
+        records ready to be sent to the database
+    invalid : numpy.ndarray
+        boolean mask of the df rows which violate the checks (they are
+        not included in records)
+    """
+    
+    # find rows violating the bounds (comparisons with NaN are false)
+    invalid = pandas.Series(False, index = df.index)
+    for column, (lower, upper) in checks.items():
+        values = pandas.to_numeric(df[column], errors = 'coerce')
+        if lower is not None:
+            invalid |= values < lower
+        if upper is not None:
+            invalid |= values > upper
+    
+    valid = df[~invalid]
+    
+    values = []
+    for column in columns:
+        col = valid[column]
+        if column in decimals:
+            col = pandas.to_numeric(col).astype('float64').round(decimals[column])
+        if column in dtypes:
+            col = col.astype(dtypes[column])
+        # python objects with None for the missing values
+        values.append(col.astype(object).where(col.notna(), None).tolist())
+    
+    return list(zip(*values)), invalid.to_numpy()
+
+
+
+def changed_condition(
+        table,
+        compare_columns
+        ):
+    """
+    A function used to construct the guard of the upsert which skips updates
+    of the rows whose compare_columns are not changed (NULL is compared as
+    a value, so NULL replaced by NULL is not a change either).
+    """
+    
+    if not compare_columns:
+        return ''
+    return 'WHERE ({old}) IS DISTINCT FROM ({new})'.format(
+        old = ', '.join(table + '.' + col for col in compare_columns),
+        new = ', '.join('EXCLUDED.' + col for col in compare_columns))
+
+
+def copy_upsert(
+        cursor,
+        records,
+        table,
+        columns,
+        update_columns,
+        key = None,
+        compare_columns = []
+        ):
+    """
+    A function used to upsert many records by a single query. Records are
+    streamed into a temporary staging table with COPY FROM STDIN (as csv) and
+    then inserted into the table, existing rows get update_columns updated.
+    
+    Parameters
+    ----------
+    cursor : psycopg2 cursor
+        cursor of the connection which is not in autocommit mode
+    records : list of tuples
+        records to insert, values follow the order of columns
+    table : str
+        name of the table
+    columns : list of str
+        names of the inserted columns
+    update_columns : list of str
+        names of the columns updated in case of conflict
+    key : list of str
+        names of the primary key columns (default None - the first column)
+    compare_columns : list of str
+        existing rows are updated only if one of these columns is changed
+        (default [] - they are always updated)
+    
+    Returns
+    -------
+    list of tuples
+        key and update_columns of the inserted and updated rows followed 
+        by the flag which is true for the inserted ones
+    """
+    
+    staging = table + '_staging'
+    cols = ', '.join(columns)
+    key = key or columns[:1]
+    
+    # write records to the csv buffer: all the values are quoted and None is
+    # written as the unquoted NULL marker, so an empty string stays an empty
+    # string (postgres text can not contain NUL, so it marks None in the csv)
+    buffer = io.StringIO()
+    csv.writer(buffer, quoting = csv.QUOTE_ALL).writerows(
+        tuple('\0' if value is None else value for value in record) for record in records)
+    buffer = io.StringIO(buffer.getvalue().replace('"\0"', COPY_NULL))
+    
+    cursor.execute("""CREATE TEMP TABLE {staging} 
+                      (LIKE {table} INCLUDING DEFAULTS) ON COMMIT DROP
+                   """.format(staging = staging, table = table))
+    cursor.copy_expert("COPY {staging} ({cols}) FROM STDIN WITH (FORMAT csv, NULL '{null}')"
+                       .format(staging = staging, cols = cols, null = COPY_NULL), buffer)
+    # a row can not be affected twice by a single upsert, so duplicates 
+    # of the primary key are dropped (xmax of a just inserted row is 0)
+    cursor.execute("""
+        INSERT INTO {table} ({cols})
+        SELECT DISTINCT ON ({key}) {cols} FROM {staging}
+        ON CONFLICT ({key})
+        DO UPDATE SET
+            {updates}
+        {condition}
+        RETURNING {key}, {returning}, xmax = 0
+                   """.format(table = table,
+                              cols = cols,
+                              key = ', '.join(key),
+                              staging = staging,
+                              updates = ',\n            '.join(
+                                  '{0} = EXCLUDED.{0}'.format(col) for col in update_columns),
+                              condition = changed_condition(table, compare_columns),
+                              returning = ', '.join(update_columns)))
+    rows = cursor.fetchall()
+    # the same table may be loaded again in the same transaction
+    cursor.execute("DROP TABLE {staging}".format(staging = staging))
+    
+    return rows
+
+
+def execute_rows(
+        cursor,
+        query,
+        records,
+        page_size = 100
+        ):
+    """
+    A function used to execute the insert query for all the records. Records 
+    are sent in pages, each page under its own savepoint. If a page violates 
+    the table constraints it is repeated row by row and failed rows are skipped,
+    so a bad row does not abort the whole transaction.
+    
+    Parameters
+    ----------
+    cursor : psycopg2 cursor
+        cursor of the connection which is not in autocommit mode
+    query : str
+        insert query with a single VALUES %s placeholder and RETURNING clause
+    records : list of tuples
+        records to insert (without duplicates of the primary key)
+    page_size : int
+        number of records sent in a single round trip (default 100)
+    
+    Returns
+    -------
+    rows : list of tuples
+        rows returned by the query
+    failures : list of tuples
+        skipped records with the error text of each of them
+    """
+    
+    rows = []
+    failures = []
+    for start in range(0, len(records), page_size):
+        page = records[start:start + page_size]
+        cursor.execute('SAVEPOINT page')
+        try:
+            rows.extend(execute_values(cursor, query, page, page_size = page_size,
+                                       fetch = True))
+        except psycopg2.IntegrityError:
+            cursor.execute('ROLLBACK TO SAVEPOINT page')
+            # find and skip the failed rows
+            for record_to_insert in page:
+                cursor.execute('SAVEPOINT row')
+                try:
+                    cursor.execute(query, (record_to_insert,))
+                except psycopg2.IntegrityError as err:
+                    cursor.execute('ROLLBACK TO SAVEPOINT row')
+                    failures.append((record_to_insert, str(err).strip()))
+                else:
+                    rows.extend(cursor.fetchall())
+                    cursor.execute('RELEASE SAVEPOINT row')
+        cursor.execute('RELEASE SAVEPOINT page')
+    
+    return rows, failures
+
+
+def load_records(
+        connection,
+        records,
+        query,
+        table,
+        columns,
+        update_columns,
+        method = 'rows',
+        key = None,
+        compare_columns = [],
+        history = None,
+        checked = None,
+        failures = None
+        ):
+    """
+    A function used to load records to the table by the chosen method. The load
+    is made under a savepoint, so the failed copy does not abort the transaction
+    of the caller. Nothing is commited here.
+    
+    Parameters
+    ----------
+    connection : psycopg2 connection
+        connection which is not in autocommit mode
+    records : list of tuples
+        records to insert, values follow the order of columns
+    query : str
+        insert query with a single VALUES %s placeholder, which returns key
+        and update_columns of the written rows followed by xmax = 0 flag
+    table : str
+        name of the table
+    columns : list of str
+        names of the inserted columns
+    update_columns : list of str
+        names of the columns updated in case of conflict
+    method : str
+        'rows' - send records in batches, 'copy' - load them with COPY
+        (default 'rows')
+    key : list of str
+        names of the primary key columns (default None - the first column)
+    compare_columns : list of str
+        existing rows are updated only if one of these columns is changed,
+        the query has to contain the same guard (default [] - they are
+        always updated)
+    history : str
+        name of the history table (partitioned by the date, see history 
+        module) to which key and update_columns of the inserted and updated
+        rows are appended (default None - history is not kept)
+    checked : str
+        name of the column which is set to the time of the load for all the
+        loaded rows, changed or not (default None - nothing is set)
+    failures : list
+        (key, error text) of the failed records are appended to it, the key
+        is the tuple of the key values (default None)
+    
+    Returns
+    -------
+    counts : dict
+        numbers of 'inserted', 'updated', 'unchanged' and 'failed' rows
+    """
+    
+    # a row can not be affected twice by a single query, so only the first 
+    # record of every key is kept
+    positions = [columns.index(col) for col in key or columns[:1]]
+    unique = {}
+    for record in records:
+        unique.setdefault(tuple(record[i] for i in positions), record)
+    records = list(unique.values())
+    
+    cursor = connection.cursor()
+    failed = [] # failed records with the error text
+    rows = []
+    with span('load', table = table, method = method):
+        if method == 'copy':
+            # load all the records at once, a row violating the table 
+            # constraints rolls back the whole load
+            cursor.execute('SAVEPOINT load')
+            try:
+                rows = copy_upsert(cursor, records, table, columns, update_columns,
+                                   key, compare_columns)
+            except psycopg2.IntegrityError as err:
+                cursor.execute('ROLLBACK TO SAVEPOINT load')
+                failed = [(record, str(err).strip()) for record in records]
+            cursor.execute('RELEASE SAVEPOINT load')
+        else:
+            rows, failed = execute_rows(cursor, query, records)
+        
+        # failures are returned to the caller by the key of the record
+        if failures is not None:
+            failures.extend((tuple(record[i] for i in positions), error)
+                            for record, error in failed)
+        
+        # keep the previous values by appending the changes to the history
+        if history is not None and rows:
+            # the last value before the flag is the update date
+            ensure_partitions(cursor, history, {row[-2] for row in rows})
+            # a repeated load of the day does not duplicate the rows of the
+            # history tables with a unique key (the dated membership)
+            execute_values(cursor, 'INSERT INTO {} VALUES %s ON CONFLICT DO NOTHING'
+                           .format(history), [row[:-1] for row in rows])
+        
+        # the inserted rows get the time by the column default, the rest ones
+        # (both changed and unchanged) are marked as checked now
+        if checked is not None and len(failed) < len(records):
+            inserted_keys = {row[:len(positions)] for row in rows if row[-1]}
+            keys = [key_ for key_ in unique if key_ not in inserted_keys]
+            if keys:
+                # the tables with the checked column have a single column key
+                cursor.execute('UPDATE {table} SET {checked} = now() WHERE {key} = ANY(%s)'
+                               .format(table = table, checked = checked,
+                                       key = (key or columns[:1])[0]),
+                               ([key_[0] for key_ in keys],))
+    cursor.close() # close the cursor
+    
+    inserted = sum(1 for row in rows if row[-1])
+    counts = {'inserted': inserted,
+              'updated': len(rows) - inserted,
+              'unchanged': len(records) - len(failed) - len(rows),
+              'failed': len(failed)}
+    for name, value in counts.items():
+        count('rows_' + name, value, table = table)
+    
+    return counts
+
+
+def run_load(
+        records,
+        connection,
+        dsn,
+        commit_every,
+        *args,
+        **kwargs
+        ):
+    """
+    A function used by the inserters to load the records (see load_records)
+    with the connection of the caller or with a new one opened by the DSN.
+    Other arguments are passed to load_records.
+    
+    Parameters
+    ----------
+    records : list of tuples
+        records to insert
+    connection : psycopg2 connection
+        connection of the caller, it is committed only after the batches of
+        commit_every records (None - a new connection is opened, committed
+        and closed)
+    dsn : str
+        libpq connection string of the new connection (None - value of the
+        SPOTILYSE_DSN environment variable)
+    commit_every : int
+        number of records committed at once (None - the whole load is a
+        single transaction)
+    
+    Returns
+    -------
+    counts : dict
+        numbers of 'inserted', 'updated', 'unchanged' and 'failed' rows
+    """
+    
+    own_connection = connection is None
+    if own_connection:
+        connection = connect(dsn)
+    
+    size = commit_every or max(len(records), 1)
+    counts = {}
+    try:
+        for start in range(0, max(len(records), 1), size):
+            loaded = load_records(connection, records[start:start + size], *args, **kwargs)
+            for name, value in loaded.items():
+                counts[name] = counts.get(name, 0) + value
+            if commit_every or own_connection:
+                connection.commit()
+    except Exception:
+        if own_connection:
+            connection.rollback()
+        raise
+    finally:
+        if own_connection:
+            connection.close()
+    
+    return counts
+
+
+def failed_rows(
+        df,
+        keys,
+        failures
+        ):
+    """
+    A function used to get the rows of the dataframe whose records failed to
+    load, with the error text in the error column.
+    
+    Parameters
+    ----------
+    df : pandas.DataFrame()
+        dataframe of the inserter
+    keys : list of tuples
+        key of every row of df as in the failures
+    failures : list of tuples
+        (key, error text) of the failed records (see load_records)
+    
+    Returns
+    -------
+    pandas.DataFrame()
+        failed rows of df
+    """
+    
+    errors = dict(failures)
+    failed = df[[key in errors for key in keys]]
+    return failed.assign(error = pandas.Series(
+        [errors[key] for key in keys if key in errors], index = failed.index, dtype = object))
+
+
+@traced
 def insert_artist(
         artist_df,
-        user="ivan-pc",
-        password="passwd",
-        host="localhost",
-        port="5432",
-        database="spotilyse"
+        dsn=None,
+        method="rows",
+        connection=None,
+        history=False,
+        counts=None,
+        commit_every=None
         ):
     """
     This function is preordained for data insertion into the artist table.
     It inserts all the rows from artist_df, if row with such id is already
-    exist then popularity, followers and update columns will be updated.
+    exist and its popularity or followers are changed then popularity, 
+    followers and update columns will be updated (so update is the date of
+    the last change), the checked column of every loaded row is set to the
+    time of the load.
     
     Parameters
     ----------
     artist_df : pandas.DataFrame()
         pandas dataframe with artist info. 
-    user : str
-        database user
-    password : str
-        database password
-    host : str
-        database host
-    port : str
-        database port
-    database : str
-        database name
+    dsn : str
+        libpq connection string of the database, used when connection is not
+        given (default None - value of the SPOTILYSE_DSN environment variable)
+    method : str
+        'rows' - insert rows in batches, 'copy' - load the whole dataframe 
+        with COPY into a staging table and upsert it by a single query
+        (default 'rows')
+    connection : psycopg2 connection
+        connection to use instead of opening a new one, e.g. from the pool of
+        the database module. The caller commits and releases it (default None)
+    history : bool
+        append the inserted and changed rows to the artist_history table,
+        so the previous values are kept (default False)
+    counts : dict
+        numbers of 'inserted', 'updated', 'unchanged' and 'failed' rows are
+        added to it (default None)
+    commit_every : int
+        number of records committed at once, the connection of the caller is
+        committed after every batch as well (default None - the whole load is
+        a single transaction)
+    
+    Returns
+    -------
+    rejected : pandas.DataFrame()
+        rows which are not inserted: rejected by the CHECK bounds before
+        sending or failed by the database, the error column holds the reason
     """
     # The insert query for the artist database
     artist_insert_query = """ 
@@ -41,78 +568,93 @@ def insert_artist(
                             genre,
                             followers,
                             update) 
-        VALUES (%s,%s,%s,%s,%s,%s)
+        VALUES %s
         ON CONFLICT (id)
         DO UPDATE SET
             popularity = EXCLUDED.popularity,
             followers = EXCLUDED.followers,
             update = EXCLUDED.update
+        WHERE (artist.popularity, artist.followers) 
+            IS DISTINCT FROM (EXCLUDED.popularity, EXCLUDED.followers)
+        RETURNING id, popularity, followers, update, xmax = 0
                            """
                            
-    # Try to connect to a database
-    try:
-        connection = psycopg2.connect(user = user,
-                                      password = password,
-                                      host = host,
-                                      port = port,
-                                      database = database)
-    except psycopg2.OperationalError as err:
-        # pass exception to function
-        print(err)
-        # set the connection to 'None' in case of error
-        connection = None
-        
-    if connection:
-        # create the cursor
-        cursor = connection.cursor()
-        # iterate through the rows
-        for row in artist_df.itertuples():
-            # fill the rectord to insert from a row
-            record_to_insert = (getattr(row, 'Index'), 
-                                getattr(row, 'artist_name'), 
-                                getattr(row, 'artist_popularity'),
-                                getattr(row, 'artist_genre'), 
-                                getattr(row, 'artist_followers'), 
-                                getattr(row, 'update'))
-            # insert a row
-            cursor.execute(artist_insert_query, record_to_insert)
-            
-        connection.commit() # commit all the insertions
-        
-        cursor.close() # close the cursor
-        
-        connection.close() # close the connection
+    # fill the records to insert from the dataframe
+    records, invalid = prepare_records(
+        artist_df.rename_axis('id').reset_index().rename(columns = ARTIST_NAMES),
+        ARTIST_COLUMNS, ARTIST_CHECKS, dtypes = ARTIST_DTYPES)
+    rejected = artist_df[invalid].assign(error = BOUNDS_ERROR)
+    count('rows_rejected', len(rejected), table = 'artist')
+                           
+    # Load the records with the connection of the caller or a new one
+    failures = []
+    loaded = run_load(records, connection, dsn, commit_every,
+                      artist_insert_query, 'artist', ARTIST_COLUMNS,
+                      ['popularity', 'followers', 'update'], method,
+                      compare_columns = ['popularity', 'followers'],
+                      history = 'artist_history' if history else None,
+                      checked = 'checked', failures = failures)
+    if counts is not None:
+        for name, value in loaded.items():
+            counts[name] = counts.get(name, 0) + value
+    
+    # rows failed by the database are returned with the rejected ones
+    if failures:
+        rejected = pandas.concat([rejected, failed_rows(
+            artist_df, [(id_,) for id_ in artist_df.index], failures)])
+    
+    return rejected
         
         
+@traced
 def insert_track(
         track_df,
-        user="ivan-pc",
-        password="passwd",
-        host="localhost",
-        port="5432",
-        database="spotilyse"
+        dsn=None,
+        method="rows",
+        connection=None,
+        history=False,
+        counts=None,
+        commit_every=None
         ):
     """
     This function is preordained for data insertion into the track table.
     It inserts all the rows from artist_df, if row with such id is already
-    exist then popularity, followers and update columns will be updated.
+    exist and its popularity is changed then popularity and update columns 
+    will be updated (so update is the date of the last change), the checked
+    column of every loaded row is set to the time of the load.
     
     Parameters
     ----------
     track_df : pandas.DataFrame()
         pandas dataframe with track info. 
-    user : str
-        database user
-    password : str
-        database password
-    host : str
-        database host
-    port : str
-        database port
-    database : str
-        database name
+    dsn : str
+        libpq connection string of the database, used when connection is not
+        given (default None - value of the SPOTILYSE_DSN environment variable)
+    method : str
+        'rows' - insert rows in batches, 'copy' - load the whole dataframe 
+        with COPY into a staging table and upsert it by a single query
+        (default 'rows')
+    connection : psycopg2 connection
+        connection to use instead of opening a new one, e.g. from the pool of
+        the database module. The caller commits and releases it (default None)
+    history : bool
+        append the inserted and changed rows to the track_history table,
+        so the previous values are kept (default False)
+    counts : dict
+        numbers of 'inserted', 'updated', 'unchanged' and 'failed' rows are
+        added to it (default None)
+    commit_every : int
+        number of records committed at once, the connection of the caller is
+        committed after every batch as well (default None - the whole load is
+        a single transaction)
+    
+    Returns
+    -------
+    rejected : pandas.DataFrame()
+        rows which are not inserted: rejected by the CHECK bounds before
+        sending or failed by the database, the error column holds the reason
     """
-    # The insert query for the artist database
+    # The insert query for the track database
     track_insert_query = """ 
         INSERT INTO track (id, 
                            name, 
@@ -133,62 +675,109 @@ def insert_track(
                            tempo,
                            duration_ms,
                            time_signature) 
-        VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)
+        VALUES %s
         ON CONFLICT (id)
         DO UPDATE SET
             popularity = EXCLUDED.popularity,
             update = EXCLUDED.update
+        WHERE track.popularity IS DISTINCT FROM EXCLUDED.popularity
+        RETURNING id, popularity, update, xmax = 0
                            """
                            
-    # Try to connect to a database
-    try:
-        connection = psycopg2.connect(user = user,
-                                      password = password,
-                                      host = host,
-                                      port = port,
-                                      database = database)
-    except psycopg2.OperationalError as err:
-        # pass exception to function
-        print(err)
-        # set the connection to 'None' in case of error
-        connection = None
-        
-    if connection:
-        connection.autocommit = True
-        # create the cursor
-        cursor = connection.cursor()
-        # iterate through the rows
-        for row in track_df.itertuples():
-            # fill the rectord to insert from a row
-            record_to_insert = (getattr(row, 'Index'), 
-                                getattr(row, 'name'), 
-                                getattr(row, 'artist_id'),
-                                getattr(row, 'popularity'), 
-                                getattr(row, 'release_date'), 
-                                getattr(row, 'update'),
-                                round(getattr(row, 'danceability'), 3),
-                                round(getattr(row, 'energy'), 3),
-                                getattr(row, 'key'),
-                                round(getattr(row, 'loudness'), 3),
-                                bool(getattr(row, 'mode')),
-                                round(getattr(row, 'speechiness'), 3),
-                                round(getattr(row, 'acousticness'), 3),
-                                round(float(getattr(row, 'instrumentalness')), 7),
-                                round(getattr(row, 'liveness'), 3),
-                                round(getattr(row, 'valence'), 3),
-                                round(getattr(row, 'tempo'), 3),
-                                getattr(row, 'duration_ms'),
-                                getattr(row, 'time_signature'))
-            # insert a row
-            try:
-                cursor.execute(track_insert_query, record_to_insert)
-            except psycopg2.IntegrityError as err:
-                #cursor.execute('rollback')
-                print(err)
-                    
-        cursor.close() # close the cursor
-        
-        connection.close() # close the connection
-            
-        
-        
+    # fill the records to insert from the dataframe
+    records, invalid = prepare_records(
+        track_df.rename_axis('id').reset_index(),
+        TRACK_COLUMNS, TRACK_CHECKS, TRACK_DECIMALS, TRACK_DTYPES)
+    rejected = track_df[invalid].assign(error = BOUNDS_ERROR)
+    count('rows_rejected', len(rejected), table = 'track')
+                           
+    # Load the records with the connection of the caller or a new one
+    failures = []
+    loaded = run_load(records, connection, dsn, commit_every,
+                      track_insert_query, 'track', TRACK_COLUMNS,
+                      ['popularity', 'update'], method,
+                      compare_columns = ['popularity'],
+                      history = 'track_history' if history else None,
+                      checked = 'checked', failures = failures)
+    if counts is not None:
+        for name, value in loaded.items():
+            counts[name] = counts.get(name, 0) + value
+    
+    # rows failed by the database are returned with the rejected ones
+    if failures:
+        rejected = pandas.concat([rejected, failed_rows(
+            track_df, [(id_,) for id_ in track_df.index], failures)])
+    
+    return rejected
+
+
+@traced
+def insert_track_country(
+        members_df,
+        dsn=None,
+        method="rows",
+        connection=None,
+        history=False,
+        commit_every=None
+        ):
+    """
+    This function is preordained for data insertion into the track_country 
+    join table. It inserts all the rows from members_df (see 
+    registry.IdRegistry.members_df), if such membership already exists 
+    then update column will be updated.
+    
+    Parameters
+    ----------
+    members_df : pandas.DataFrame()
+        pandas dataframe with track_id, country and update columns. 
+    dsn : str
+        libpq connection string of the database, used when connection is not
+        given (default None - value of the SPOTILYSE_DSN environment variable)
+    method : str
+        'rows' - insert rows in batches, 'copy' - load the whole dataframe 
+        with COPY into a staging table and upsert it by a single query
+        (default 'rows')
+    connection : psycopg2 connection
+        connection to use instead of opening a new one, e.g. from the pool of
+        the database module. The caller commits and releases it (default None)
+    history : bool
+        append the memberships to the track_country_history table by the date
+        of the update, once a day, so the charts of the past days keep their
+        own countries (default False)
+    commit_every : int
+        number of records committed at once, the connection of the caller is
+        committed after every batch as well (default None - the whole load is
+        a single transaction)
+    
+    Returns
+    -------
+    failed : pandas.DataFrame()
+        rows failed by the database, the error column holds the reason
+    """
+    # The insert query for the track_country table
+    track_country_insert_query = """ 
+        INSERT INTO track_country (track_id, 
+                                   country, 
+                                   update) 
+        VALUES %s
+        ON CONFLICT (track_id, country)
+        DO UPDATE SET
+            update = EXCLUDED.update
+        RETURNING track_id, country, update, xmax = 0
+                           """
+    
+    # fill the records to insert from the dataframe
+    records, _ = prepare_records(members_df, TRACK_COUNTRY_COLUMNS)
+                           
+    # Load the records with the connection of the caller or a new one
+    failures = []
+    run_load(records, connection, dsn, commit_every,
+             track_country_insert_query, 'track_country',
+             TRACK_COUNTRY_COLUMNS, ['update'], method,
+             key = ['track_id', 'country'],
+             history = 'track_country_history' if history else None,
+             failures = failures)
+    
+    return failed_rows(members_df,
+                       list(zip(members_df['track_id'], members_df['country'])),
+                       failures)
@@ -0,0 +1,280 @@
+# Current module provides a lightweight instrumentation of the pipeline. The
+# getters, fetchers and inserters are wrapped by spans which measure the time
+# of every stage, the spotify client may be wrapped to measure every api
+# endpoint, and counters record requests, items, rows and retries. Durations go
+# to histograms with fixed buckets. Metrics can be exported as json (a summary
+# or a log line per finished span) or as a Prometheus text file. Instrumentation
+# is disabled by default, then a span costs a single flag check.
+
+
+import functools
+import json
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+# upper bounds of the histogram buckets in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# prefix of the exported metric names
+PREFIX = 'spotilyse_'
+
+_enabled = False
+_log = None # file for the json log lines of the spans
+_lock = threading.Lock()
+_counters = {} # mapping from (name, labels) to the value
+_histograms = {} # mapping from (name, labels) to [bucket counts, sum, count]
+_local = threading.local() # stack of the open spans of the thread
+
+
+def enable(log_file = None):
+    """
+    A function used to enable the instrumentation.
+
+    Parameters
+    ----------
+    log_file : str
+        full name of the file to which a json line is appended for every
+        finished span (default None - spans are not logged)
+    """
+    global _enabled, _log
+    if log_file is not None:
+        _log = open(log_file, 'a')
+    _enabled = True
+
+
+def disable():
+    """
+    A function used to disable the instrumentation (collected metrics are kept).
+    """
+    global _enabled, _log
+    _enabled = False
+    if _log is not None:
+        _log.close()
+        _log = None
+
+
+def is_enabled():
+    return _enabled
+
+
+def reset():
+    """
+    A function used to drop all the collected metrics.
+    """
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def count(name, value = 1, **labels):
+    """
+    A function used to increase the counter, e.g. count('rows', 100, table = 'track').
+    """
+    if not _enabled:
+        return
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def observe(name, value, **labels):
+    """
+    A function used to add the value (seconds) to the histogram.
+    """
+    if not _enabled:
+        return
+    key = _key(name, labels)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = [[0] * len(BUCKETS), 0.0, 0]
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                histogram[0][i] += 1
+                break
+        histogram[1] += value
+        histogram[2] += 1
+
+
+@contextmanager
+def _span(name, labels):
+    stack = getattr(_local, 'stack', None)
+    if stack is None:
+        stack = _local.stack = []
+    parent = stack[-1] if stack else None
+    stack.append(name)
+    start = time.perf_counter()
+    error = None
+    try:
+        yield
+    except Exception as err:
+        error = type(err).__name__
+        raise
+    finally:
+        seconds = time.perf_counter() - start
+        stack.pop()
+        observe(name + '_seconds', seconds, **labels)
+        if error is not None:
+            count(name + '_errors', **labels)
+        if _log is not None:
+            line = json.dumps({'time': time.time(), 'span': name, 'parent': parent,
+                               'labels': labels, 'seconds': seconds, 'error': error})
+            with _lock:
+                _log.write(line + '\n')
+
+
+def span(name, **labels):
+    """
+    A function used to measure the time of the block, e.g.
+    with span('load', table = 'track'): ... The time goes to the
+    <name>_seconds histogram, failures to the <name>_errors counter.
+    """
+    if not _enabled:
+        return nullcontext()
+    return _span(name, labels)
+
+
+def traced(function):
+    """
+    A decorator used to measure every call of the function by the span named
+    after it.
+    """
+    name = function.__name__
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if not _enabled:
+            return function(*args, **kwargs)
+        with _span(name, {}):
+            return function(*args, **kwargs)
+
+    return wrapper
+
+
+def response_items(response):
+    """
+    A function used to count the objects of the api response (bulk lists,
+    pages or pages wrapped by the name of the objects).
+    """
+    if isinstance(response, list):
+        return len(response)
+    if not isinstance(response, dict):
+        return 0
+    if 'items' in response:
+        return len(response['items'])
+    for value in response.values():
+        if isinstance(value, list):
+            return len(value)
+        if isinstance(value, dict) and 'items' in value:
+            return len(value['items'])
+    return 0
+
+
+class InstrumentedSpotify:
+    """
+    A wrapper of the spotify client which measures every api call by the 'api'
+    span with the endpoint label and counts the requests and returned items.
+
+    Parameters
+    ----------
+    spotify : spotify.client.Spotify() instance
+        Spotify API client with valid credentials
+    """
+
+    def __init__(self, spotify):
+        self.spotify = spotify
+
+    def __getattr__(self, name):
+        attr = getattr(self.spotify, name)
+        if name.startswith('_') or not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            if not _enabled:
+                return attr(*args, **kwargs)
+            count('requests', endpoint = name)
+            with _span('api', {'endpoint': name}):
+                response = attr(*args, **kwargs)
+            count('items', response_items(response), endpoint = name)
+            return response
+
+        return call
+
+
+def snapshot():
+    """
+    A function used to get all the collected metrics.
+
+    Returns
+    -------
+    dict
+        'counters' - list of dicts with name, labels and value, 'histograms'
+        - list of dicts with name, labels, buckets, sum and count
+
+    """
+    with _lock:
+        counters = [{'name': name, 'labels': dict(labels), 'value': value}
+                    for (name, labels), value in _counters.items()]
+        histograms = [{'name': name, 'labels': dict(labels),
+                       'buckets': dict(zip(BUCKETS, buckets)),
+                       'sum': sum_, 'count': count_}
+                      for (name, labels), (buckets, sum_, count_) in _histograms.items()]
+    return {'counters': counters, 'histograms': histograms}
+
+
+def write_json(file_name):
+    """
+    A function used to write the snapshot of the metrics to the json file.
+    """
+    with open(file_name, 'w') as f:
+        json.dump(snapshot(), f, indent = 2)
+
+
+def _labels(labels, **extra):
+    # labels in the Prometheus text format
+    labels = dict(labels, **extra)
+    if not labels:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(key, value) for key, value in labels.items()) + '}'
+
+
+def write_prometheus(file_name):
+    """
+    A function used to write the metrics to the file in the Prometheus text
+    format (e.g. for the node exporter textfile collector).
+    """
+    metrics = snapshot()
+    lines = []
+
+    for name in sorted({c['name'] for c in metrics['counters']}):
+        lines.append('# TYPE {}{}_total counter'.format(PREFIX, name))
+        for c in metrics['counters']:
+            if c['name'] == name:
+                lines.append('{}{}_total{} {}'.format(PREFIX, name, _labels(c['labels']),
+                                                      c['value']))
+
+    for name in sorted({h['name'] for h in metrics['histograms']}):
+        lines.append('# TYPE {}{} histogram'.format(PREFIX, name))
+        for h in metrics['histograms']:
+            if h['name'] != name:
+                continue
+            cumulative = 0
+            for bound, value in h['buckets'].items():
+                cumulative += value
+                lines.append('{}{}_bucket{} {}'.format(PREFIX, name,
+                                                       _labels(h['labels'], le = bound),
+                                                       cumulative))
+            lines.append('{}{}_bucket{} {}'.format(PREFIX, name,
+                                                   _labels(h['labels'], le = '+Inf'),
+                                                   h['count']))
+            lines.append('{}{}_sum{} {}'.format(PREFIX, name, _labels(h['labels']), h['sum']))
+            lines.append('{}{}_count{} {}'.format(PREFIX, name, _labels(h['labels']),
+                                                  h['count']))
+
+    with open(file_name, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
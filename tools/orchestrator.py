@@ -0,0 +1,187 @@
+# Current module provides an orchestrator which runs the whole pipeline
+# (get_releases -> get_albums_tracks -> get_tracks_info -> get_artists_info ->
+# inserters) for many countries at once. Countries are processed in a pool of
+# processes, each of them has its own spotify client whose throttler gets an
+# equal part of the request rate, so the whole pool keeps the rate of a single
+# client (the api limits the application, not the process). The country
+# membership of the collected tracks goes to a single id registry (see registry
+# module), so a track present in several markets is fetched once (and the ids
+# fetched earlier in the cycle are skipped), and all the countries share a
+# single database load, which fills the track_country join table as well
+# (and its dated history, the charts of the past days are built from it).
+#
+# Usage: python -m tools.orchestrator RU US DE ...
+# (spotify credentials and database connection are taken from the environment)
+
+
+import json
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+import pandas as pd
+import spotipy
+from spotipy.oauth2 import SpotifyClientCredentials
+from tools.database import get_pool
+from tools.database import transaction
+from tools.fetchers import chunkize
+from tools.fetchers import fetch_bulk
+from tools.getters import build_artists_df
+from tools.getters import build_tracks_df
+from tools.getters import get_albums_tracks
+from tools.getters import get_releases
+from tools.inserters import insert_artist
+from tools.inserters import insert_track
+from tools.inserters import insert_track_country
+from tools.registry import IdRegistry
+from tools.throttle import ThrottledSpotify
+from tools.throttle import retry_session
+
+# spotify client of the worker process
+_spotify = None
+
+
+def default_client(processes = 1):
+    """
+    A function used to create the spotify client of a worker process with
+    the client credentials taken from the environment. The rates of the
+    throttler (see throttle.ThrottledSpotify) are divided by the number of
+    processes sharing them.
+    """
+    spotify = spotipy.Spotify(client_credentials_manager = SpotifyClientCredentials(),
+                              requests_session = retry_session())
+    return ThrottledSpotify(spotify,
+                            rate = 10.0 / processes,
+                            max_rate = 20.0 / processes,
+                            min_rate = 0.5 / processes,
+                            burst = max(1, 10 // processes))
+
+
+def init_worker(client_factory, processes):
+    # create the spotify client once for every worker process
+    global _spotify
+    _spotify = client_factory(processes)
+
+
+def collect_country(country):
+    # get the ids of all the tracks of new releases in the country
+    start = time.time()
+    albums = get_releases(_spotify, country = country)
+    tracks = get_albums_tracks(_spotify, country = country, albums_ids = albums)
+    return country, albums, tracks, time.time() - start
+
+
+def fetch_tracks_chunk(tracks_ids):
+    # get the tracks dataframe for the chunk of ids
+    results, _ = fetch_bulk(_spotify, {'tracks': tracks_ids, 'audio_features': tracks_ids})
+    return build_tracks_df(results['tracks'], results['audio_features'])
+
+
+def fetch_artists_chunk(artists_ids):
+    # get the artists dataframe for the chunk of ids
+    results, _ = fetch_bulk(_spotify, {'artists': artists_ids})
+    return build_artists_df(results['artists'])
+
+
+def run_countries(
+        countries,
+        pool = None,
+        client_factory = default_client,
+        processes = 4,
+        chunk_size = 1000,
+        method = 'copy',
+        registry = None
+        ):
+    """
+    A function used to run the pipeline for the list of countries.
+
+    Parameters
+    ----------
+    countries : list of str
+        ISO 3166-1 alpha-2 country codes
+    pool : psycopg2.pool.ThreadedConnectionPool
+        pool of the database connections (default None - collected data are
+        not inserted)
+    client_factory : callable
+        picklable function which creates the spotify client of a worker
+        process, it gets the number of processes sharing the request rate
+        (default default_client)
+    processes : int
+        number of worker processes (default 4)
+    chunk_size : int
+        number of ids fetched by a single worker task (default 1000)
+    method : str
+        insertion method of the inserters (default 'copy')
+    registry : registry.IdRegistry
+        registry of the cycle, it gets the country membership of the
+        collected tracks and the fetched ids, the ids fetched in the cycle
+        before are skipped (default None - a new registry of the current date)
+
+    Returns
+    -------
+    df : pandas.DataFrame
+        a dataframe with info of the fetched tracks
+    df_a : pandas.DataFrame
+        a dataframe with info of their artists
+    report : dict
+        'countries' - for every country number of albums, tracks, elapsed
+        seconds and tracks per second of its collection stage, 'stages' -
+        elapsed seconds of the shared stages, 'unique_tracks' and
+        'unique_artists' counts of the fetched rows
+
+    """
+
+    if registry is None:
+        registry = IdRegistry(datetime.today().strftime('%Y-%m-%d'))
+    report = {'countries': {}, 'stages': {}}
+
+    with ProcessPoolExecutor(max_workers = processes,
+                             initializer = init_worker,
+                             initargs = (client_factory, processes)) as executor:
+        # collect track ids of every country
+        start = time.time()
+        for country, albums, tracks, elapsed in executor.map(collect_country, countries):
+            report['countries'][country] = {'albums': len(albums),
+                                            'tracks': len(tracks),
+                                            'seconds': elapsed,
+                                            'tracks_per_sec': len(tracks) / elapsed if elapsed else 0}
+            registry.add(country, tracks)
+        report['stages']['collect'] = time.time() - start
+
+        # a track present in several countries (or fetched earlier in the
+        # cycle) is fetched once
+        tracks_ids = registry.unfetched(list(registry.members))
+        start = time.time()
+        frames = list(executor.map(fetch_tracks_chunk, chunkize(tracks_ids, chunk_size)))
+        df = pd.concat(frames) if frames else build_tracks_df([], [])
+        # categories of the chunks differ, so they are united after concatenation
+        df = df.astype({'artist_id': 'category', 'artist_name': 'category'})
+        registry.mark_fetched(df.index)
+        report['stages']['tracks'] = time.time() - start
+
+        artists_ids = registry.unfetched(list(dict.fromkeys(df['artist_id'])), 'artist')
+        start = time.time()
+        frames = list(executor.map(fetch_artists_chunk, chunkize(artists_ids, chunk_size)))
+        df_a = pd.concat(frames) if frames else build_artists_df([])
+        registry.mark_fetched(df_a.index, 'artist')
+        report['stages']['artists'] = time.time() - start
+
+    report['unique_tracks'] = len(df)
+    report['unique_artists'] = len(df_a)
+
+    # single load of all the countries
+    if pool is not None:
+        start = time.time()
+        with transaction(pool) as connection:
+            insert_artist(df_a, method = method, connection = connection)
+            insert_track(df, method = method, connection = connection)
+            insert_track_country(registry.members_df(), method = method,
+                                 connection = connection, history = True)
+        report['stages']['load'] = time.time() - start
+
+    return df, df_a, report
+
+
+if __name__ == '__main__':
+    _, _, report = run_countries(sys.argv[1:], pool = get_pool())
+    print(json.dumps(report, indent = 2))
@@ -0,0 +1,225 @@
+# Current module provides a streaming mode of the whole pipeline: album ids ->
+# track ids -> tracks info -> artists info -> database. Stages are connected as
+# generators over fixed-size chunks, so only a few chunks are kept in memory and
+# the first rows are inserted as soon as the first chunk is fetched. Inserts run
+# in a separate thread which takes chunks from a bounded queue, so a slow
+# database blocks the fetching stages instead of letting chunks pile up.
+
+
+import queue
+import threading
+from tools.database import transaction
+from tools.fetchers import MAX_WORKERS
+from tools.fetchers import chunkize
+from tools.fetchers import fetch_all
+from tools.fetchers import fetch_bulk
+from tools.getters import build_artists_df
+from tools.getters import build_tracks_df
+from tools.inserters import BOUNDS_ERROR
+from tools.inserters import insert_artist
+from tools.inserters import insert_track
+
+
+def iter_albums_tracks(
+        spotify,
+        albums_ids,
+        chunk_size = 500,
+        max_workers = MAX_WORKERS
+        ):
+    """
+    A generator used to get unique track ids of the albums chunk by chunk.
+
+    Parameters
+    ----------
+    spotify : spotify.client.Spotify() instance
+        Spotify API client with valid credentials
+    albums_ids : iterable of str
+        album ID's
+    chunk_size : int
+        number of track ids in a chunk (default 500)
+    max_workers : int
+        maximum number of concurrent requests (default MAX_WORKERS)
+
+    Yields
+    -------
+    list of str
+        chunk of track ids, each id is yielded once
+
+    """
+
+    seen = set() # ids of already yielded tracks
+    buffer = [] # ids which are not yielded yet
+
+    # albums are requested in batches of max_workers size
+    for albums in chunkize(dict.fromkeys(albums_ids), max_workers):
+        for items in fetch_all(spotify,
+                               lambda id_: spotify.album_tracks(id_, limit = 50),
+                               albums,
+                               max_workers = max_workers):
+            for res in items:
+                if res is not None and res['id'] not in seen:
+                    seen.add(res['id'])
+                    buffer.append(res['id'])
+
+        while len(buffer) >= chunk_size:
+            yield buffer[:chunk_size]
+            buffer = buffer[chunk_size:]
+
+    if buffer:
+        yield buffer
+
+
+def iter_tracks_info(
+        spotify,
+        chunks,
+        max_workers = MAX_WORKERS
+        ):
+    """
+    A generator used to get the tracks dataframes for chunks of track ids.
+
+    Parameters
+    ----------
+    spotify : spotify.client.Spotify() instance
+        Spotify API client with valid credentials
+    chunks : iterable of lists
+        chunks of track ids
+    max_workers : int
+        maximum number of concurrent requests (default MAX_WORKERS)
+
+    Yields
+    -------
+    pandas.DataFrame
+        a dataframe with track info and features for the chunk
+
+    """
+
+    for chunk in chunks:
+        results, _ = fetch_bulk(spotify,
+                                {'tracks': chunk, 'audio_features': chunk},
+                                max_workers)
+        yield build_tracks_df(results['tracks'], results['audio_features'])
+
+
+def iter_artists_info(
+        spotify,
+        frames,
+        max_workers = MAX_WORKERS
+        ):
+    """
+    A generator used to get the info of artists, which appear in the tracks
+    dataframes for the first time.
+
+    Parameters
+    ----------
+    spotify : spotify.client.Spotify() instance
+        Spotify API client with valid credentials
+    frames : iterable of pandas.DataFrame
+        tracks dataframes
+    max_workers : int
+        maximum number of concurrent requests (default MAX_WORKERS)
+
+    Yields
+    -------
+    (pandas.DataFrame, pandas.DataFrame)
+        the tracks dataframe and the dataframe with its new artists info
+
+    """
+
+    seen = set() # ids of already fetched artists
+    for df in frames:
+        artists_ids = [id_ for id_ in dict.fromkeys(df['artist_id']) if id_ not in seen]
+        seen.update(artists_ids)
+        results, _ = fetch_bulk(spotify, {'artists': artists_ids}, max_workers)
+        yield df, build_artists_df(results['artists'])
+
+
+def run_streaming(
+        spotify,
+        albums_ids,
+        pool,
+        chunk_size = 500,
+        max_pending = 2,
+        method = 'copy',
+        max_workers = MAX_WORKERS
+        ):
+    """
+    A function used to run the whole pipeline from album ids to the database
+    in the streaming mode. Every chunk is inserted in its own transaction.
+
+    Parameters
+    ----------
+    spotify : spotify.client.Spotify() instance
+        Spotify API client with valid credentials
+    albums_ids : iterable of str
+        album ID's
+    pool : psycopg2.pool.ThreadedConnectionPool
+        pool of the database connections (see database module)
+    chunk_size : int
+        number of tracks in a chunk (default 500)
+    max_pending : int
+        maximum number of fetched chunks waiting for insertion, fetching
+        is blocked above it (default 2)
+    method : str
+        insertion method of the inserters (default 'copy')
+    max_workers : int
+        maximum number of concurrent requests (default MAX_WORKERS)
+
+    Returns
+    -------
+    dict
+        numbers of inserted or updated 'tracks' and 'artists' rows, of the
+        'unchanged' rows skipped by the database, of the 'failed' rows
+        violating the table constraints and of the 'rejected' rows (not sent)
+
+    """
+
+    pending = queue.Queue(maxsize = max_pending)
+    counts = {'tracks': 0, 'artists': 0, 'unchanged': 0, 'failed': 0, 'rejected': 0}
+    errors = [] # exception of the loader thread
+
+    def load():
+        while True:
+            item = pending.get()
+            if item is None:
+                break
+            # after a failure the rest chunks are only drained
+            if errors:
+                continue
+            df, df_a = item
+            # rows counted by the inserters (see inserters.load_records)
+            loaded_a, loaded = {}, {}
+            try:
+                with transaction(pool) as connection:
+                    rejected_a = insert_artist(df_a, method = method, connection = connection,
+                                               counts = loaded_a)
+                    rejected = insert_track(df, method = method, connection = connection,
+                                            counts = loaded)
+            except Exception as err:
+                errors.append(err)
+            else:
+                counts['artists'] += loaded_a.get('inserted', 0) + loaded_a.get('updated', 0)
+                counts['tracks'] += loaded.get('inserted', 0) + loaded.get('updated', 0)
+                counts['unchanged'] += loaded_a.get('unchanged', 0) + loaded.get('unchanged', 0)
+                counts['failed'] += loaded_a.get('failed', 0) + loaded.get('failed', 0)
+                # the rows failed by the database are returned with the rejected ones
+                counts['rejected'] += int((rejected_a['error'] == BOUNDS_ERROR).sum() +
+                                          (rejected['error'] == BOUNDS_ERROR).sum())
+
+    loader = threading.Thread(target = load)
+    loader.start()
+    try:
+        chunks = iter_albums_tracks(spotify, albums_ids, chunk_size, max_workers)
+        frames = iter_tracks_info(spotify, chunks, max_workers)
+        for item in iter_artists_info(spotify, frames, max_workers):
+            if errors:
+                break
+            # blocks while max_pending chunks are waiting for the database
+            pending.put(item)
+    finally:
+        pending.put(None)
+        loader.join()
+
+    if errors:
+        raise errors[0]
+
+    return counts
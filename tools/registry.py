@@ -0,0 +1,179 @@
+# Current module provides a registry of the ids collected during the current
+# fetching cycle. The same top tracks and artists appear in the charts of many
+# countries, so the registry remembers which ids of every kind (tracks and
+# artists) are already fetched and keeps a bitmap of the countries each track
+# belongs to. Getters use it to fetch only the new ids, while the country
+# membership goes to the track_country join table instead of duplicated rows.
+# An id is marked as fetched only after its object came back from the api.
+# The registry is stored in a compact binary file: a json header line with the
+# countries followed by fixed-width records (22 bytes of id, 1 byte of flags
+# and the bytes of the country bitmap).
+
+
+import itertools
+import json
+import pandas as pd
+
+# length of the spotify ids
+ID_LENGTH = 22
+
+# kinds of the registered ids
+KINDS = ('track', 'artist')
+
+# flags of the records of the binary file
+FETCHED = 1
+ARTIST = 2
+
+
+class IdRegistry:
+    """
+    A registry of track ids with their country membership and of the track
+    and artist ids fetched during the cycle.
+
+    Parameters
+    ----------
+    cycle : str
+        name of the fetching cycle, e.g. the date (default None)
+    """
+
+    def __init__(self, cycle = None):
+        self.cycle = cycle
+        self.countries = [] # countries in the order of their bits
+        self.members = {} # mapping from the track id to the bitmap of countries
+        self.fetched = {kind: set() for kind in KINDS} # ids fetched during the cycle
+
+    def __len__(self):
+        return len(self.members)
+
+    def __contains__(self, id_):
+        return id_ in self.members
+
+    def add(self, country, ids):
+        """
+        A method used to record that ids belong to the country.
+
+        Parameters
+        ----------
+        country : str
+            ISO 3166-1 alpha-2 country code or 'GLobal'
+        ids : iterable of str
+            track ids present in the country (empty ones, e.g. of the local
+            tracks, are skipped)
+
+        Returns
+        -------
+        new : list of str
+            ids which were not present in the registry before
+        """
+        if country not in self.countries:
+            self.countries.append(country)
+        bit = 1 << self.countries.index(country)
+
+        new = []
+        for id_ in ids:
+            if not isinstance(id_, str):
+                continue
+            if id_ not in self.members:
+                self.members[id_] = 0
+                new.append(id_)
+            self.members[id_] |= bit
+
+        return new
+
+    def unfetched(self, ids, kind = 'track'):
+        """
+        A method used to filter ids of the kind ('track' or 'artist') which
+        are not fetched during the cycle yet (the order is kept).
+        """
+        fetched = self.fetched[kind]
+        return [id_ for id_ in ids if id_ not in fetched]
+
+    def mark_fetched(self, ids, kind = 'track'):
+        """
+        A method used to record that ids of the kind ('track' or 'artist')
+        are fetched during the cycle, e.g. the index of the built dataframe.
+        """
+        ids = [id_ for id_ in ids if isinstance(id_, str)]
+        if kind == 'track':
+            for id_ in ids:
+                self.members.setdefault(id_, 0)
+        self.fetched[kind].update(ids)
+
+    def countries_of(self, id_):
+        """
+        A method used to get the list of countries the id belongs to.
+        """
+        bitmap = self.members.get(id_, 0)
+        return [country for i, country in enumerate(self.countries) if bitmap >> i & 1]
+
+    def members_df(self, update = None):
+        """
+        A method used to get the country membership as rows of the join table.
+
+        Parameters
+        ----------
+        update : str
+            value of the update column (default None - the cycle name)
+
+        Returns
+        -------
+        pandas.DataFrame
+            a dataframe with track_id, country and update columns
+        """
+        rows = [(id_, country) for id_ in self.members for country in self.countries_of(id_)]
+        df = pd.DataFrame(rows, columns = ['track_id', 'country'])
+        df['update'] = update if update is not None else self.cycle
+        return df
+
+    def save(self, file_name):
+        """
+        A method used to write the registry to the binary file. Ids are
+        fixed-width records, so an id of another length raises ValueError
+        before the file is written.
+        """
+        for id_ in itertools.chain(self.members, self.fetched['artist']):
+            if len(id_.encode()) != ID_LENGTH:
+                raise ValueError('invalid spotify id: {!r}'.format(id_))
+
+        width = self._width()
+        with open(file_name, 'wb') as f:
+            header = {'cycle': self.cycle, 'countries': self.countries, 'width': width}
+            f.write(json.dumps(header).encode() + b'\n')
+            for id_, bitmap in self.members.items():
+                f.write(id_.encode()
+                        + bytes([FETCHED if id_ in self.fetched['track'] else 0])
+                        + bitmap.to_bytes(width, 'little'))
+            # artists have no country membership
+            for id_ in self.fetched['artist']:
+                f.write(id_.encode()
+                        + bytes([FETCHED | ARTIST])
+                        + bytes(width))
+
+    @classmethod
+    def load(cls, file_name):
+        """
+        A method used to read the registry from the binary file.
+        """
+        with open(file_name, 'rb') as f:
+            header = json.loads(f.readline())
+            registry = cls(header['cycle'])
+            registry.countries = header['countries']
+            size = ID_LENGTH + 1 + header['width']
+            while True:
+                record = f.read(size)
+                if len(record) < size:
+                    break
+                id_ = record[:ID_LENGTH].decode()
+                flags = record[ID_LENGTH]
+                if flags & ARTIST:
+                    registry.fetched['artist'].add(id_)
+                    continue
+                registry.members[id_] = int.from_bytes(record[ID_LENGTH + 1:], 'little')
+                if flags & FETCHED:
+                    registry.fetched['track'].add(id_)
+
+        return registry
+
+    def _width(self):
+        # number of bytes of the country bitmap
+        return max(1, (len(self.countries) + 7) // 8)
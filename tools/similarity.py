@@ -0,0 +1,385 @@
+# Current module provides a similarity index of the tracks by their audio
+# features. Features of the tracks dataframe (see getters.get_tracks_info) are
+# standardized into a float32 matrix, and the nearest tracks are searched by
+# the euclidean distance either exactly - the matrix is scanned in blocks, so
+# the memory does not grow with the number of tracks - or approximately by an
+# inverted file index (IVF): tracks are clustered by k-means and a query scans
+# only the clusters nearest to it. New tracks can be added to a built index,
+# its arrays grow by doubling their capacity, so adding the tracks by small
+# batches takes linear time.
+# The index is saved as .npy files, which are memory-mapped when loaded, so
+# a large index is ready at once and its pages are read on demand.
+
+
+import json
+import os
+import numpy as np
+import pandas as pd
+
+# features used for the similarity (duration and time signature are not)
+SIMILARITY_COLUMNS = ['danceability', 'energy', 'key', 'loudness', 'mode',
+                      'speechiness', 'acousticness', 'instrumentalness',
+                      'liveness', 'valence', 'tempo']
+
+# length of the spotify ids
+ID_LENGTH = 22
+
+
+def _array(name):
+    # property of the filled part of the array buffer, setting it replaces
+    # the buffer (the number of tracks is the length of the ids)
+    def get(self):
+        return self._buffers[name][:self._size]
+
+    def set(self, value):
+        self._buffers[name] = value
+        if name == 'ids':
+            self._size = len(value)
+
+    return property(get, set)
+
+
+class SimilarityIndex:
+    """
+    A k nearest neighbours index of the tracks audio features. It is built
+    by the from_df method.
+
+    Parameters
+    ----------
+    mean : numpy.ndarray
+        means of the features used for the standardization
+    std : numpy.ndarray
+        standard deviations of the features
+    n_probe : int
+        number of the clusters scanned by an approximate query (default 8)
+    block_size : int
+        number of tracks scanned at once by an exact query (default 16384)
+    """
+
+    def __init__(
+            self,
+            mean,
+            std,
+            n_probe = 8,
+            block_size = 16384
+            ):
+        self.mean = np.asarray(mean, dtype = np.float32)
+        self.std = np.asarray(std, dtype = np.float32)
+        self.n_probe = n_probe
+        self.block_size = block_size
+        self._size = 0 # number of tracks, the buffers may be longer
+        self._buffers = {}
+        self.ids = np.empty(0, dtype = 'S%d' % ID_LENGTH)
+        self.vectors = np.empty((0, len(SIMILARITY_COLUMNS)), dtype = np.float32)
+        self.norms = np.empty(0, dtype = np.float32) # squared norms of the vectors
+        self.centroids = None # cluster centroids of the IVF
+        self.assign = np.empty(0, dtype = np.int32) # cluster of every track
+        self._lists = None # tracks ordered by the cluster and cluster offsets
+        self._rows = None # mapping from the id to the row
+
+    ids = _array('ids')
+    vectors = _array('vectors')
+    norms = _array('norms')
+    assign = _array('assign')
+
+    def __len__(self):
+        return self._size
+
+    @classmethod
+    def from_df(
+            cls,
+            df,
+            n_lists = None,
+            n_probe = 8,
+            seed = 0
+            ):
+        """
+        A method used to build the index of the tracks dataframe.
+
+        Parameters
+        ----------
+        df : pandas.DataFrame
+            tracks dataframe indexed by id with SIMILARITY_COLUMNS
+        n_lists : int
+            number of the IVF clusters (default None - square root of the
+            number of tracks, 0 - no approximate index)
+        n_probe : int
+            number of the clusters scanned by an approximate query (default 8)
+        seed : int
+            seed of the k-means initialization (default 0)
+
+        Returns
+        -------
+        SimilarityIndex
+
+        """
+
+        values = df[SIMILARITY_COLUMNS].to_numpy(dtype = np.float32, na_value = np.nan)
+        std = np.nanstd(values, axis = 0)
+        index = cls(np.nanmean(values, axis = 0), np.where(std > 0, std, 1), n_probe)
+
+        if n_lists is None:
+            n_lists = int(np.sqrt(len(df)))
+        if n_lists:
+            index.train(index.normalize(values), n_lists, seed)
+        index.add(df)
+
+        return index
+
+    def normalize(self, values):
+        """
+        A method used to standardize the features (missing ones become the mean).
+        """
+        vectors = (np.asarray(values, dtype = np.float32) - self.mean) / self.std
+        return np.nan_to_num(vectors, nan = 0.0)
+
+    def train(
+            self,
+            vectors,
+            n_lists,
+            seed = 0,
+            iterations = 10,
+            sample = 100000
+            ):
+        """
+        A method used to find the IVF clusters by k-means on a sample of the
+        normalized vectors.
+        """
+        rnd = np.random.default_rng(seed)
+        if len(vectors) > sample:
+            vectors = vectors[rnd.choice(len(vectors), sample, replace = False)]
+        n_lists = min(n_lists, len(vectors))
+        centroids = vectors[rnd.choice(len(vectors), n_lists, replace = False)].copy()
+
+        for _ in range(iterations):
+            assign = self._nearest_centroid(vectors, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, vectors)
+            sizes = np.bincount(assign, minlength = n_lists)
+            # empty clusters keep their centroids
+            filled = sizes > 0
+            centroids[filled] = sums[filled] / sizes[filled, None]
+
+        self.centroids = centroids
+
+    def _nearest_centroid(self, vectors, centroids):
+        # cluster of every vector, computed in blocks
+        assign = np.empty(len(vectors), dtype = np.int32)
+        norms = (centroids ** 2).sum(axis = 1)
+        for start in range(0, len(vectors), self.block_size):
+            block = vectors[start:start + self.block_size]
+            assign[start:start + len(block)] = np.argmin(norms - 2 * block @ centroids.T, axis = 1)
+        return assign
+
+    def add(self, df):
+        """
+        A method used to add the tracks of the dataframe to the index (tracks
+        which are already in the index are skipped).
+
+        Returns
+        -------
+        int
+            number of added tracks
+        """
+        rows = self.rows()
+        ids = df.index.astype(str).to_numpy().astype('S%d' % ID_LENGTH)
+        new = np.array([id_ not in rows for id_ in ids], dtype = bool) & ~df.index.duplicated()
+        df, ids = df[new], ids[new]
+        if not len(df):
+            return 0
+
+        vectors = self.normalize(df[SIMILARITY_COLUMNS].to_numpy(dtype = np.float32,
+                                                                  na_value = np.nan))
+        for i, id_ in enumerate(ids.tolist(), self._size):
+            rows[id_] = i
+
+        start, end = self._size, self._size + len(df)
+        self._reserve(end)
+        self._buffers['ids'][start:end] = ids
+        self._buffers['vectors'][start:end] = vectors
+        self._buffers['norms'][start:end] = (vectors ** 2).sum(axis = 1)
+        if self.centroids is not None:
+            self._buffers['assign'][start:end] = self._nearest_centroid(vectors, self.centroids)
+            self._lists = None
+        self._size = end
+
+        return len(df)
+
+    def _reserve(self, size):
+        # buffers are grown to at least twice their capacity, the read only
+        # (memory-mapped) ones are copied to the memory
+        for name, buffer in self._buffers.items():
+            if name == 'assign' and self.centroids is None:
+                continue
+            if len(buffer) < size or not buffer.flags.writeable:
+                grown = np.empty((max(size, 2 * len(buffer)),) + buffer.shape[1:],
+                                 dtype = buffer.dtype)
+                filled = buffer[:self._size]
+                grown[:len(filled)] = filled
+                self._buffers[name] = grown
+
+    def rows(self):
+        """
+        A method used to get the mapping from the id (bytes) to the row of the index.
+        """
+        if self._rows is None:
+            self._rows = {id_ : i for i, id_ in enumerate(self.ids.tolist())}
+        return self._rows
+
+    def search(
+            self,
+            vectors,
+            k = 10,
+            exact = False,
+            exclude = None
+            ):
+        """
+        A method used to find the k nearest tracks of every query vector.
+
+        Parameters
+        ----------
+        vectors : numpy.ndarray
+            normalized query vectors (see normalize)
+        k : int
+            number of the neighbours (default 10)
+        exact : bool
+            scan all the tracks instead of the nearest clusters (default False,
+            the index without clusters is always scanned exactly)
+        exclude : numpy.ndarray
+            row of the index excluded from the result of every query, e.g. the
+            query track itself (default None)
+
+        Returns
+        -------
+        ids : numpy.ndarray
+            (queries, k) array of the ids (bytes) of the neighbours
+        distances : numpy.ndarray
+            (queries, k) array of their euclidean distances
+
+        """
+
+        vectors = np.atleast_2d(np.asarray(vectors, dtype = np.float32))
+        if exact or self.centroids is None:
+            rows, distances = self._search_exact(vectors, k, exclude)
+        else:
+            rows, distances = self._search_ivf(vectors, k, exclude)
+
+        # excluded rows and missing neighbours have infinite distances
+        rows = np.where(np.isinf(distances), -1, rows)
+        ids = np.where(rows >= 0, self.ids[np.maximum(rows, 0)], b'')
+        return ids, np.sqrt(np.maximum(distances, 0))
+
+    def similar(
+            self,
+            tracks_ids,
+            k = 10,
+            exact = False
+            ):
+        """
+        A method used to find the k nearest tracks of the tracks of the index.
+
+        Returns
+        -------
+        pandas.DataFrame
+            a dataframe with id, similar_id, distance columns (k rows for
+            every track)
+        """
+        rows = self.rows()
+        query = np.array([rows[id_.encode()] for id_ in tracks_ids], dtype = np.int64)
+        ids, distances = self.search(self.vectors[query], k, exact, exclude = query)
+
+        return pd.DataFrame({'id': np.repeat(list(tracks_ids), ids.shape[1]),
+                             'similar_id': ids.ravel().astype(str),
+                             'distance': distances.ravel()})
+
+    def _top_k(self, rows, distances, k):
+        # k smallest distances of every row, ordered
+        if distances.shape[1] > k:
+            part = np.argpartition(distances, k - 1, axis = 1)[:, :k]
+            rows = np.take_along_axis(rows, part, axis = 1)
+            distances = np.take_along_axis(distances, part, axis = 1)
+        order = np.argsort(distances, axis = 1)
+        return np.take_along_axis(rows, order, axis = 1), np.take_along_axis(distances, order, axis = 1)
+
+    def _search_exact(self, vectors, k, exclude):
+        query_norms = (vectors ** 2).sum(axis = 1)[:, None]
+        best_rows = np.full((len(vectors), 0), -1, dtype = np.int64)
+        best = np.empty((len(vectors), 0), dtype = np.float32)
+
+        for start in range(0, len(self.ids), self.block_size):
+            block = self.vectors[start:start + self.block_size]
+            distances = query_norms + self.norms[start:start + len(block)] - 2 * vectors @ block.T
+            if exclude is not None:
+                local = np.asarray(exclude) - start
+                inside = (local >= 0) & (local < len(block))
+                distances[np.nonzero(inside)[0], local[inside]] = np.inf
+            # k nearest of the block are merged with the k nearest so far
+            top = min(k, len(block))
+            part = np.argpartition(distances, top - 1, axis = 1)[:, :top]
+            best_rows, best = self._top_k(np.hstack([best_rows, part + start]),
+                                          np.hstack([best, np.take_along_axis(distances, part, axis = 1)]),
+                                          k)
+
+        return self._pad(best_rows, best, k)
+
+    def _search_ivf(self, vectors, k, exclude):
+        # tracks ordered by their clusters
+        if self._lists is None:
+            order = np.argsort(self.assign, kind = 'stable')
+            offsets = np.searchsorted(self.assign[order], np.arange(len(self.centroids) + 1))
+            self._lists = order, offsets
+        order, offsets = self._lists
+
+        norms = (self.centroids ** 2).sum(axis = 1)
+        probe = np.argsort(norms - 2 * vectors @ self.centroids.T, axis = 1)[:, :self.n_probe]
+
+        best_rows = np.full((len(vectors), k), -1, dtype = np.int64)
+        best = np.full((len(vectors), k), np.inf, dtype = np.float32)
+        for i, (vector, lists) in enumerate(zip(vectors, probe)):
+            rows = np.concatenate([order[offsets[c]:offsets[c + 1]] for c in lists])
+            if exclude is not None:
+                rows = rows[rows != exclude[i]]
+            distances = (vector ** 2).sum() + self.norms[rows] - 2 * self.vectors[rows] @ vector
+            top_rows, top = self._top_k(rows[None, :], distances[None, :], k)
+            best_rows[i, :top_rows.shape[1]] = top_rows[0]
+            best[i, :top.shape[1]] = top[0]
+
+        return best_rows, best
+
+    def _pad(self, rows, distances, k):
+        # fewer than k tracks are padded by -1 rows with infinite distance
+        if rows.shape[1] < k:
+            pad = k - rows.shape[1]
+            rows = np.pad(rows, ((0, 0), (0, pad)), constant_values = -1)
+            distances = np.pad(distances, ((0, 0), (0, pad)), constant_values = np.inf)
+        return rows, distances
+
+    def save(self, path):
+        """
+        A method used to write the index to the directory.
+        """
+        os.makedirs(path, exist_ok = True)
+        for name in ['ids', 'vectors', 'norms', 'assign']:
+            np.save(os.path.join(path, name + '.npy'), getattr(self, name))
+        if self.centroids is not None:
+            np.save(os.path.join(path, 'centroids.npy'), self.centroids)
+        with open(os.path.join(path, 'meta.json'), 'w') as f:
+            json.dump({'mean': self.mean.tolist(), 'std': self.std.tolist(),
+                       'n_probe': self.n_probe, 'block_size': self.block_size,
+                       'columns': SIMILARITY_COLUMNS}, f)
+
+    @classmethod
+    def load(cls, path, mmap = True):
+        """
+        A method used to read the index from the directory, the arrays are
+        memory-mapped (read only until the first add) unless mmap is False.
+        """
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        index = cls(meta['mean'], meta['std'], meta['n_probe'], meta['block_size'])
+        mode = 'r' if mmap else None
+        for name in ['ids', 'vectors', 'norms', 'assign']:
+            setattr(index, name, np.load(os.path.join(path, name + '.npy'), mmap_mode = mode))
+        if os.path.exists(os.path.join(path, 'centroids.npy')):
+            index.centroids = np.load(os.path.join(path, 'centroids.npy'))
+        return index
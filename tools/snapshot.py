@@ -0,0 +1,403 @@
+# Current module provides a local store of the run snapshots, so the later
+# runs and analysis jobs start from the data of the previous ones instead of
+# re-downloading it or parsing .csv and yaml files. A snapshot is a directory
+# with a .npy file per column of the tracks and artists dataframes (and of the
+# id lists, e.g. the ids of the released albums) plus a manifest.json. All the
+# ids of the snapshot are kept once in a sorted dictionary of fixed-width
+# 22-byte strings, id columns are int32 positions in it (-1 for the missing
+# ids, e.g. the artists of the local tracks). Opening a snapshot memory-maps
+# the files, so it takes milliseconds and the columns are NumPy views of the
+# files without copies. The manifest is written last and the directory is
+# renamed into place, so a snapshot is either complete or absent.
+
+
+import json
+import os
+import shutil
+import time
+import numpy as np
+import pandas as pd
+
+# version of the snapshot layout
+VERSION = 1
+
+# length of the spotify ids
+ID_LENGTH = 22
+
+# name of the manifest file
+MANIFEST = 'manifest.json'
+
+
+def is_id_column(column):
+    # id columns (the index of the tracks and artists dataframes and the
+    # artist_id column of the tracks) are stored as positions in the dictionary
+    return column == 'id' or column.endswith('_id')
+
+
+def _id_strings(ids):
+    # fixed-width bytes of the present ids and the mask of the missing ones,
+    # ids of another length are rejected instead of being truncated
+    ids = np.asarray(ids, dtype = object)
+    mask = np.asarray(pd.isna(ids), dtype = bool)
+    present = np.asarray(ids[~mask].tolist(), dtype = str)
+    if len(present):
+        invalid = np.char.str_len(present) != ID_LENGTH
+        if invalid.any():
+            id_ = str(present[np.flatnonzero(invalid)[0]])
+            raise ValueError('invalid spotify id: {!r}'.format(id_))
+    return present.astype('S%d' % ID_LENGTH), mask
+
+
+def _encode_strings(values):
+    # variable width strings as utf-8 bytes and offsets of every string,
+    # missing values are marked by the mask
+    mask = pd.isna(values)
+    encoded = [b'' if missing else str(value).encode() for value, missing in zip(values, mask)]
+    offsets = np.zeros(len(encoded) + 1, dtype = np.int64)
+    np.cumsum([len(value) for value in encoded], out = offsets[1:])
+    data = np.frombuffer(b''.join(encoded), dtype = np.uint8)
+    return data, offsets, mask
+
+
+def _decode_strings(data, offsets, mask = None):
+    buffer = data.tobytes()
+    values = [buffer[start:end].decode() for start, end in zip(offsets[:-1].tolist(),
+                                                               offsets[1:].tolist())]
+    if mask is not None:
+        values = [None if missing else value for value, missing in zip(values, mask)]
+    return values
+
+
+def write_snapshot(
+        root,
+        tables,
+        lists = {},
+        name = None,
+        meta = {}
+        ):
+    """
+    A function used to write the dataframes and id lists of the run to a new
+    snapshot.
+
+    Parameters
+    ----------
+    root : str
+        path to the directory of the snapshots
+    tables : dict
+        mapping from the table name to the dataframe, e.g. {'tracks': df,
+        'artists': df_a} (see getters.get_tracks_info and get_artists_info)
+    lists : dict
+        mapping from the list name to the list of ids, e.g. {'albums':
+        albums_ids} (default {})
+    name : str
+        name of the snapshot directory (default None - the time of the run)
+    meta : dict
+        additional json fields of the manifest, e.g. {'country': 'RU'}
+        (default {})
+
+    Returns
+    -------
+    str
+        full name of the snapshot directory
+
+    """
+
+    name = name or time.strftime('%Y%m%dT%H%M%S')
+    path = os.path.join(root, name)
+    temp = path + '.tmp'
+    shutil.rmtree(temp, ignore_errors = True)
+    os.makedirs(temp)
+
+    # sorted dictionary of all the ids of the snapshot
+    id_arrays = [_id_strings(ids)[0] for ids in lists.values()]
+    for df in tables.values():
+        id_arrays.append(_id_strings(df.index)[0])
+        id_arrays += [_id_strings(df[column])[0] for column in df if is_id_column(column)]
+    dictionary = np.unique(np.concatenate(id_arrays)) if id_arrays else \
+                 np.empty(0, dtype = 'S%d' % ID_LENGTH)
+    np.save(os.path.join(temp, 'ids.npy'), dictionary)
+
+    def save(file_name, array):
+        np.save(os.path.join(temp, file_name), array)
+        return file_name
+
+    def save_ids(file_name, ids):
+        strings, mask = _id_strings(ids)
+        codes = np.full(len(mask), -1, dtype = np.int32)
+        codes[~mask] = np.searchsorted(dictionary, strings)
+        return save(file_name, codes)
+
+    manifest = dict(meta, version = VERSION, created = time.time(), tables = {},
+                    lists = {}, ids = len(dictionary))
+
+    for list_name, ids in lists.items():
+        manifest['lists'][list_name] = {'file': save_ids('list.{}.npy'.format(list_name), ids),
+                                        'rows': len(ids)}
+
+    for table, df in tables.items():
+        index = df.index.name or 'id'
+        columns = {index: {'kind': 'id', 'dtype': 'string',
+                           'files': [save_ids('{}.{}.npy'.format(table, index), df.index)]}}
+        for column in df:
+            prefix = '{}.{}'.format(table, column)
+            series = df[column]
+            dtype = str(series.dtype)
+            if is_id_column(column):
+                kind = 'id'
+                files = [save_ids(prefix + '.npy', series)]
+            elif isinstance(series.dtype, pd.CategoricalDtype):
+                kind = 'category'
+                data, offsets, _ = _encode_strings(series.cat.categories)
+                files = [save(prefix + '.npy', series.cat.codes.to_numpy()),
+                         save(prefix + '.categories.npy', data),
+                         save(prefix + '.offsets.npy', offsets)]
+            elif pd.api.types.is_numeric_dtype(series) or \
+                 pd.api.types.is_datetime64_any_dtype(series):
+                kind = 'values'
+                mask = series.isna().to_numpy()
+                if pd.api.types.is_extension_array_dtype(series):
+                    # nullable integers keep 0 in the place of the missing values
+                    values = series.to_numpy(dtype = series.dtype.numpy_dtype,
+                                             na_value = 0)
+                else:
+                    values = series.to_numpy()
+                files = [save(prefix + '.npy', values)]
+                if mask.any() and pd.api.types.is_extension_array_dtype(series):
+                    files.append(save(prefix + '.mask.npy', mask))
+            else:
+                kind = 'string'
+                data, offsets, mask = _encode_strings(series.to_numpy())
+                files = [save(prefix + '.npy', data), save(prefix + '.offsets.npy', offsets)]
+                if mask.any():
+                    files.append(save(prefix + '.mask.npy', mask))
+            columns[column] = {'kind': kind, 'dtype': dtype, 'files': files}
+        manifest['tables'][table] = {'rows': len(df), 'index': index, 'columns': columns}
+
+    # manifest marks the snapshot as complete
+    with open(os.path.join(temp, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent = 2)
+    shutil.rmtree(path, ignore_errors = True)
+    os.rename(temp, path)
+
+    return path
+
+
+def latest_snapshot(
+        root,
+        **meta
+        ):
+    """
+    A function used to find the latest complete snapshot whose manifest
+    contains the given fields, e.g. latest_snapshot(root, country = 'RU').
+
+    Returns
+    -------
+    str
+        full name of the snapshot directory (None if there is no snapshot)
+
+    """
+
+    latest, created = None, None
+    for name in os.listdir(root) if os.path.isdir(root) else []:
+        file_name = os.path.join(root, name, MANIFEST)
+        if name.endswith('.tmp') or not os.path.exists(file_name):
+            continue
+        with open(file_name) as f:
+            manifest = json.load(f)
+        if any(manifest.get(key) != value for key, value in meta.items()):
+            continue
+        if created is None or manifest['created'] > created:
+            latest, created = os.path.join(root, name), manifest['created']
+    return latest
+
+
+class Snapshot:
+    """
+    A snapshot opened for reading. All the arrays are memory-mapped read only,
+    so they are loaded lazily by the pages which are actually read.
+
+    Parameters
+    ----------
+    path : str
+        full name of the snapshot directory (see write_snapshot)
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, MANIFEST)) as f:
+            self.manifest = json.load(f)
+        if self.manifest['version'] != VERSION:
+            raise ValueError('unsupported snapshot version: {}'.format(self.manifest['version']))
+        self.ids = self._load('ids.npy') # sorted dictionary of the ids
+        self._arrays = {}
+
+    def _load(self, file_name):
+        return np.load(os.path.join(self.path, file_name), mmap_mode = 'r')
+
+    def _array(self, file_name):
+        array = self._arrays.get(file_name)
+        if array is None:
+            array = self._arrays[file_name] = self._load(file_name)
+        return array
+
+    def _column(self, table, column):
+        try:
+            return self.manifest['tables'][table]['columns'][column]
+        except KeyError:
+            raise KeyError('no column {} in the table {}'.format(column, table)) from None
+
+    @property
+    def tables(self):
+        return list(self.manifest['tables'])
+
+    def columns(self, table):
+        """
+        A method used to get the names of the columns of the table (the index
+        first).
+        """
+        return list(self.manifest['tables'][table]['columns'])
+
+    def column(self, table, column):
+        """
+        A method used to get the array of the column without copying it:
+        positions in the ids dictionary for the id columns (-1 for the missing
+        ids), category codes for
+        the categories, utf-8 bytes for the strings (see offsets) and values
+        for the numeric columns (see mask for the missing ones).
+        """
+        return self._array(self._column(table, column)['files'][0])
+
+    def offsets(self, table, column):
+        """
+        A method used to get the offsets of the strings of the string column
+        (the string i is data[offsets[i]:offsets[i + 1]]).
+        """
+        return self._array(self._column(table, column)['files'][1])
+
+    def categories(self, table, column):
+        """
+        A method used to get the categories of the category column.
+        """
+        files = self._column(table, column)['files']
+        return _decode_strings(self._array(files[1]), self._array(files[2]))
+
+    def mask(self, table, column):
+        """
+        A method used to get the mask of the missing values of the column
+        (None if there are no missing values).
+        """
+        files = [name for name in self._column(table, column)['files']
+                 if name.endswith('.mask.npy')]
+        return self._array(files[0]) if files else None
+
+    def id_list(self, name):
+        """
+        A method used to get the list of ids (e.g. the ids of the albums which
+        read_yaml used to read from the config).
+        """
+        codes = self._array(self.manifest['lists'][name]['file'])
+        return self._ids(codes).tolist()
+
+    def _ids(self, codes):
+        # ids of the positions in the dictionary, None for the missing ones
+        codes = np.asarray(codes)
+        ids = self.ids[np.maximum(codes, 0)].astype(str).astype(object) if len(self.ids) \
+              else np.full(len(codes), None, dtype = object)
+        ids[codes < 0] = None
+        return ids
+
+    def lookup(self, ids):
+        """
+        A method used to find the positions of the ids in the dictionary by
+        the binary search.
+
+        Parameters
+        ----------
+        ids : list of str
+            ids to look up
+
+        Returns
+        -------
+        numpy.ndarray
+            int32 positions of the ids, -1 for the ids out of the snapshot
+
+        """
+
+        ids = np.asarray(ids, dtype = 'S%d' % ID_LENGTH)
+        positions = np.searchsorted(self.ids, ids)
+        positions = np.minimum(positions, len(self.ids) - 1) if len(self.ids) else positions
+        found = (positions < len(self.ids)) & (self.ids[positions] == ids) if len(self.ids) \
+                else np.zeros(len(ids), dtype = bool)
+        return np.where(found, positions, -1).astype(np.int32)
+
+    def rows(self, table, ids):
+        """
+        A method used to find the rows of the table with the given ids.
+
+        Returns
+        -------
+        numpy.ndarray
+            row numbers of the ids, -1 for the ids out of the table
+
+        """
+
+        index = self.manifest['tables'][table]['index']
+        codes = self.column(table, index)
+        # sorting by the codes is sorting by the ids
+        order = np.argsort(codes, kind = 'stable')
+        positions = self.lookup(ids)
+        found = np.searchsorted(codes[order], positions)
+        found = np.minimum(found, len(codes) - 1)
+        hit = (positions >= 0) & (codes[order][found] == positions)
+        return np.where(hit, order[found], -1)
+
+    def to_df(
+            self,
+            table,
+            columns = None
+            ):
+        """
+        A method used to construct the dataframe of the table with the same
+        columns and types as written (the values are copied from the files).
+
+        Parameters
+        ----------
+        table : str
+            name of the table, e.g. 'tracks'
+        columns : list of str
+            columns to read (default None - all the columns)
+
+        Returns
+        -------
+        pandas.DataFrame
+            the dataframe indexed by the id
+
+        """
+
+        spec = self.manifest['tables'][table]
+        index = spec['index']
+        columns = [column for column in spec['columns']
+                   if column != index and (columns is None or column in columns)]
+
+        data = {}
+        for column in columns:
+            info = spec['columns'][column]
+            array = self.column(table, column)
+            if info['kind'] == 'id':
+                data[column] = pd.array(self._ids(array), dtype = 'object') \
+                                 .astype(info['dtype'])
+            elif info['kind'] == 'category':
+                data[column] = pd.Categorical.from_codes(np.asarray(array),
+                                                         self.categories(table, column))
+            elif info['kind'] == 'values':
+                data[column] = pd.array(np.array(array), dtype = info['dtype'])
+                mask = self.mask(table, column)
+                if mask is not None:
+                    data[column][np.asarray(mask)] = pd.NA
+            else:
+                values = _decode_strings(array, self.offsets(table, column),
+                                         self.mask(table, column))
+                data[column] = pd.array(values, dtype = 'object').astype(info['dtype'])
+
+        ids = self._ids(self.column(table, index))
+        return pd.DataFrame(data, index = pd.Index(ids, name = index), copy = False)
@@ -0,0 +1,262 @@
+# Current module provides a client side throttler for the spotify api. All the
+# requests of the getters go through a single token bucket, so parallel getters
+# share one request rate. When the api answers with 429 (Too Many Requests) the
+# rate is halved, all the requests are paused for the Retry-After interval and
+# the failed request is retried with jittered backoff. The rate slowly grows
+# back while requests succeed.
+#
+# The wrapped spotipy client should be created with the session of
+# retry_session, which retries only the connection errors and 5xx responses:
+# with the default session urllib3 retries 429 responses by itself, and the
+# exhausted retries (of 429 and of 5xx alike) reach the throttler as 429
+# without the Retry-After header.
+
+
+import random
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from spotipy.exceptions import SpotifyException
+from urllib3.util.retry import Retry
+from tools.metrics import count
+from tools.metrics import observe
+
+
+def retry_session(
+        retries = 3,
+        backoff_factor = 0.3
+        ):
+    """
+    A function used to create the requests session of the wrapped spotify
+    client, e.g. spotipy.Spotify(..., requests_session = retry_session()).
+    Connection errors and 5xx responses are retried with backoff, 429
+    responses are returned at once, so the throttler gets them with their
+    headers, and the exhausted retries of 5xx keep their status.
+
+    Parameters
+    ----------
+    retries : int
+        maximum number of retries of a request (default 3)
+    backoff_factor : float
+        backoff factor of urllib3 between the retries (default 0.3)
+
+    Returns
+    -------
+    requests.Session
+        the session with the retrying adapter
+
+    """
+
+    retry = Retry(total = retries,
+                  connect = None,
+                  read = False,
+                  status = retries,
+                  allowed_methods = frozenset(['GET', 'POST', 'PUT', 'DELETE']),
+                  status_forcelist = (500, 502, 503, 504),
+                  backoff_factor = backoff_factor,
+                  # 429 is left to the throttler
+                  respect_retry_after_header = False,
+                  # the last response is returned instead of RetryError
+                  raise_on_status = False)
+    session = requests.Session()
+    adapter = HTTPAdapter(max_retries = retry)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+class TokenBucket:
+    """
+    A thread safe token bucket which releases rate tokens per second and
+    keeps at most capacity of them.
+
+    Parameters
+    ----------
+    rate : float
+        number of tokens released per second
+    capacity : int
+        maximum number of accumulated tokens (size of a burst)
+    """
+
+    def __init__(
+            self,
+            rate,
+            capacity
+            ):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+        A method used to take a token, it blocks until the token is available.
+
+        Returns
+        -------
+        waited : float
+            time in seconds spent waiting for the token
+
+        """
+        waited = 0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                # no tokens are released during the pause, so the calls
+                # resume at the rate instead of a full burst
+                start = max(self._updated, min(now, self._paused_until))
+                self.tokens = min(self.capacity,
+                                  self.tokens + (now - start) * self.rate)
+                self._updated = now
+                if now < self._paused_until:
+                    delay = self._paused_until - now
+                elif self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                else:
+                    delay = (1 - self.tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+    def pause(self, delay):
+        """
+        A method used to stop releasing tokens for delay seconds.
+
+        Returns
+        -------
+        bool
+            True if the bucket was not paused before the call
+        """
+        with self._lock:
+            now = time.monotonic()
+            started = now >= self._paused_until
+            self._paused_until = max(self._paused_until, now + delay)
+            self.tokens = 0
+            return started
+
+
+class ThrottledSpotify:
+    """
+    A wrapper around the spotify client which passes every api call through
+    the shared token bucket and retries the calls answered with 429.
+
+    Parameters
+    ----------
+    spotify : spotify.client.Spotify() instance
+        Spotify API client with valid credentials (created with
+        requests_session = retry_session())
+    rate : float
+        initial number of requests per second (default 10.0)
+    max_rate : float
+        upper bound of the adapted rate (default 20.0)
+    min_rate : float
+        lower bound of the adapted rate (default 0.5)
+    burst : int
+        maximum number of requests sent at once (default 10)
+    max_retries : int
+        maximum number of retries of a single call (default 5)
+    backoff : float
+        base of the exponential backoff in seconds, used when the response
+        has no Retry-After header (default 1.0)
+    """
+
+    def __init__(
+            self,
+            spotify,
+            rate = 10.0,
+            max_rate = 20.0,
+            min_rate = 0.5,
+            burst = 10,
+            max_retries = 5,
+            backoff = 1.0
+            ):
+        self.spotify = spotify
+        self.max_rate = max_rate
+        self.min_rate = min_rate
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.bucket = TokenBucket(rate, burst)
+
+        # metrics of the throttler
+        self.started = time.monotonic()
+        self.requests = {} # number of requests for every endpoint
+        self.retries = {} # number of retries for every endpoint
+        self.throttled = 0 # total time spent waiting for tokens
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        attr = getattr(self.spotify, name)
+        # only the public methods of the client make api calls
+        if name.startswith('_') or not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            return self._call(name, attr, *args, **kwargs)
+
+        return call
+
+    def metrics(self):
+        """
+        A method used to get the metrics of the throttler.
+
+        Returns
+        -------
+        dict
+            'requests_per_sec' - average request rate since creation,
+            'rate' - current allowed request rate,
+            'throttled_time' - total time in seconds the calls were waiting,
+            'requests' and 'retries' - counters for every endpoint
+
+        """
+        with self._lock:
+            total = sum(self.requests.values())
+            return {'requests_per_sec': total / (time.monotonic() - self.started),
+                    'rate': self.bucket.rate,
+                    'throttled_time': self.throttled,
+                    'requests': dict(self.requests),
+                    'retries': dict(self.retries)}
+
+    def _call(self, endpoint, method, *args, **kwargs):
+        attempt = 0
+        while True:
+            waited = self.bucket.acquire()
+            with self._lock:
+                self.throttled += waited
+                self.requests[endpoint] = self.requests.get(endpoint, 0) + 1
+            try:
+                result = method(*args, **kwargs)
+            except SpotifyException as err:
+                if err.http_status != 429 or attempt >= self.max_retries:
+                    raise
+                delay = self._on_throttled(endpoint, err, attempt)
+                attempt += 1
+                count('retries', endpoint = endpoint)
+                observe('throttled_seconds', delay, endpoint = endpoint)
+                time.sleep(delay)
+                with self._lock:
+                    self.throttled += delay
+            else:
+                # additive increase of the rate after a successful request
+                with self._lock:
+                    self.bucket.rate = min(self.max_rate, self.bucket.rate + 0.1)
+                return result
+
+    def _on_throttled(self, endpoint, err, attempt):
+        # compute the delay before retrying and slow down all the requests
+        retry_after = (err.headers or {}).get('Retry-After')
+        if retry_after is not None:
+            delay = float(retry_after) + random.uniform(0, 1)
+        else:
+            delay = random.uniform(0, self.backoff * 2 ** attempt)
+
+        with self._lock:
+            self.retries[endpoint] = self.retries.get(endpoint, 0) + 1
+            # multiplicative decrease of the rate (once for all the concurrent
+            # requests throttled during the same pause)
+            if self.bucket.pause(delay):
+                self.bucket.rate = max(self.min_rate, self.bucket.rate / 2)
+
+        return delay
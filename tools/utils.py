@@ -2,6 +2,7 @@
 # api responces. It is assumed that some getters from getters module will be 
 # parametrized from corresponding yaml configuration files. Some functions 
 # from this module helps user to write that files and to read from them.
+# Large id lists are handed off faster by the binary files of idlists module.
 
 
 from os.path import expanduser
@@ -72,3 +73,38 @@ def read_yaml(
     
     # get from structure data specified by key
     return templates[key] 
+
+
+def unique_items(
+        items,
+        key = 'id'
+        ):
+    """
+    A function used to filter api response items for unique values only. 
+    Items are compared by the key field through a hash set, so the whole 
+    filtering takes linear time. The first occurrence of every item is kept
+    and the order of items is preserved, empty (None) items are skipped.
+
+    Parameters
+    ----------
+    items : list of dict
+        list of items from the api responses
+    key : str
+        name of the item field which identifies it. The default is 'id'.
+
+    Returns
+    -------
+    unique : list of dict
+        The list of unique items in the order of their first occurrence
+
+    """
+    
+    seen = set() # keys of already collected items
+    unique = [] # list for unique items
+    
+    for item in items:
+        if item is not None and item[key] not in seen:
+            seen.add(item[key])
+            unique.append(item)
+    
+    return unique
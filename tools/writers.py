@@ -0,0 +1,263 @@
+# Current module provides an output layer for the dataframes collected by the
+# getters. Besides the .csv files it can write columnar Parquet and Feather
+# (Arrow IPC) files with explicit schemas, so the readers get the same dtypes
+# back without inferring them. Files may be partitioned by country and update
+# date into hive-style directories (<column>=<value>/). Parquet and Feather
+# require the optional pyarrow package.
+
+
+import os
+import pandas as pd
+from tools.metrics import traced
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+# file extension of every supported format
+EXTENSIONS = {'csv': '.csv',
+              'parquet': '.parquet',
+              'feather': '.feather'}
+
+# suffix of the compressed csv files, so the readers infer the codec by it
+CSV_SUFFIXES = {'gzip': '.gz',
+                'bz2': '.bz2',
+                'xz': '.xz',
+                'zstd': '.zst'}
+
+# types of the tracks dataframe columns (including the id index)
+TRACK_SCHEMA = {'id': 'string',
+                'name': 'string',
+                'artist_id': 'string',
+                'artist_name': 'string',
+                'popularity': 'int16',
+                'release_date': 'date32',
+                'update': 'date32',
+                'danceability': 'float32',
+                'energy': 'float32',
+                'key': 'int16',
+                'loudness': 'float32',
+                'mode': 'int16',
+                'speechiness': 'float32',
+                'acousticness': 'float32',
+                'instrumentalness': 'float32',
+                'liveness': 'float32',
+                'valence': 'float32',
+                'tempo': 'float32',
+                'duration_ms': 'int32',
+                'time_signature': 'int16'}
+
+# types of the artists dataframe columns (including the artist_id index)
+ARTIST_SCHEMA = {'artist_id': 'string',
+                 'artist_name': 'string',
+                 'artist_popularity': 'int16',
+                 'artist_genre': 'string',
+                 'artist_followers': 'int32',
+                 'update': 'date32'}
+
+
+def arrow_schema(schema):
+    """
+    A function used to construct the pyarrow schema from the mapping of column
+    names to the type names (e.g. TRACK_SCHEMA).
+    """
+    return pa.schema([(column, getattr(pa, type_)()) for column, type_ in schema.items()])
+
+
+def cast_df(
+        df,
+        schema
+        ):
+    """
+    A function used to cast columns of the dataframe to the types of the schema.
+    Integer columns get nullable pandas types, date columns are parsed (partial
+    dates such as '2020' or '2020-05' become the first day of the period).
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        dataframe with the index reset to a column
+    schema : dict
+        mapping from the column name to the type name
+
+    Returns
+    -------
+    pandas.DataFrame
+        dataframe with casted columns
+
+    """
+
+    df = df.copy()
+    for column, type_ in schema.items():
+        if column not in df:
+            continue
+        if type_ == 'date32':
+            df[column] = pd.to_datetime(df[column], format = 'mixed',
+                                        errors = 'coerce').dt.date
+        elif type_.startswith('int'):
+            df[column] = pd.to_numeric(df[column]).astype(type_.capitalize())
+        elif type_.startswith('float'):
+            df[column] = pd.to_numeric(df[column]).astype(type_)
+    return df
+
+
+def write_df(
+        df,
+        path,
+        name,
+        fmt = 'csv',
+        schema = None,
+        compression = None,
+        partition_cols = None
+        ):
+    """
+    A function used to write the dataframe (with its index as the first
+    column) to the file of the chosen format.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        dataframe to write
+    path : str
+        path to the directory in which will be saved the file
+    name : str
+        name of the file without extension
+    fmt : str
+        'csv', 'parquet' or 'feather' (default 'csv')
+    schema : dict
+        mapping from the column name to the type name, e.g. TRACK_SCHEMA
+        (default None - types are inferred)
+    compression : str
+        compression codec, e.g. 'gzip' for csv (the file name gets its suffix,
+        e.g. .csv.gz), 'snappy' or 'zstd' for parquet, 'lz4' or 'zstd' for
+        feather (default None - default of the format)
+    partition_cols : list of str
+        columns by which the rows are split into <path>/<column>=<value>/
+        directories, the file in each of them is named <name> (default None)
+
+    Returns
+    -------
+    files : list of str
+        full names of the written files
+
+    """
+
+    if fmt not in EXTENSIONS:
+        raise ValueError('unknown output format: ' + fmt)
+    if fmt != 'csv' and pa is None:
+        raise ImportError('pyarrow is required for the ' + fmt + ' format')
+
+    df = df.reset_index()
+    if schema is not None:
+        df = cast_df(df, schema)
+
+    extension = EXTENSIONS[fmt]
+    if fmt == 'csv':
+        extension += CSV_SUFFIXES.get(compression, '')
+
+    if not partition_cols:
+        full_name = path + name + extension
+        write_file(df, full_name, fmt, schema, compression)
+        return [full_name]
+
+    files = []
+    for values, part in df.groupby(partition_cols, sort = False):
+        if not isinstance(values, tuple):
+            values = (values,)
+        directory = os.path.join(path, *['{}={}'.format(col, val)
+                                         for col, val in zip(partition_cols, values)])
+        os.makedirs(directory, exist_ok = True)
+        full_name = os.path.join(directory, name + extension)
+        # partition values are kept in the directory names only
+        write_file(part.drop(columns = partition_cols), full_name, fmt,
+                   schema, compression)
+        files.append(full_name)
+
+    return files
+
+
+def write_file(
+        df,
+        full_name,
+        fmt,
+        schema = None,
+        compression = None
+        ):
+    """
+    A function used to write the dataframe without its index to a single file.
+    Parameters are the same as in write_df.
+    """
+
+    if fmt == 'csv':
+        df.to_csv(full_name, index = False, compression = compression)
+        return
+
+    if schema is not None:
+        schema = arrow_schema({col : type_ for col, type_ in schema.items() if col in df})
+    table = pa.Table.from_pandas(df, schema = schema, preserve_index = False)
+
+    if fmt == 'parquet':
+        pq.write_table(table, full_name, compression = compression or 'snappy')
+    else:
+        feather.write_feather(table, full_name, compression = compression)
+
+
+def read_df(
+        full_name,
+        index = None
+        ):
+    """
+    A function used to read the dataframe written by write_df, the format is
+    chosen by the file extension (a directory is read as a partitioned
+    parquet dataset).
+
+    Parameters
+    ----------
+    full_name : str
+        full name of the file
+    index : str
+        name of the column to set as index (default None)
+
+    Returns
+    -------
+    pandas.DataFrame
+        the dataframe
+
+    """
+
+    if full_name.endswith('.feather'):
+        df = feather.read_feather(full_name)
+    elif full_name.endswith('.csv') or '.csv.' in os.path.basename(full_name):
+        df = pd.read_csv(full_name)
+    else:
+        df = pq.read_table(full_name).to_pandas()
+
+    if index is not None:
+        df = df.set_index(index)
+
+    return df
+
+
+@traced
+def export_df(
+        df,
+        path,
+        name,
+        schema,
+        fmt = 'csv',
+        compression = None,
+        partition = False
+        ):
+    """
+    A function used by the getters to export their dataframes. With partition
+    the rows are written to <path>/country=<name>/update=<date>/<name> files.
+    Other parameters are the same as in write_df.
+    """
+
+    if partition:
+        return write_df(df.assign(country = name), path, name, fmt, schema,
+                        compression, ['country', 'update'])
+    return write_df(df, path, name, fmt, schema, compression)